@@ -0,0 +1,124 @@
+from sys import byteorder
+from queue import Queue, Full
+from subprocess import run, TimeoutExpired, DEVNULL
+from threading import Thread, Lock
+from time import monotonic
+from typing import Callable, Dict, NamedTuple, Optional
+from urllib.request import urlopen
+from detection import KeyTemplates
+from protocols import Protocols
+
+
+class ActionDispatcher:
+	'''Runs actions of detected keys on bounded workers pool.
+	Action is event field of key settings (see RfctlSettings.KeyRow):
+	- "http://..." or "https://..." - HTTP GET request;
+	- "tx:<.key file path>" - transmit key through rfctl device;
+	- "tx:<protocol> <protocol code>" - transmit protocol code (see Protocols), e.g. "tx:NEXA -g A -c 1 -l 1";
+	- "sh:<command>" - shell command;
+	- any other text - event name without action.
+	rfctl device is opened once (driver is exclusive), so "tx:" actions write to device by device_write
+	of detector (device file of detection read loop).
+	Actions queue is bounded: when it is full, action is dropped, so detection read loop never waits.
+
+	Example:
+	dispatcher = ActionDispatcher(workers=2)
+	dispatcher.submit('0cc175b9c0f1b6a831c399e269772661', 'sh:./onoff.sh 1')
+	print(dispatcher.get_metrics())
+	dispatcher.stop()
+	'''
+
+	class Action(NamedTuple):
+		key: str
+		action: str
+		submit_time: float
+
+	# LIRC (Linux Infrared Remote Control) constants
+	LIRC_VALUE_MASK = 0x00FFFFFF
+	LIRC_MODE2_SPACE = 0x00000000
+	LIRC_MODE2_PULSE = 0x01000000
+
+	def __init__(
+			self, workers: int = 2, queue_size: int = 16, timeout: float = 10.,
+			device_write: Optional[Callable[[bytes], object]] = None, verbose_file=None):
+		self.timeout = timeout  # action timeout, s
+		self.device_write = device_write  # used by "tx:" actions; None: there is no rfctl device
+		self.verbose_file = verbose_file
+		self._queue: Queue = Queue(queue_size)
+		self._lock = Lock()
+		self._metrics = dict.fromkeys(
+			('submitted', 'dropped', 'completed', 'failed', 'timed_out', 'max_queue_depth', 'max_wait_ms'), 0)
+		self._workers = [Thread(target=self._worker, name=f'action_{i}', daemon=True) for i in range(workers)]
+		for x in self._workers:
+			x.start()
+
+	def submit(self, key: str, action: str) -> bool:
+		'queues action without waiting; returns False if action dropped due to full queue'
+		try:
+			self._queue.put_nowait(self.Action(key, action, monotonic()))
+		except Full:
+			self._count('dropped')
+			return False
+		with self._lock:
+			self._metrics['submitted'] += 1
+			self._metrics['max_queue_depth'] = max(self._metrics['max_queue_depth'], self._queue.qsize())
+		return True
+
+	def get_metrics(self) -> Dict[str, int]:
+		with self._lock:
+			return {'queue_depth': self._queue.qsize(), **self._metrics}
+
+	def stop(self, wait: bool = True):
+		'stops workers after queued actions'
+		for _ in self._workers:
+			self._queue.put(None)
+		if wait:
+			for x in self._workers:
+				x.join()
+
+	def _count(self, name: str):
+		with self._lock:
+			self._metrics[name] += 1
+
+	def _worker(self):
+		while (action := self._queue.get()) is not None:
+			with self._lock:
+				self._metrics['max_wait_ms'] = max(self._metrics['max_wait_ms'], int((monotonic() - action.submit_time) * 1000))
+			try:
+				error = self.run_action(action.action)
+			except TimeoutExpired:
+				self._count('timed_out')
+				error = 'timeout'
+			except Exception as e:
+				self._count('failed')
+				error = str(e)
+			else:
+				self._count('failed' if error else 'completed')
+			if error and self.verbose_file:
+				print(f'Action of key {action.key} "{action.action}" error: {error}', file=self.verbose_file)
+
+	def run_action(self, action: str) -> Optional[str]:
+		'runs action; returns error message or None'
+		if action.startswith(('http://', 'https://')):
+			with urlopen(action, timeout=self.timeout) as f:
+				f.read()
+			return None
+		if action.startswith('tx:'):
+			protocol, _, code = action[3:].strip().partition(' ')
+			if protocol in Protocols.PROTOCOLS:
+				bits = Protocols.encode(protocol, code)
+			else:
+				bits = KeyTemplates.load_key_file(action[3:].strip())
+			if not self.device_write:
+				return 'no rfctl device to transmit'
+			self.device_write(b''.join(
+				((self.LIRC_MODE2_PULSE if level else self.LIRC_MODE2_SPACE) | (value & self.LIRC_VALUE_MASK))
+				.to_bytes(4, byteorder)
+				for level, value in bits
+			))
+			return None
+		if action.startswith('sh:'):
+			# shell command of explicit prefix only: event text is not trusted
+			ret = run(action[3:], shell=True, timeout=self.timeout, stdin=DEVNULL, stdout=DEVNULL, stderr=DEVNULL)
+			return f'exit code {ret.returncode}' if ret.returncode else None
+		return None
@@ -0,0 +1,386 @@
+from array import array
+from math import ceil, floor
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+try:
+	import numpy
+except ImportError:
+	numpy = None  # KeyScorer is not available
+
+
+class KeyTemplates:
+	'''Detection keys as struct-of-arrays.
+	All keys share contiguous buffers of integer time bounds (µs): key element i of key k
+	is at offsets[k] + i of lows & highs buffers. Levels of key elements are packed
+	to bitmask per key: bit i is level of key element i.
+
+	Example:
+	templates = KeyTemplates(.15)
+	templates.add('A.key', ((1, 710), (0, 678), (1, 346)))
+	key_index = templates.match(window_levels, window_times)
+	'''
+
+	def __init__(self, tolerance: float = .15):
+		self.tolerance = tolerance
+		self.names: List[str] = []
+		self.offsets, self.lengths = array('I'), array('I')  # key elements position at lows & highs buffers
+		self.lows, self.highs = array('I'), array('I')  # key elements time bounds, µs
+		self.levels: List[int] = []  # key elements levels bitmask
+		self.masks: List[int] = []  # key elements bitmask: (1 << key length) - 1
+		self.max_len = 0
+
+	def __len__(self) -> int:
+		return len(self.names)
+
+	def add(self, name: str, bits: Iterable[Tuple[int, int]]):
+		'adds key as sequence of bits; bit is tuple of level (low/high) & time length (µs)'
+		k_low, k_high = 1 - self.tolerance, 1 + self.tolerance
+		offset, levels = len(self.lows), 0
+		for i, (level, value) in enumerate(bits):
+			if level:
+				levels |= 1 << i
+			self.lows.append(ceil(value * k_low))
+			self.highs.append(floor(value * k_high))
+		length = len(self.lows) - offset
+		if not length:
+			return
+		self.names.append(name)
+		self.offsets.append(offset)
+		self.lengths.append(length)
+		self.levels.append(levels)
+		self.masks.append((1 << length) - 1)
+		if length > self.max_len:
+			self.max_len = length
+
+	def get_bits(self, key_index: int) -> Tuple[Tuple[int, int], ...]:
+		'returns key as tuple of bits with middle of time bounds'
+		offset, levels = self.offsets[key_index], self.levels[key_index]
+		return tuple(
+			((levels >> i) & 1, (self.lows[offset + i] + self.highs[offset + i]) // 2)
+			for i in range(self.lengths[key_index])
+		)
+
+	def match(self, levels: int, times: array, start: int = 0, timeout: bool = False) -> Optional[int]:
+		'''returns index of first key matched with window or None.
+		Window is levels bitmask (bit i is level of window item i) & items times (µs);
+		key is compared with window head. If timeout, last window item is LIRC timeout (space of idle
+		receiver): it is trailing space (sync) of key of window length, so its time is not compared'''
+		window_len = len(times)
+		lows, highs, offsets, lengths, masks = self.lows, self.highs, self.offsets, self.lengths, self.masks
+		for k in range(start, len(self.names)):
+			length = lengths[k]
+			if (length != window_len if timeout else length > window_len) or levels & masks[k] != self.levels[k]:
+				continue
+			offset = offsets[k]
+			if timeout:
+				length -= 1  # time of key trailing space is not compared with timeout
+			elif not lows[offset] <= times[0] <= highs[offset]:
+				continue
+			for low, t, high in zip(lows[offset:offset + length], times, highs[offset:offset + length]):
+				if t < low or t > high:
+					break
+			else:
+				return k
+		return None
+
+	@classmethod
+	def load_key_file(cls, file_path: str) -> Tuple[Tuple[int, int], ...]:
+		'returns bits of .key file; bit is tuple of level (low/high) & time length (µs)'
+
+		def get_level_index(line: list) -> int:
+			for i, field in enumerate(line):
+				if field in ('0', '1'):
+					if len(line) > i + 1:
+						return i
+			raise Exception('Key file line parse error: ' + ' '.join(line))
+
+		bits = []
+		level_field_index = None
+		with open(file_path, 'r') as fd:
+			while (line := fd.readline(100)):
+				# process .key file line
+				line = line.strip()
+				if not line or line.startswith('#'):
+					# it comment line # skip
+					continue
+				line = line.split(' ')
+				if level_field_index is None:
+					level_field_index = get_level_index(line)
+				if line[level_field_index] not in ('0', '1'):
+					raise Exception(f'Expected 0 or 1 but given "{line[level_field_index]}" in line: ' + ' '.join(line))
+				bits.append((0 if line[level_field_index] == '0' else 1, int(line[level_field_index + 1])))
+		return tuple(bits)
+
+
+class KeyScorer:
+	'''Best match scoring of window against all keys at once (requires numpy).
+	Keys are stacked to padded matrix of time bounds middles & half widths, so key
+	element deviation normalized to 1 at the tolerance bound. Score of key is
+	1 - max of normalized deviations; best key has maximum score.
+
+	Example:
+	scorer = KeyScorer(templates)
+	if (ret := scorer.score(window_levels, window_times)):
+		key_index, score = ret
+	'''
+
+	HEAD_LEN = 8  # window head items count used to filter keys before full deviations calculation
+
+	def __init__(self, templates: KeyTemplates):
+		if numpy is None:
+			raise ImportError('KeyScorer requires numpy')
+		keys_count, max_len = len(templates), templates.max_len
+		self.max_len = max_len
+		self.lengths = numpy.frombuffer(templates.lengths, dtype=numpy.uint32).astype(numpy.int64)
+		lows = numpy.zeros((keys_count, max_len), dtype=numpy.float32)
+		highs = numpy.zeros((keys_count, max_len), dtype=numpy.float32)
+		levels = numpy.zeros((keys_count, max_len), dtype=numpy.uint8)
+		for k in range(keys_count):
+			offset, length, key_levels = templates.offsets[k], templates.lengths[k], templates.levels[k]
+			lows[k, :length] = templates.lows[offset:offset + length]
+			highs[k, :length] = templates.highs[offset:offset + length]
+			levels[k, :length] = [(key_levels >> i) & 1 for i in range(length)]
+		valid = numpy.arange(max_len) < self.lengths[:, None]
+		self.middles = (lows + highs) / 2
+		half_widths = (highs - lows) / 2
+		# padding elements have zero inverted half width - no deviation; zero half width is exact time
+		self.inv_half_widths = numpy.where(
+			valid, numpy.divide(1, half_widths, out=numpy.full_like(half_widths, 1 << 24), where=half_widths > 0), 0
+		).astype(numpy.float32)
+		self.levels = numpy.packbits(levels, axis=1, bitorder='little')
+		self.masks = numpy.packbits(valid, axis=1, bitorder='little')
+		self._window = numpy.zeros(max_len, dtype=numpy.float32)
+
+	def score(self, levels: int, times: array, timeout: bool = False) -> Optional[Tuple[int, float]]:
+		'''returns index & score (0..1] of best key matched with window or None.
+		Window is levels bitmask (bit i is level of window item i) & items times (µs);
+		keys are compared with window head. If timeout, last window item is LIRC timeout: it is
+		trailing space of keys of window length without deviation (see KeyTemplates.match())'''
+		window_len = min(len(times), self.max_len)
+		if not window_len or timeout and len(times) > self.max_len:
+			return None
+		inv_half_widths = self.inv_half_widths
+		if timeout:
+			inv_half_widths = inv_half_widths.copy()
+			inv_half_widths[:, window_len - 1] = 0
+		window = self._window
+		window[:window_len] = numpy.frombuffer(times, dtype=numpy.uint32, count=window_len)
+		window[window_len:] = 0
+		window_levels = numpy.frombuffer(
+			(levels & ((1 << window_len) - 1)).to_bytes(self.levels.shape[1], 'little'), dtype=numpy.uint8)
+		# cheap filters: key length, levels & head items deviations; full deviations calculated for candidates only
+		head = self.HEAD_LEN
+		candidates = numpy.flatnonzero(
+			((self.lengths == window_len) if timeout else (self.lengths <= window_len))
+			& ((window_levels & self.masks) == self.levels).all(axis=1)
+			& ((numpy.abs(window[:head] - self.middles[:, :head]) * inv_half_widths[:, :head]) <= 1).all(axis=1))
+		if not len(candidates):
+			return None
+		deviations = (numpy.abs(window - self.middles[candidates]) * inv_half_widths[candidates]).max(axis=1)
+		best = int(deviations.argmin())
+		if deviations[best] > 1:
+			return None
+		key_index = int(candidates[best])
+		return key_index, float(1 - deviations[best])
+
+
+class KeyBatchDetector:
+	'''Offline detection over LIRC binary dumps (requires numpy).
+	Dump is processed by chunks. Chunk items are sorted by level & time once, so items matched
+	by element of key are counted by binary search (all elements of all keys at once). Candidate
+	positions of key are items of its anchor element: element with least matched items of chunk
+	(sync or header of key is rare in stream); key without anchor matches is skipped. Anchor items
+	are taken from sorted positions (many keys: cost of key is proportional to its anchor matches)
+	or by scan of chunk (few keys: argsort of chunk costs more than scans). Candidates are filtered
+	by other key elements; LIRC timeout (idle receiver) matches trailing space of key (see
+	KeyTemplates.match()). Matches are scored as KeyScorer does; overlapped matches resolved
+	in favor of earlier & best.
+
+	Example:
+	detector = KeyBatchDetector(templates)
+	with open('rfdump.bin', 'rb') as f:
+		for time_offset, key_index, score in detector.detect(f.read):
+			print(time_offset, templates.names[key_index], score)
+	'''
+
+	CHUNK_SAMPLES = 1 << 22  # 16 MB of LIRC samples
+	INDEX_MIN_KEYS = 16  # keys count to take anchor items from sorted positions (argsort of chunk) instead of scan
+
+	# LIRC (Linux Infrared Remote Control) constants
+	LIRC_VALUE_MASK = 0x00FFFFFF
+	LIRC_MODE2_MASK = 0xFF000000
+	LIRC_MODE2_PULSE = 0x01000000
+	LIRC_MODE2_TIMEOUT = 0x03000000
+
+	def __init__(self, templates: KeyTemplates):
+		if numpy is None:
+			raise ImportError('KeyBatchDetector requires numpy')
+		self.templates = templates
+		self.keys = []  # per key: levels, lows, highs, middles, inverted half widths
+		# codes (level & time) bounds of all keys elements (as templates lows & highs buffers)
+		self.offsets = numpy.frombuffer(templates.offsets, dtype=numpy.uint32).astype(numpy.int64)
+		self.low_codes = numpy.frombuffer(templates.lows, dtype=numpy.uint32).copy()
+		self.high_codes = numpy.frombuffer(templates.highs, dtype=numpy.uint32).copy()
+		for k in range(len(templates)):
+			offset, length, key_levels = templates.offsets[k], templates.lengths[k], templates.levels[k]
+			lows = numpy.frombuffer(templates.lows, dtype=numpy.uint32, count=length, offset=offset * 4)
+			highs = numpy.frombuffer(templates.highs, dtype=numpy.uint32, count=length, offset=offset * 4)
+			half_widths = (highs.astype(numpy.float32) - lows) / 2
+			self.keys.append((
+				numpy.array([(key_levels >> i) & 1 for i in range(length)], dtype=numpy.uint8),
+				lows, highs, (lows.astype(numpy.float32) + highs) / 2,
+				numpy.divide(1, half_widths, out=numpy.full_like(half_widths, 1 << 24), where=half_widths > 0),
+			))
+			pulses = numpy.flatnonzero(self.keys[-1][0]) + offset
+			self.low_codes[pulses] |= self.LIRC_MODE2_PULSE
+			self.high_codes[pulses] |= self.LIRC_MODE2_PULSE
+
+	def _match_key(self, key_index: int, chunk: tuple, positions_count: int) -> Tuple:
+		'returns matched positions & scores of key at chunk (see detect())'
+		levels, times, timeouts, timeout_positions, codes, order, starts, ends = chunk
+		key_levels, lows, highs, middles, inv_half_widths = self.keys[key_index]
+		offset, last = self.offsets[key_index], len(lows) - 1
+		counts = ends[offset:offset + last + 1] - starts[offset:offset + last + 1]
+		if not key_levels[last]:
+			# trailing space is matched also by timeouts
+			counts[last] += len(timeout_positions)
+		anchor = int(counts.argmin())
+		if not counts[anchor]:
+			return numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.float32)
+		if order is None:
+			candidates = numpy.flatnonzero(
+				(codes >= self.low_codes[offset + anchor]) & (codes <= self.high_codes[offset + anchor]))
+		else:
+			candidates = order[starts[offset + anchor]:ends[offset + anchor]]
+		if anchor == last and not key_levels[last]:
+			candidates = numpy.concatenate((candidates, timeout_positions))
+		candidates = candidates[(candidates >= anchor) & (candidates < positions_count + anchor)] - anchor
+		candidates.sort()
+		for i in range(len(lows)):
+			if not len(candidates):
+				break
+			if i == anchor:
+				continue
+			t = times[candidates + i]
+			is_matched = (t >= lows[i]) & (t <= highs[i])
+			if i == last and not key_levels[i]:
+				is_matched |= timeouts[candidates + i]
+			candidates = candidates[(levels[candidates + i] == key_levels[i]) & is_matched]
+		if not len(candidates):
+			return candidates, numpy.zeros(0, dtype=numpy.float32)
+		window = times[candidates[:, None] + numpy.arange(len(lows))]
+		deviations = numpy.abs(window - middles) * inv_half_widths
+		if not key_levels[last]:
+			# timeout is trailing space without deviation
+			deviations[timeouts[candidates + last], last] = 0
+		return candidates, 1 - deviations.max(axis=1)
+
+	def detect(self, fd_read) -> Iterable[Tuple[int, int, float]]:
+		'yields detections from dump binary stream: time offset (µs), key index & score'
+		max_len = self.templates.max_len
+		levels, times = numpy.zeros(0, dtype=numpy.uint8), numpy.zeros(0, dtype=numpy.uint32)
+		timeouts = numpy.zeros(0, dtype=bool)
+		time_line, next_position = 0, 0  # time of chunk start (µs) & first position not overlapped by match
+		while True:
+			buff = fd_read(self.CHUNK_SAMPLES * 4)
+			is_last = len(buff) < self.CHUNK_SAMPLES * 4
+			samples = numpy.frombuffer(buff, dtype=numpy.uint32, count=len(buff) // 4)
+			modes = samples & self.LIRC_MODE2_MASK
+			values = samples & self.LIRC_VALUE_MASK
+			# timeout is space item without time: time line is not changed
+			is_timeout = modes == self.LIRC_MODE2_TIMEOUT
+			values[is_timeout] = 0
+			levels = numpy.concatenate((levels, (modes == self.LIRC_MODE2_PULSE).view(numpy.uint8)))
+			times = numpy.concatenate((times, values))
+			timeouts = numpy.concatenate((timeouts, is_timeout))
+			# positions of last chunk items will be processed with next chunk
+			positions_count = len(times) if is_last else max(len(times) - max_len + 1, 0)
+			# items of all keys elements are counted by binary search of sorted codes (level & time);
+			# items of anchor are found by sorted positions (many keys) or by scan of chunk (few keys)
+			codes = (levels.astype(numpy.uint32) << 24) | times
+			if len(self.keys) >= self.INDEX_MIN_KEYS:
+				order = numpy.argsort(codes)
+				sorted_codes = codes[order]
+			else:
+				order, sorted_codes = None, numpy.sort(codes)
+			starts = numpy.searchsorted(sorted_codes, self.low_codes)
+			ends = numpy.searchsorted(sorted_codes, self.high_codes, 'right')
+			chunk = levels, times, timeouts, numpy.flatnonzero(timeouts), codes, order, starts, ends
+			hits = []
+			for k in range(len(self.keys)):
+				count = min(positions_count, len(times) - len(self.keys[k][1]) + 1)
+				if count > 0:
+					positions, scores = self._match_key(k, chunk, count)
+					hits.extend(zip(positions.tolist(), scores.tolist(), [k] * len(positions)))
+			if hits:
+				# sort by position & best score first; skip overlapped matches
+				hits.sort(key=lambda x: (x[0], -x[1]))
+				detections = []
+				for hit in hits:
+					if hit[0] >= next_position:
+						next_position = hit[0] + len(self.keys[hit[2]][1])
+						detections.append(hit)
+				time_lines = numpy.concatenate(((0,), numpy.cumsum(times[:positions_count], dtype=numpy.int64)))
+				time_lines = (time_lines[[x[0] for x in detections]] + time_line).tolist()
+				for (_, score, k), time_offset in zip(detections, time_lines):
+					yield time_offset, k, score
+			if is_last:
+				break
+			time_line += int(times[:positions_count].sum(dtype=numpy.int64))
+			levels, times, timeouts = levels[positions_count:], times[positions_count:], timeouts[positions_count:]
+			next_position = max(next_position - positions_count, 0)
+
+
+class KeyCoalescer:
+	'''Coalesces repeated frames of key to one press (remotes send every press 4-5 times).
+	Frame of key detected within hold-off window after previous frame of the key is repeat.
+	Events of press: "press" - first frame; "hold" - press lasts hold time;
+	"release" - no more repeats within hold-off window; release event has repeats count
+	& best score of frames. Time is stream time line, µs.
+
+	Example:
+	coalescer = KeyCoalescer(holdoff=200_000)
+	for event in coalescer.add('A.key', time_line):
+		if event.kind == coalescer.PRESS:
+			...
+	for event in coalescer.flush(time_line):
+		...
+	'''
+
+	PRESS, HOLD, RELEASE = 'press', 'hold', 'release'
+
+	class Event(NamedTuple):
+		kind: str
+		key: str
+		time: int  # µs
+		repeats: int
+		score: float
+
+	def __init__(self, holdoff: int = 200_000, hold_time: int = 1_000_000):
+		self.holdoff = holdoff  # µs
+		self.hold_time = hold_time  # µs
+		self.pressed: Dict[str, list] = {}  # key: press time, last frame time, repeats, best score, is hold
+
+	def add(self, key: str, time: int, score: float = 1.) -> List[Event]:
+		'returns events after frame of key detected at time'
+		ret = self.flush(time) if self.pressed else []
+		if (state := self.pressed.get(key)) is None:
+			self.pressed[key] = [time, time, 1, score, False]
+			ret.append(self.Event(self.PRESS, key, time, 1, score))
+		else:
+			state[1] = time
+			state[2] += 1
+			if score > state[3]:
+				state[3] = score
+			if not state[4] and time - state[0] >= self.hold_time:
+				state[4] = True
+				ret.append(self.Event(self.HOLD, key, time, state[2], state[3]))
+		return ret
+
+	def flush(self, time: Optional[int] = None) -> List[Event]:
+		'returns release events of keys without repeats within hold-off window till time; None - release all'
+		ret = []
+		for key, state in tuple(self.pressed.items()):
+			if time is None or time - state[1] > self.holdoff:
+				del self.pressed[key]
+				ret.append(self.Event(self.RELEASE, key, state[1], state[2], state[3]))
+		return ret
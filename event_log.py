@@ -0,0 +1,146 @@
+from glob import glob, escape as glob_escape
+from os import remove as os_remove, stat as os_stat
+from os.path import getsize
+from struct import Struct
+from time import time
+from typing import List, NamedTuple, Optional
+
+
+class EventLog:
+	'''Append-only detection events log.
+	Events are fixed size binary records: timestamp, key id, score & receiver.
+	Log is set of segment files "<log path>.<segment number>"; retention removes oldest
+	segments by total log size & segment age. Records are appended in time order (timestamp is
+	not less than timestamp of previous record, if wall clock is stepped back), so reader finds
+	first record since given time by binary search: O(log n + page).
+
+	Example:
+	log = EventLog('rfctl_events')
+	log.append('0cc175b9c0f1b6a831c399e269772661', .93)
+	for event in log.read(since=time() - 3600, count=50):
+		print(event.timestamp, event.key)
+	'''
+
+	RECORD = Struct('<d32sfH2x')  # timestamp (s), key id, score, receiver
+
+	class Event(NamedTuple):
+		timestamp: float
+		key: str
+		score: float
+		receiver: int
+
+	def __init__(self, path: str, max_size: int = 16 << 20, max_age: float = 90 * 24 * 3600, segment_size: int = 1 << 20):
+		self.path = path
+		self.max_size = max_size  # bytes
+		self.max_age = max_age  # seconds
+		self.segment_records = max(segment_size // self.RECORD.size, 1)
+		self._fd = None
+		self._fd_records = 0
+		self._last_timestamp = 0.  # timestamps of records are non-decreasing
+
+	def get_segments(self) -> List[str]:
+		'returns segment files paths from oldest to newest'
+		return sorted(
+			(x for x in glob(glob_escape(self.path) + '.[0-9]*') if x.rsplit('.', 1)[1].isdigit()),
+			key=lambda x: int(x.rsplit('.', 1)[1])
+		)
+
+	def _open_segment(self):
+		segments = self.get_segments()
+		records = getsize(segments[-1]) // self.RECORD.size if segments else 0
+		if records:
+			with open(segments[-1], 'rb') as fd:
+				self._last_timestamp = max(self._read_record(fd, records - 1).timestamp, self._last_timestamp)
+		if segments and records < self.segment_records:
+			segment_path, self._fd_records = segments[-1], records
+		else:
+			segment_path, self._fd_records = f'{self.path}.{int(segments[-1].rsplit(".", 1)[1]) + 1 if segments else 0}', 0
+		self._fd = open(segment_path, 'ab')
+		self.apply_retention()
+
+	def apply_retention(self):
+		'removes oldest segments exceeding log size & age limits; current segment is kept'
+		segments = self.get_segments()[:-1]
+		total_size = sum(getsize(x) for x in segments)
+		min_mtime = time() - self.max_age
+		for segment_path in segments:
+			if total_size <= self.max_size and os_stat(segment_path).st_mtime >= min_mtime:
+				break
+			total_size -= getsize(segment_path)
+			os_remove(segment_path)
+
+	def append(self, key: str, score: float = 1., receiver: int = 0, timestamp: Optional[float] = None):
+		if self._fd is None or self._fd_records >= self.segment_records:
+			self.close()
+			self._open_segment()
+		self._last_timestamp = max(time() if timestamp is None else timestamp, self._last_timestamp)
+		self._fd.write(self.RECORD.pack(self._last_timestamp, key.encode()[:32], score, receiver))
+		self._fd.flush()
+		self._fd_records += 1
+
+	def close(self):
+		if self._fd:
+			self._fd.close()
+			self._fd = None
+
+	@classmethod
+	def _get_event(cls, record: tuple) -> Event:
+		timestamp, key, score, receiver = record
+		return cls.Event(timestamp, key.rstrip(b'\0').decode(errors='replace'), score, receiver)
+
+	def _read_record(self, fd, index: int) -> Event:
+		fd.seek(index * self.RECORD.size)
+		return self._get_event(self.RECORD.unpack(fd.read(self.RECORD.size)))
+
+	def _bisect(self, fd, records: int, since: float) -> int:
+		'returns index of first record with timestamp >= since'
+		low, high = 0, records
+		while low < high:
+			middle = (low + high) // 2
+			if self._read_record(fd, middle).timestamp < since:
+				low = middle + 1
+			else:
+				high = middle
+		return low
+
+	def read(self, since: float = 0, count: int = 200) -> List[Event]:
+		'returns events from time since (oldest first)'
+		ret = []
+		if count <= 0:
+			return ret
+		segments = self.get_segments()
+		# find segment by its first record timestamp
+		low, high = 0, len(segments)
+		while low < high:
+			middle = (low + high) // 2
+			with open(segments[middle], 'rb') as fd:
+				if getsize(segments[middle]) >= self.RECORD.size and self._read_record(fd, 0).timestamp <= since:
+					low = middle + 1
+				else:
+					high = middle
+		for segment_path in segments[max(low - 1, 0):]:
+			with open(segment_path, 'rb') as fd:
+				records = getsize(segment_path) // self.RECORD.size
+				index = self._bisect(fd, records, since)
+				fd.seek(index * self.RECORD.size)
+				buff = fd.read(min(records - index, count - len(ret)) * self.RECORD.size)
+				ret.extend(self._get_event(x) for x in self.RECORD.iter_unpack(buff))
+			if len(ret) >= count:
+				break
+		return ret
+
+	def read_last(self, count: int = 200) -> List[Event]:
+		'returns last events (oldest first)'
+		ret = []
+		if count <= 0:
+			return ret
+		for segment_path in reversed(self.get_segments()):
+			with open(segment_path, 'rb') as fd:
+				records = getsize(segment_path) // self.RECORD.size
+				index = max(records - (count - len(ret)), 0)
+				fd.seek(index * self.RECORD.size)
+				buff = fd.read((records - index) * self.RECORD.size)
+				ret[:0] = (self._get_event(x) for x in self.RECORD.iter_unpack(buff))
+			if len(ret) >= count:
+				break
+		return ret
@@ -0,0 +1,163 @@
+from bisect import bisect_left
+from glob import glob
+from os import makedirs, replace as os_replace
+from os.path import basename, dirname, join as path_join
+from threading import Lock
+from time import monotonic, time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class Counter:
+	'monotonic counter; hot loops count locally & add counts by inc() periodically'
+
+	TYPE = 'counter'
+
+	def __init__(self, name: str, help: str):
+		self.name, self.help = name, help
+		self.value = 0
+		self._lock = Lock()
+
+	def inc(self, value: float = 1):
+		with self._lock:
+			self.value += value
+
+	def get_samples(self) -> List[Tuple[str, float]]:
+		return [(self.name, self.value)]
+
+
+class Gauge(Counter):
+	'current value'
+
+	TYPE = 'gauge'
+
+	def set(self, value: float):
+		self.value = value
+
+
+class Histogram:
+	'values distribution by cumulative buckets (upper bounds) with sum & count of values'
+
+	TYPE = 'histogram'
+	DEFAULT_BUCKETS = (.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10.)
+
+	def __init__(self, name: str, help: str, buckets: Iterable[float] = DEFAULT_BUCKETS):
+		self.name, self.help = name, help
+		self.buckets = tuple(sorted(buckets))
+		self.counts = [0] * (len(self.buckets) + 1)  # last is +Inf bucket
+		self.sum = 0.
+		self._lock = Lock()
+
+	def observe(self, value: float):
+		i = bisect_left(self.buckets, value)
+		with self._lock:
+			self.counts[i] += 1
+			self.sum += value
+
+	def get_samples(self) -> List[Tuple[str, float]]:
+		ret, count = [], 0
+		for le, x in zip(self.buckets + ('+Inf',), self.counts):
+			count += x
+			ret.append((f'{self.name}_bucket{{le="{le}"}}', count))
+		ret.append((self.name + '_sum', self.sum))
+		ret.append((self.name + '_count', count))
+		return ret
+
+
+class MetricsRegistry:
+	'''Metrics registry: counters, gauges & histograms in Prometheus text format.
+	Processes (rfdump, rfdetect, rfanalysis) write metrics to text files (see write_textfile());
+	web server merges text files to /metrics (see read_textfiles()). Labels are added to all samples,
+	so metrics of process instances (for example, detectors of receivers) are distinguished.
+
+	Example:
+	metrics = MetricsRegistry({'device': '/dev/rfctl', 'receiver': '0'})
+	samples = metrics.counter('rfctl_detect_samples_total', 'Samples read')
+	match_time = metrics.histogram('rfctl_detect_match_seconds', 'Matching time per sample')
+	samples.inc(4096)
+	match_time.observe(.00002)
+	metrics.write_textfile(MetricsRegistry.get_default_textfile_path('rfdetect'))
+	'''
+
+	TEXTFILES_PATH = '/tmp/rfctl_metrics'  # default path of processes metrics text files
+	TEXTFILE_EXT = '.prom'
+
+	TEXTFILE_PERIOD = 5.  # text file update period, seconds; see update_textfile()
+
+	def __init__(self, labels: Optional[Dict[str, str]] = None):
+		self.metrics: Dict[str, object] = {}
+		self.labels = ','.join(
+			'{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+			for k, v in (labels or {}).items())
+		self._textfile_time = 0.
+
+	@classmethod
+	def get_default_textfile_path(cls, process_name: str) -> str:
+		return path_join(cls.TEXTFILES_PATH, process_name + cls.TEXTFILE_EXT)
+
+	def _add(self, metric):
+		if metric.name in self.metrics:
+			raise ValueError(f'Metric "{metric.name}" is already registered')
+		self.metrics[metric.name] = metric
+		return metric
+
+	def counter(self, name: str, help: str) -> Counter:
+		return self._add(Counter(name, help))
+
+	def gauge(self, name: str, help: str) -> Gauge:
+		return self._add(Gauge(name, help))
+
+	def histogram(self, name: str, help: str, buckets: Iterable[float] = Histogram.DEFAULT_BUCKETS) -> Histogram:
+		return self._add(Histogram(name, help, buckets))
+
+	def _add_labels(self, name: str) -> str:
+		if not self.labels:
+			return name
+		return name[:-1] + ',' + self.labels + '}' if name.endswith('}') else name + '{' + self.labels + '}'
+
+	def render(self) -> str:
+		'returns metrics in Prometheus text format'
+		lines = []
+		for x in self.metrics.values():
+			lines.append(f'# HELP {x.name} {x.help}')
+			lines.append(f'# TYPE {x.name} {x.TYPE}')
+			lines.extend(
+				f'{self._add_labels(name)} {value:.6g}' if isinstance(value, float) else f'{self._add_labels(name)} {value}'
+				for name, value in x.get_samples())
+		return '\n'.join(lines) + '\n' if lines else ''
+
+	def write_textfile(self, path: str):
+		'writes metrics with update time to text file; file is replaced after write, so reader never gets partial file'
+		if (path_dir := dirname(path)):
+			makedirs(path_dir, exist_ok=True)
+		with open(path + '.tmp', 'w') as f:
+			f.write(self.render())
+			f.write(f'# UPDATED {time():.0f}\n')
+		os_replace(path + '.tmp', path)
+
+	def update_textfile(self, path: str):
+		'writes metrics to text file if text file update period is over'
+		if (now := monotonic()) - self._textfile_time >= self.TEXTFILE_PERIOD:
+			self._textfile_time = now
+			self.write_textfile(path)
+
+	@classmethod
+	def read_textfiles(cls, path: str = TEXTFILES_PATH) -> str:
+		'returns metrics of processes text files at path; samples of metric are grouped, HELP & TYPE lines are not repeated'
+		families: Dict[str, List[str]] = {'': []}  # metric name: HELP & TYPE lines & samples of all text files
+		for fpath in sorted(glob(path_join(path, '*' + cls.TEXTFILE_EXT))):
+			try:
+				with open(fpath, 'r') as f:
+					lines = f.read().splitlines()
+			except OSError:
+				continue  # file of stopped process is removed
+			family = families['']
+			for line in lines:
+				if line.startswith('# HELP ') or line.startswith('# TYPE '):
+					family = families.setdefault(line.split(' ', 3)[2], [])
+					if line not in family:
+						family.append(line)
+				elif line.startswith('#'):
+					families[''].append(f'{line} ({basename(fpath)})')  # other comments (update time) are before metrics
+				else:
+					family.append(line)
+		return ''.join(x + '\n' for family in families.values() for x in family)
@@ -0,0 +1,163 @@
+from array import array
+from typing import Callable, Dict
+
+
+class NoiseGate:
+	'''Pre-filter of LIRC binary stream (4-byte samples) before analysis & detection.
+	Glitches (pulses & spaces shorter than min_glitch, µs) are merged into adjacent level,
+	so bit time split by glitch is restored. Idle noise between bursts is suppressed: gate is
+	closed (idle) until BURST_EDGES edges come without glitches; closed gate time is emitted
+	as space, so time line of stream is kept (space before burst is idle time). Open gate is
+	closed by MAX_GLITCHES glitches within BURST_EDGES edges.
+	Sample of open gate is emitted at next edge of other level (one edge latency of live stream).
+
+	Example:
+	gate = NoiseGate(open('rfdump.bin', 'rb').read1, 100)
+	while len(buff := gate.read(4)) == 4:
+		...
+	print(gate.get_metrics())  # samples_in is much more than samples_out for noisy receiver
+	'''
+
+	# LIRC (Linux Infrared Remote Control) constants
+	LIRC_VALUE_MASK = 0x00FFFFFF
+	LIRC_MODE2_MASK = 0xFF000000
+	LIRC_MODE2_SPACE = 0x00000000
+	LIRC_MODE2_PULSE = 0x01000000
+	LIRC_MODE2_TIMEOUT = 0x03000000
+
+	DEFAULT_MIN_GLITCH = 100  # µs
+	BURST_EDGES = 16  # edges without glitches open gate; less than bits count of frame
+	MAX_GLITCHES = 3  # glitches within BURST_EDGES edges close gate
+	IDLE_PERIOD = 100_000  # µs; idle space is emitted periodically, so burst gap of live analysis is detected
+	CHUNK_SIZE = 1 << 16  # bytes
+
+	def __init__(self, fd_read: Callable[[int], bytes], min_glitch: int = DEFAULT_MIN_GLITCH):
+		'fd_read is read function of stream; read1 of buffered stream does not wait for full chunk (live stream)'
+		self.fd_read = fd_read
+		self.min_glitch = min_glitch
+		self.samples_in, self.samples_out = 0, 0
+		self.glitches, self.bursts = 0, 0  # merged glitches & gate openings
+		self._out, self._position = array('I'), 0  # filtered samples & read position
+		self._tail = b''  # partial sample of read
+		self._is_open = False
+		self._level, self._value = 0, 0  # pending sample of open gate; value is 0 if there is no pending sample
+		self._edges, self._noise = 0, 0  # open gate: edges & glitches count
+		self._merged = 0  # open gate: glitches time of pending sample, µs
+		self._idle = 0  # closed gate: idle time, µs
+		self._candidates = []  # closed gate: edges without glitches (samples)
+
+	def read(self, size: int) -> bytes:
+		'returns size bytes of filtered samples; less at end of stream or if device is idle'
+		out, size = self._out, size // 4
+		while len(out) - self._position < size:
+			buff = self.fd_read(self.CHUNK_SIZE)
+			if not buff:
+				if self._is_open and self._value:
+					# stream is over or idle: pending sample is not delayed
+					out.append(self._level | min(self._value, self.LIRC_VALUE_MASK))
+					self._value = 0
+				break
+			if self._tail:
+				buff = self._tail + buff
+			if (tail := len(buff) % 4):
+				self._tail, buff = buff[-tail:], buff[:-tail]
+			else:
+				self._tail = b''
+			self._filter(buff)
+		end = min(self._position + size, len(out))
+		ret = out[self._position:end].tobytes()
+		self.samples_out += end - self._position
+		if end == len(out):
+			del out[:]
+			end = 0
+		elif end >= self.CHUNK_SIZE:
+			del out[:end]
+			end = 0
+		self._position = end
+		return ret
+
+	def _filter(self, buff: bytes):
+		samples = array('I')
+		samples.frombytes(buff)
+		self.samples_in += len(samples)
+		append = self._out.append
+		value_mask, mode_mask, pulse, timeout = \
+			self.LIRC_VALUE_MASK, self.LIRC_MODE2_MASK, self.LIRC_MODE2_PULSE, self.LIRC_MODE2_TIMEOUT
+		min_glitch, burst_edges, max_glitches, idle_period = \
+			self.min_glitch, self.BURST_EDGES, self.MAX_GLITCHES, self.IDLE_PERIOD
+		is_open, level, value, edges, noise = self._is_open, self._level, self._value, self._edges, self._noise
+		merged = self._merged
+		idle, candidates, glitches = self._idle, self._candidates, 0
+		for x in samples:
+			mode, t = x & mode_mask, x & value_mask
+			if mode == timeout:
+				# receiver is idle: gate is closed
+				if is_open:
+					if value:
+						append(level | min(value, value_mask))
+					is_open, value = False, 0
+				else:
+					idle += sum(y & value_mask for y in candidates)
+					del candidates[:]
+					if idle:
+						append(min(idle, value_mask))
+				idle = 0
+				append(x)
+			elif is_open:
+				if t < min_glitch:
+					glitches += 1
+					value += t
+					merged += t
+					noise += 1
+					if noise >= max_glitches:
+						# noise after burst: glitches of pending pulse (or pending space) are idle time
+						if level == pulse and value - merged >= min_glitch:
+							append(level | min(value - merged, value_mask))
+							is_open, idle, value = False, merged, 0
+						else:
+							is_open, idle, value = False, value, 0
+				elif mode == level or not value:
+					level = mode
+					value += t
+				else:
+					append(level | min(value, value_mask))
+					level, value, merged = mode, t, 0
+					edges += 1
+					if edges >= burst_edges:
+						edges, noise = 0, 0
+			else:
+				if t < min_glitch:
+					glitches += 1
+					idle += t + sum(y & value_mask for y in candidates)
+					del candidates[:]
+				elif candidates and candidates[-1] & mode_mask == mode:
+					candidates[-1] = mode | min((candidates[-1] & value_mask) + t, value_mask)
+				elif not candidates and mode != pulse:
+					# burst is started by pulse
+					idle += t
+				else:
+					candidates.append(x)
+					if len(candidates) >= burst_edges:
+						# burst: idle space, edges & last edge is pending sample
+						if idle:
+							append(min(idle, value_mask))
+						for y in candidates[:-1]:
+							append(y)
+						level, value, merged = candidates[-1] & mode_mask, candidates[-1] & value_mask, 0
+						is_open, idle, edges, noise = True, 0, 0, 0
+						del candidates[:]
+						self.bursts += 1
+				if idle >= idle_period:
+					append(min(idle, value_mask))
+					idle = 0
+		self._is_open, self._level, self._value, self._edges, self._noise = is_open, level, value, edges, noise
+		self._idle, self._merged = idle, merged
+		self.glitches += glitches
+
+	def get_metrics(self) -> Dict[str, int]:
+		return {
+			'samples_in': self.samples_in,
+			'samples_out': self.samples_out,
+			'glitches': self.glitches,
+			'bursts': self.bursts,
+		}
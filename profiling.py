@@ -0,0 +1,130 @@
+import cProfile
+import pstats
+import tracemalloc
+from functools import wraps
+from io import StringIO
+from threading import Lock
+from time import perf_counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class Profiler:
+	'''Profiling of rfctl tools (--profile command-line option).
+	Modes: "cpu" - cProfile of profiled calls (see call()), "memory" - tracemalloc snapshot,
+	"stages" - wall-clock timers of stage functions (see wrap()): read, decode, analyze, match, output.
+	At stop() cProfile stats are written to "<path>.pstats" & summary report to "<path>.txt".
+
+	Example:
+	profiler = Profiler('rfdetect', Profiler.parse_modes('cpu,stages'))
+	fd_read = profiler.wrap('read', fd.read)
+	profiler.call(main)
+	print(profiler.stop(), file=stderr)
+	'''
+
+	MODES = ('cpu', 'memory', 'stages')
+	DEFAULT_MODES = 'cpu,stages'
+	TOP_COUNT = 20  # functions & memory allocations count of summary report
+
+	def __init__(self, name: str, modes: Iterable[str] = ('cpu', 'stages'), path: Optional[str] = None):
+		self.name, self.modes = name, tuple(modes)
+		self.path = path or self.get_default_path(name)
+		self.stats: Optional[pstats.Stats] = None  # merged stats of profiled calls
+		self.stages: Dict[str, List[float]] = {}  # stage name: calls count & time, s
+		self.skipped_calls = 0  # calls without cProfile: other call is profiled
+		self._lock = Lock()
+		self._call_lock = Lock()  # one profiled call at a time: cProfile of Python 3.12+ is process-wide
+		if 'memory' in self.modes:
+			tracemalloc.start()
+		self.start_time = perf_counter()
+
+	@classmethod
+	def get_default_path(cls, name: str) -> str:
+		return f'{name}_profile'
+
+	@classmethod
+	def parse_modes(cls, value: str) -> Tuple[str, ...]:
+		'returns modes of comma separated modes text; raises ValueError if mode is unknown'
+		ret = tuple(x.strip() for x in value.split(',') if x.strip())
+		for x in ret:
+			if x not in cls.MODES:
+				raise ValueError(f'Unknown profile mode "{x}"; modes: {", ".join(cls.MODES)}')
+		return ret
+
+	def call(self, fun, *args, **kwargs):
+		'''calls function with cProfile (cpu mode); stats of calls (threads) are merged.
+		Concurrent call (threaded server) is not profiled while other call is profiled'''
+		if 'cpu' not in self.modes:
+			return fun(*args, **kwargs)
+		if not self._call_lock.acquire(blocking=False):
+			with self._lock:
+				self.skipped_calls += 1
+			return fun(*args, **kwargs)
+		try:
+			profile = cProfile.Profile()
+			try:
+				return profile.runcall(fun, *args, **kwargs)
+			finally:
+				with self._lock:
+					if self.stats is None:
+						self.stats = pstats.Stats(profile)
+					else:
+						self.stats.add(profile)
+		finally:
+			self._call_lock.release()
+
+	def wrap(self, stage: str, fun):
+		'returns function with stage timer (stages mode) or function as is'
+		if 'stages' not in self.modes:
+			return fun
+		stage_stats = self.stages.setdefault(stage, [0, 0.])
+		lock = self._lock
+
+		@wraps(fun)
+		def stage_wrapper(*args, **kwargs):
+			start_time = perf_counter()
+			try:
+				return fun(*args, **kwargs)
+			finally:
+				duration = perf_counter() - start_time
+				with lock:
+					stage_stats[0] += 1
+					stage_stats[1] += duration
+
+		return stage_wrapper
+
+	def stop(self) -> str:
+		'writes profile files; returns summary report'
+		wall_time = perf_counter() - self.start_time
+		report = StringIO()
+		print(f'{self.name} profile: modes={",".join(self.modes)} wall time={wall_time:.3f} s', file=report)
+		if self.stages:
+			print('\nStages (wall-clock):', file=report)
+			for stage, (calls, duration) in self.stages.items():
+				print(
+					f'  {stage:<10} calls={calls:<10} time={duration:.3f} s ({duration / wall_time:.1%})'
+					f' avg={duration / calls * 1e6 if calls else 0:.1f} µs', file=report)
+			other = wall_time - sum(x[1] for x in self.stages.values())
+			print(f'  {"other":<10} time={other:.3f} s ({other / wall_time:.1%})', file=report)
+		if self.stats:
+			self.stats.dump_stats(self.path + '.pstats')
+			print(f'\nCPU: top {self.TOP_COUNT} functions by cumulative time; stats: {self.path}.pstats', file=report)
+			if self.skipped_calls:
+				print(f'Not profiled concurrent calls: {self.skipped_calls}', file=report)
+			self.stats.stream = report
+			self.stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.TOP_COUNT)
+		if tracemalloc.is_tracing():
+			# allocations of profiler itself are excluded
+			snapshot = tracemalloc.take_snapshot().filter_traces(
+				[tracemalloc.Filter(False, x.__file__) for x in (cProfile, pstats, tracemalloc)]
+				+ [tracemalloc.Filter(False, __file__)])
+			current, peak = tracemalloc.get_traced_memory()
+			tracemalloc.stop()
+			print(
+				f'\nMemory: current={current / 1024:.1f} KiB peak={peak / 1024:.1f} KiB; top {self.TOP_COUNT} lines:',
+				file=report)
+			for x in snapshot.statistics('lineno')[:self.TOP_COUNT]:
+				print(f'  {x}', file=report)
+		ret = report.getvalue()
+		with open(self.path + '.txt', 'w') as f:
+			f.write(ret)
+		return ret
@@ -0,0 +1,204 @@
+from getopt import getopt, GetoptError
+from math import sqrt
+from typing import Dict, NamedTuple, Optional, Sequence, Tuple
+
+# timings of rfctl encoders, µs (see src/protocol.h)
+NEXA_SHORT_PERIOD = 340
+NEXA_LONG_PERIOD = 1020
+NEXA_SYNC_PERIOD = 32 * NEXA_SHORT_PERIOD  # between frames
+NEXA_REPEAT = 4
+SARTANO_SHORT_PERIOD = 320
+SARTANO_LONG_PERIOD = 960
+SARTANO_SYNC_PERIOD = 32 * SARTANO_SHORT_PERIOD  # between frames
+SARTANO_REPEAT = 5
+
+
+class Protocols:
+	'''Transmitter protocols of rfctl encoders (src/nexa.c, src/sartano.c, src/impulse.c).
+	Frame of protocols is 12 bits (4 bit times per bit: short & long periods) with stop bit & sync.
+	Protocol code is rfctl arguments of protocol, e.g. "-g A -c 1 -l 1" of NEXA: "rfctl -p NEXA -g A -c 1 -l 1".
+	Captured sequence is identified by timing scale & decoding of bits by all protocols of timing,
+	so key can be stored as protocol code and transmitted by encoder (see encode()).
+	IKEA encoder is disabled in rfctl (src/ikea.c), so it is not supported.
+
+	Example:
+	x = Protocols.identify(bit_times)
+	if x:
+		print(x.protocol, x.code, x.confidence)  # NEXA -g A -c 1 -l 1 0.96
+		bits = Protocols.encode(x.protocol, x.code)
+	'''
+
+	class Identification(NamedTuple):
+		protocol: str  # rfctl protocol (-p argument)
+		code: str  # rfctl arguments of protocol code
+		confidence: float  # 0..1
+
+	class Timing(NamedTuple):
+		short: int  # µs
+		long: int
+		sync: int
+		repeat: int  # frames count of transmission
+
+	NEXA = Timing(NEXA_SHORT_PERIOD, NEXA_LONG_PERIOD, NEXA_SYNC_PERIOD, NEXA_REPEAT)
+	SARTANO = Timing(SARTANO_SHORT_PERIOD, SARTANO_LONG_PERIOD, SARTANO_SYNC_PERIOD, SARTANO_REPEAT)
+	FRAME_BITS = 12
+	TOLERANCE = .15  # timing scale tolerance of identification
+	MIN_CONFIDENCE = .5
+
+	# encoders: protocol code (group, channel, level) -> frame bits pattern ("S" & "L" periods) without stop bit & sync
+
+	@classmethod
+	def _encode_nexa(cls, group: str, channel: str, level: str, waveman: bool = False) -> str:
+		house, channel, enable = ord(group) - 65 if len(group) == 1 else -1, int(channel) - 1, int(level)
+		if not (0 <= house <= 15 and 0 <= channel <= 15 and 0 <= enable <= 1):
+			raise ValueError('Invalid group (house), channel or on/off code')
+		code = house | channel << 4
+		if not waveman or enable:
+			code |= 0x6 << 8 | enable << 11
+		# b0 is sent first; "X" (floating bit) is 1
+		return ''.join('SLLS' if code >> i & 1 else 'SLSL' for i in range(cls.FRAME_BITS))
+
+	@classmethod
+	def _encode_waveman(cls, group: str, channel: str, level: str) -> str:
+		return cls._encode_nexa(group, channel, level, True)
+
+	@classmethod
+	def _encode_sartano(cls, group: Optional[str], channel: str, level: str) -> str:
+		enable = int(level)
+		if len(channel) != 10 or channel.strip('01') or not 0 <= enable <= 1:
+			raise ValueError('Invalid channel or on/off code')
+		return ''.join('SLSL' if x == '1' else 'SLLS' for x in channel + ('10' if enable else '01'))
+
+	@classmethod
+	def _encode_conrad(cls, group: str, channel: str, level: str) -> str:
+		group, channel = int(group), int(channel)
+		if not (1 <= group <= 4 and 1 <= channel <= 4):
+			raise ValueError(f'Invalid group ({group}) or channel ({channel}); use group 1..4, channel 1..4')
+		code = ''.join('1' if x == group else '0' for x in range(1, 5)) \
+			+ ''.join('1' if x == channel else '0' for x in range(1, 5)) + '00'
+		return cls._encode_sartano(None, code, level)
+
+	@classmethod
+	def _encode_impuls(cls, group: Optional[str], channel: str, level: str) -> str:
+		enable = int(level)
+		if len(channel) != 10 or channel.strip('01') or not 0 <= enable <= 1:
+			raise ValueError('Invalid channel or on/off code')
+		address = ''.join('LSLS' if x == '1' else 'SLLS' for x in channel[:5])
+		unit = ''.join('SLSL' if x == '1' else 'SLLS' for x in channel[5:])
+		return address + unit + ('SLLSSLSL' if enable else 'SLSLSLLS')
+
+	# decoders: frame bits pattern -> protocol code or None
+
+	@classmethod
+	def _get_bits(cls, pattern: str, symbols: Dict[str, str]) -> Optional[str]:
+		ret = [symbols.get(pattern[i:i + 4]) for i in range(0, len(pattern), 4)]
+		return None if None in ret else ''.join(ret)
+
+	@classmethod
+	def _decode_nexa(cls, pattern: str, waveman: bool = False) -> Optional[str]:
+		if (bits := cls._get_bits(pattern, {'SLSL': '0', 'SLLS': '1'})) is None:
+			return None
+		code = int(bits[::-1], 2)
+		if (code >> 8 == 0) != waveman or code >> 8 not in (0x6, 0xe, 0):
+			return None
+		return f'-g {chr(65 + (code & 0xf))} -c {(code >> 4 & 0xf) + 1} -l {code >> 11}'
+
+	@classmethod
+	def _decode_waveman(cls, pattern: str) -> Optional[str]:
+		# WAVEMAN "on" is same as NEXA "on"
+		return cls._decode_nexa(pattern, True)
+
+	@classmethod
+	def _decode_sartano(cls, pattern: str) -> Optional[str]:
+		if (bits := cls._get_bits(pattern, {'SLSL': '1', 'SLLS': '0'})) is None or bits[10:] not in ('10', '01'):
+			return None
+		return f'-c {bits[:10]} -l {1 if bits[10:] == "10" else 0}'
+
+	@classmethod
+	def _decode_conrad(cls, pattern: str) -> Optional[str]:
+		# CONRAD is SARTANO with group & channel bits: "1000" (group or channel 1) .. "0001" (group or channel 4)
+		if (code := cls._decode_sartano(pattern)) is None:
+			return None
+		channel = code[3:13]
+		if channel[8:] != '00' or channel[:4].count('1') != 1 or channel[4:8].count('1') != 1:
+			return None
+		return f'-g {channel.index("1") + 1} -c {channel.index("1", 4) - 3} {code[14:]}'
+
+	@classmethod
+	def _decode_impuls(cls, pattern: str) -> Optional[str]:
+		house = cls._get_bits(pattern[:20], {'LSLS': '1', 'SLLS': '0'})
+		group = cls._get_bits(pattern[20:40], {'SLSL': '1', 'SLLS': '0'})
+		level = {'SLLSSLSL': 1, 'SLSLSLLS': 0}.get(pattern[40:])
+		if house is None or group is None or level is None:
+			return None
+		# rfctl requires group argument of IMPULS, but group is not used
+		return f'-g 0 -c {house}{group} -l {level}'
+
+	# protocol -> timing; encoder & decoder are _encode_<protocol> & _decode_<protocol>;
+	# protocols of same timing & decoded code are ambiguous (CONRAD is SARTANO)
+	PROTOCOLS: Dict[str, Timing] = {
+		'NEXA': NEXA,
+		'WAVEMAN': NEXA,
+		'CONRAD': SARTANO,
+		'SARTANO': SARTANO,
+		'IMPULS': SARTANO,
+	}
+
+	@classmethod
+	def encode(cls, protocol: str, code: str) -> Tuple[Tuple[int, int], ...]:
+		'''returns bits of transmission (repeated frames as rfctl transmits) of protocol code;
+		bit is tuple of level (low/high) & time length (µs); raises ValueError if protocol or code is invalid'''
+		if protocol not in cls.PROTOCOLS:
+			raise ValueError(f'Unknown protocol: {protocol}')
+		timing = cls.PROTOCOLS[protocol]
+		try:
+			args = dict(getopt(code.split(), 'g:c:l:')[0])
+		except GetoptError as e:
+			raise ValueError(str(e))
+		if '-c' not in args or '-l' not in args or ('-g' not in args and protocol != 'SARTANO'):
+			raise ValueError(f'Missing group, channel or level of protocol code: {code}')
+		pattern = getattr(cls, '_encode_' + protocol.lower())(args.get('-g'), args['-c'], args['-l'])
+		frame = tuple((i + 1) % 2 for i in range(len(pattern) + 2))
+		values = [timing.short if x == 'S' else timing.long for x in pattern] + [timing.short, timing.sync]
+		return tuple(zip(frame, values)) * timing.repeat
+
+	@classmethod
+	def identify(cls, bit_times: Sequence[int]) -> Optional[Identification]:
+		'''returns identification of sequence (bit times of frame, pulse is first; stop bit & sync are optional)
+		or None if protocol is not identified'''
+		bits_count = cls.FRAME_BITS * 4
+		if not bits_count <= len(bit_times) <= bits_count + 2:
+			return None
+		if len(bit_times) == bits_count + 2 and bit_times[1] > bit_times[-1]:
+			# sequence is started by stop bit & sync of previous frame
+			bit_times = tuple(bit_times[2:]) + tuple(bit_times[:2])
+		data, trailer = bit_times[:bits_count], bit_times[bits_count:]
+		ret = None
+		for timing in (cls.NEXA, cls.SARTANO):
+			threshold = sqrt(timing.short * timing.long)
+			pattern = ''.join('L' if x > threshold else 'S' for x in data)
+			expected = [timing.long if x == 'L' else timing.short for x in pattern]
+			# timing scale of bit times & deviation of bit times from scaled periods
+			scale = sum(data) / sum(expected)
+			deviation = sum(abs(x / (y * scale) - 1) for x, y in zip(data, expected)) / bits_count
+			confidence = max(0., 1 - abs(scale - 1) / cls.TOLERANCE) * max(0., 1 - deviation / (2 * cls.TOLERANCE))
+			if trailer:
+				# stop bit & sync
+				is_stop_off = abs(trailer[0] / (timing.short * scale) - 1) > 2 * cls.TOLERANCE
+				is_sync_off = len(trailer) > 1 and abs(trailer[1] / (timing.sync * scale) - 1) > 2 * cls.TOLERANCE
+				if is_stop_off or is_sync_off:
+					confidence *= .8
+			else:
+				confidence *= .9
+			codes = [
+				(protocol, code) for protocol, x in cls.PROTOCOLS.items()
+				if x is timing and (code := getattr(cls, '_decode_' + protocol.lower())(pattern))
+			]
+			if codes and codes[0][0] == 'CONRAD':
+				# CONRAD is code of SARTANO
+				codes = [x for x in codes if x[0] != 'SARTANO']
+			if codes and (ret is None or confidence / len(codes) > ret.confidence):
+				ret = cls.Identification(*codes[0], confidence / len(codes))
+		if ret is None or ret.confidence < cls.MIN_CONFIDENCE:
+			return None
+		return ret
@@ -3,9 +3,18 @@
 from sys import byteorder, stdin, stderr, stdout
 import argparse
 from time import sleep
+from itertools import count
+from os import fstat
+from stat import S_ISCHR
+from bisect import bisect_left
 from datetime import datetime
-from statistics import quantiles #, mean, stdev
-from typing import Iterable, List, Tuple, Optional
+from statistics import StatisticsError
+from typing import Dict, Iterable, List, Tuple, Optional
+from metrics import MetricsRegistry
+from noise_gate import NoiseGate
+from profiling import Profiler
+from protocols import Protocols
+from timing import TimingHistogram
 
 
 # LIRC (Linux Infrared Remote Control) constants
@@ -19,123 +28,136 @@ DEFAULT_MIN_SAMPLE_LEN = 15
 
 MIN_BITS_COUNT = 22
 
+# live mode: key is emitted at end of burst (repeated frames of key press)
+DEFAULT_BURST_GAP = 250_000  # µs without new sequences is end of burst
+MIN_BURST_SEQUENCES = 2  # sequences count of burst to emit key
+MAX_SAMPLE_LEN = 4096  # bit times of sequence search are bounded
+IDLE_SLEEP = .01  # seconds; device read without samples
+
 verbose_fd, dump_fd = None, stdout
+profiler: Optional[Profiler] = None
 
 class Analysis:
 
-	def __init__(self, min_sample_len: int):
+	def __init__(self, min_sample_len: int, max_sample_len: Optional[int] = None):
 		# filter parameters
 		self.min_sample_len = min_sample_len
-		self.max_range = 7 # maximum bit times range
-		self.sequences = [] # detected bit sequences
-		self.peak_koeff = .1 # peak filter koefficient (quantile - peak), %
+		self.max_sample_len = max_sample_len  # bit times of search are bounded (live mode)
+		self.max_range = 7  # maximum bit times range of data levels
+		self.max_sync_range = 40  # maximum bit times range of sync & header levels (Nexa sync is 32 short periods)
+		self.min_sync_koeff = 2  # minimum sync & header level koefficient of longest data level
+		self.max_levels = 4  # timing levels: 2 data levels & sync or header levels
+		self.max_cluster_bins = 6  # peak filter: maximum bins of timing level (ratio of bins is 1.07)
+		self.max_range_bins = TimingHistogram.get_bins(self.max_range)
+		self.max_sync_bins = TimingHistogram.get_bins(self.max_sync_range)
+		self.min_sync_bins = TimingHistogram.get_bins(self.min_sync_koeff)
+		# detected bit sequences statistics: memory is bounded by count of different lengths
+		self.sequences_count = 0
+		self.lengths: Dict[int, int] = {}  # histogram: bit times count -> sequences count
+		self.best: Dict[int, Tuple[float, Tuple[int]]] = {}  # bit times count -> sequence with minimum delta
 		# operational variables
 		self.is_first_detection = True
 		self.last_is_ok = False
-		self.last_level_diff = 0
-		# bit times: list of tuple(delta %, tuple(bit times))
-		self.bit_times: List[Tuple[float, Tuple[int]]] = []
+		# bit times & their histogram (updated with bit times)
+		self.bit_times: List[int] = []
+		self.histogram = TimingHistogram()
+		self.ok_version = None  # histogram version of last successful check
 
 	@classmethod
 	def _get_sequence_as_key(cls, sequence: Tuple[float, Tuple[int]], description: Optional[str] = None) -> str:
-		return '#@{}\n{}#!delta={:.1%}\n{}'.format(
+		coding = TimingHistogram.get_coding(sequence[1], cls._get_histogram(sequence[1]).get_clusters())
+		protocol = Protocols.identify(sequence[1])
+		return '#@{}\n{}#!delta={:.1%}\n{}{}{}'.format(
 			datetime.utcnow().isoformat(timespec='seconds'),
 			'#!desc=' + description + '\n' if description else '',
 			sequence[0],
+			'#!coding=' + coding + '\n' if coding else '',
+			f'#!protocol={protocol.protocol} {protocol.code}\n#!confidence={protocol.confidence:.0%}\n' if protocol else '',
 			"\n".join(('0 ' if i % 2 else '1 ') + str(int(round(x))) for i , x in enumerate(sequence[1]))
 			)
 
 	@classmethod
-	def _calc_bi_timed_sequences(cls, sequence: Iterable[int]) -> Tuple[float, float, Tuple[int], Tuple[int]]:
-		'returns short & long quantiles, short & long bit times sequences'
-		q = quantiles(sequence, n=3)
-		q_low, q_high = q[0], q[1] # short & long bit times quantiles
-		s_low, s_high = [], [] # short & long bit times sequence
+	def _get_histogram(cls, sequence: Iterable[int]) -> TimingHistogram:
+		ret = TimingHistogram()
 		for x in sequence:
-			if abs(1 - x / q_low) < abs(1 - x / q_high):
-				s_low.append(x)
-			else:
-				s_high.append(x)
-		return q_low, q_high, s_low, s_high
+			ret.add(x)
+		return ret
 
 	@classmethod
-	def _calc_max_diff(cls, sequence: Iterable[int]) -> float:
-		'returns max delta of bit times of sequence, %'
-		q_low, q_high, s_low, s_high = cls._calc_bi_timed_sequences(sequence)
-		return max((max(s_low) - min(s_low)) / q_low, (max(s_high) - min(s_high)) / q_high)
+	def _calc_max_diff(cls, sequence: Iterable[int], clusters: List[TimingHistogram.Cluster]) -> float:
+		'returns max delta of bit times of timing levels of sequence, %'
+		sequence = sorted(sequence)
+		ret = 0
+		for x in clusters:
+			# bit times of level: from first bin to last bin
+			low = bisect_left(sequence, TimingHistogram.get_bin_value(x.low))
+			high = bisect_left(sequence, TimingHistogram.get_bin_value(x.high + 1)) - 1
+			ret = max(ret, (sequence[high] - sequence[low]) / x.mean)
+		return ret
 
 	@classmethod
 	def _calc_avg_sequence(cls, sequence: Iterable[int]) -> Tuple[int]:
-		'returns max delta of bit times of sequence, %'
-		q_low, q_high, _, _ = cls._calc_bi_timed_sequences(sequence)
-		ret = []
-		for x in sequence:
-			if abs(1 - x / q_low) < abs(1 - x / q_high):
-				ret.append(q_low)
-			else:
-				ret.append(q_high)
-		return tuple(ret)
-
-	# def is_single_timed(self) -> Tuple[bool, float]:
-	# 	bit_times = self.bit_times
-	# 	# check for bits time range
-	# 	bit_times_min, bit_times_max = min(bit_times), max(bit_times)
-	# 	if bit_times_max / bit_times_min > self.max_range:
-	# 		return False, 0
-	# 	bits: Iterable[Tuple[int, int]] = tuple(x for x in zip(bit_times[::2], bit_times[1::2]))
-	# 	bits_lens = tuple(sum(x) for x in bits)
-	# 	mean, stdev = mean(bits_lens), stdev(bits_lens)
-	# 	return stdev < mean, stdev / mean
+		'returns sequence of mean bit times of timing levels'
+		clusters = cls._get_histogram(sequence).get_clusters()
+		return tuple(clusters[i].mean for i in TimingHistogram.get_levels(sequence, clusters))
 
-	def is_bi_timed(self) -> Tuple[bool, float]:
-		bit_times = self.bit_times
-		# check for bits time range
-		bit_times_min, bit_times_max = min(bit_times), max(bit_times)
-		if bit_times_max / bit_times_min > self.max_range:
-			return False, 0
-		# check for bits time distribution - it should be only two quantiles
-		q = quantiles(bit_times, n=5)
-		x_prev, levels_count, max_level_diff = q[0], 0, None
-		for x in q[1:]:
-			level_diff = x / x_prev
-			if max_level_diff is None:
-				max_level_diff = level_diff
-			if level_diff > 1.07:
-				# there is one more level
-				if levels_count > 0:
-					# and this is third level
-					return False, 0
-				x_prev = x
-				levels_count += 1
-			elif level_diff > max_level_diff:
-				max_level_diff = level_diff
-		# check for two quantiles
-		if levels_count != 1:
-			return False, 0
-		# check for bits time peaks
-		if bit_times_min < q[0] * (1 - self.peak_koeff) or bit_times_max > q[-1] * (1 + self.peak_koeff):
-			return False, 0
+	def is_multi_timed(self) -> bool:
+		'''returns True if bit times are 2 data timing levels (bit times range is max_range)
+		with optional sync & header levels: single bit times at start or end of bit times;
+		levels are compared by histogram bins (bins ratio is 1.07), so check is O(bins)'''
+		bit_times, histogram = self.bit_times, self.histogram
+		if histogram.version == self.ok_version:
+			# bit times are added to bins of data levels of last check
+			return True
+		spans = histogram.get_spans(self.max_levels)
+		if not spans or len(spans) < 2:
+			return False
+		counts, max_cluster_bins = histogram.counts, self.max_cluster_bins
+		# data levels: levels of repeated bit times
+		data_min = data_max = None
+		for low, end in spans:
+			# check for bits time peaks
+			if end - low > max_cluster_bins:
+				return False
+			if end - low > 1 or counts[low] > 1:
+				data_max = (low + end) / 2
+				if data_min is None:
+					data_min = data_max
+		if data_min is None or data_max == data_min or data_max - data_min > self.max_range_bins:
+			return False
+		sync_levels = 0
+		for low, end in spans:
+			if data_min <= (low + end) / 2 <= data_max:
+				continue
+			# sync or header level: single bit time at start or end of bit times
+			if end - low > 1 or counts[low] > 1 or low < data_max + self.min_sync_bins or low > data_min + self.max_sync_bins:
+				return False
+			if low not in (TimingHistogram.get_bin(bit_times[i]) for i in (0, 1, -1)):
+				return False
+			sync_levels += 1
 		if verbose_fd:
-			print(f'{len(self.sequences)} {bit_times_max / bit_times_min=} {q=} {bit_times=}', file=verbose_fd)
-		return True, self._calc_max_diff(bit_times)
+			print(f'{self.sequences_count} {data_min=} {data_max=} {spans=} {bit_times=}', file=verbose_fd)
+		# check is skipped while bins of levels are same & there are not sync & header levels
+		self.ok_version = None if sync_levels else histogram.version
+		return True
 
-	def add(self, level: bool, value: int) -> Optional[str]:
-		'returns key (str) if new bit times sequence added'
+	def add(self, level: bool, value: int) -> Optional[Tuple[float, Tuple[int]]]:
+		'returns sequence (delta %, bit times) if new bit times sequence added; see get_key()'
 		ret = None
-		bit_times = self.bit_times
+		bit_times, histogram = self.bit_times, self.histogram
 		if level:
 			# add high level
 			bit_times.append(value)
+			histogram.add(value)
 		elif any(bit_times):
 			# add low level # high level should be first item
 			bit_times.append(value)
+			histogram.add(value)
 			# analysis with new bit_times item
 			if len(bit_times) >= self.min_sample_len:
-				filter_ok, level_diff = self.is_bi_timed()
-				# filter_ok = self.is_single_timed()
-				if filter_ok:
+				if self.is_multi_timed():
 					# current sequence is ok
-					self.last_is_ok, self.last_level_diff = True, level_diff
+					self.last_is_ok = True
 				else:
 					# current sequence is not ok after this level & value added
 					if self.last_is_ok:
@@ -144,57 +166,147 @@ class Analysis:
 						if self.is_first_detection:
 							self.is_first_detection = False
 						else:
-							self.sequences.append((self.last_level_diff, tuple(bit_times[:-2])))
-							ret = self._get_sequence_as_key(self.sequences[-1])
-						bit_times.clear()
+							sequence = tuple(bit_times[:-2])
+							for x in bit_times[-2:]:
+								histogram.remove(x)
+							sequence = (self._calc_max_diff(sequence, histogram.get_clusters()), sequence)
+							self._add_sequence(sequence)
+							ret = sequence
+						# this level & value are start of next sequence
+						del bit_times[:-2]
+						histogram.clear()
+						for x in bit_times:
+							histogram.add(x)
 					else:
 						# searching
-						del bit_times[0:2]
+						self._remove_first_bit()
+				if self.max_sample_len and len(bit_times) > self.max_sample_len:
+					# endless sequence (carrier): search from next bit
+					self.last_is_ok = False
+					self._remove_first_bit()
 		return ret
 
+	def _remove_first_bit(self):
+		bit_times = self.bit_times
+		for x in bit_times[0:2]:
+			self.histogram.remove(x)
+		del bit_times[0:2]
+
+	def _add_sequence(self, sequence: Tuple[float, Tuple[int]]):
+		'adds sequence to lengths histogram; first sequence with minimum delta is kept per length'
+		seq_len = len(sequence[1])
+		self.sequences_count += 1
+		self.lengths[seq_len] = self.lengths.get(seq_len, 0) + 1
+		if (best := self.best.get(seq_len)) is None or sequence[0] < best[0]:
+			self.best[seq_len] = sequence
+
+	def _get_length_quantile(self) -> float:
+		'returns upper quartile of sequences lengths (as max(statistics.quantiles()) of all lengths)'
+		count = self.sequences_count
+		if count < 2:
+			raise StatisticsError('must have at least two data points')
+		lengths = sorted(self.lengths.items())
+		# exclusive method of quantiles(n=4): interpolation of data[j - 1] & data[j]
+		m = count + 1
+		j = min(max(3 * m // 4, 1), count - 1)
+		delta = 3 * m - j * 4
+		x_prev = x = None
+		items = 0
+		for length, length_count in lengths:
+			items += length_count
+			if x_prev is None and items >= j:
+				x_prev = length
+			if items >= j + 1:
+				x = length
+				break
+		return (x_prev * (4 - delta) + x * delta) / 4
+
 	def get_sequence(self, description: Optional[str] = None) -> Optional[list]:
-		# get sequences with nearest to max(quantiles) of bits count
-		q = quantiles((len(x[1]) for x in self.sequences))
-		seq_len = int(max(q))
+		# get sequence with nearest to max(quantiles) of bits count & minimum difference of bits time
+		seq_len = int(self._get_length_quantile())
 		if verbose_fd:
-			print(f'{q=} {seq_len=}\t{",".join((str(len(x[1])-seq_len)+" " +str(i) for i, x in enumerate(self.sequences)))}', file=verbose_fd)
-		sequence_indexes = sorted(
-			((i, len(x[1]) - seq_len, x[0]) for i, x in enumerate(self.sequences) if len(x[1]) - seq_len >= 0),
-			key=lambda x: x[1]
-			)
-		# get sequence with minimum difference of bits time
-		sequence_index = sorted(
-			(x for x in sequence_indexes if x[1] == sequence_indexes[0][1]),
-			key=lambda x: x[2]
-			)[0][0]
+			print(f'{seq_len=} {self.sequences_count=} {self.lengths=}', file=verbose_fd)
+		sequence = self.best[min(x for x in self.best if x >= seq_len)]
 		if verbose_fd:
-			print(f'{sequence_index=} {tuple(x for x in sequence_indexes if x[1] == sequence_indexes[0][1])=}', file=verbose_fd)
-		return self._get_sequence_as_key(
-			(self.sequences[sequence_index][0], self._calc_avg_sequence(self.sequences[sequence_index][1])),
-			description
-			)
+			print(f'{len(sequence[1])=} {sequence[0]=}', file=verbose_fd)
+		return self._get_sequence_as_key((sequence[0], self._calc_avg_sequence(sequence[1])), description)
+
+	def get_key(self, sequence: Tuple[float, Tuple[int]]) -> str:
+		'returns key of sequence'
+		return self._get_sequence_as_key(sequence)
+
+	def end_burst(self, description: Optional[str] = None) -> Optional[str]:
+		'returns key of burst sequences or None if there are not enough sequences; analysis is cleared (live mode)'
+		ret = None
+		if self.sequences_count >= MIN_BURST_SEQUENCES:
+			try:
+				ret = self.get_sequence(description)
+			except (ValueError, StatisticsError):
+				pass
+		self.clear()
+		return ret
 
 	def clear(self):
 		self.bit_times.clear()
-		self.sequences.clear()
+		self.sequences_count = 0
+		self.lengths.clear()
+		self.best.clear()
 		self.is_first_detection = True
 		self.last_is_ok = False
-		self.last_level_diff = 0
+		self.histogram.clear()
 
 def main():
 	start_time, end_time = args.s, args.e
-	analysis = Analysis(args.l)
+	live = args.live
+	analysis = Analysis(args.l, MAX_SAMPLE_LEN) if live else Analysis(args.l)
 	fd = stdin if args.f == '-' else open(args.f, 'rb')
 	fd_read = fd.read if fd != stdin else fd.buffer.read
+	# device (/dev/rfctl) read without samples is not end of dump
+	is_device = S_ISCHR(fstat(fd.fileno()).st_mode)
+	if args.n:
+		# glitches & idle noise are filtered before analysis
+		gate = NoiseGate(fd.read1 if fd != stdin else fd.buffer.read1, args.n)
+		fd_read = gate.read
+	else:
+		gate = None
+	if profiler:
+		# stage timers; decoding is loop code, so it is "other" time of report
+		fd_read = profiler.wrap('read', fd_read)
+		analysis.add = profiler.wrap('analyze', analysis.add)
+		analysis.get_sequence = profiler.wrap('analyze', analysis.get_sequence)
 	time_line, time_line_diff = 0, 0 if start_time is None else start_time
-	while(True):
+	burst_end_time = None  # live mode: time line of burst end if there are no new sequences
+	if args.m:
+		metrics = MetricsRegistry({'input': args.f})
+		samples = metrics.counter('rfctl_analysis_samples_total', 'Samples read')
+		sequences = metrics.gauge('rfctl_analysis_sequences', 'Detected bit sequences')
+		keys = metrics.counter('rfctl_analysis_keys_total', 'Keys of bursts (live mode)')
+		if gate:
+			gate_samples = metrics.counter('rfctl_analysis_gate_samples_total', 'Samples read before noise gate')
+	else:
+		metrics = None
+	empty_reads = 0
+	for samples_count in count(1):
 		buff = fd_read(4)
 		if len(buff) == 4:
+			if not samples_count & 0xFFF and metrics:
+				# hot loop counts locally; counts are added every 4096 samples
+				samples.inc(samples_count - empty_reads - samples.value)
+				sequences.set(analysis.sequences_count)
+				if gate:
+					gate_samples.inc(gate.samples_in - gate_samples.value)
+				metrics.update_textfile(args.m)
 			bit_times = int.from_bytes(buff, byteorder)
 			mode, value = bit_times & LIRC_MODE2_MASK, bit_times & LIRC_VALUE_MASK
 			if mode == LIRC_MODE2_TIMEOUT:
 				if args.d:
 					print('LIRC timeout', file=stderr)
+				elif live and burst_end_time is not None:
+					burst_end_time = None
+					if (buff := analysis.end_burst(args.k)):
+						print(buff, end='\n\n', flush=True)
+						if metrics:
+							keys.inc()
 				else:
 					analysis.clear()
 			else:
@@ -206,20 +318,51 @@ def main():
 				elif args.b:
 					stdout.buffer.write(buff)
 				else:
-					if (buff := analysis.add(mode == LIRC_MODE2_PULSE, value)):
+					if (sequence := analysis.add(mode == LIRC_MODE2_PULSE, value)):
 						if dump_fd:
-							print(buff.replace('\n', ', '), file=dump_fd)
+							print(analysis.get_key(sequence).replace('\n', ', '), file=dump_fd)
+						if live:
+							burst_end_time = time_line + args.g
+					elif burst_end_time is not None and time_line >= burst_end_time:
+						# burst is over: key of burst
+						burst_end_time = None
+						if (buff := analysis.end_burst(args.k)):
+							print(buff, end='\n\n', flush=True)
+							if metrics:
+								keys.inc()
 				if end_time is not None and time_line >= end_time:
 					break
 				time_line += value
-		elif fd != stdin:
-			if args.k:
+		else:
+			empty_reads += 1
+			if live and is_device:
+				# device is idle: burst is over
+				if burst_end_time is not None:
+					burst_end_time = None
+					if (buff := analysis.end_burst(args.k)):
+						print(buff, end='\n\n', flush=True)
+						if metrics:
+							keys.inc()
+				sleep(IDLE_SLEEP)
+				continue
+			if live:
+				if (buff := analysis.end_burst(args.k)):
+					print(buff, end='\n\n', flush=True)
+			elif args.k:
 				try:
 					print(analysis.get_sequence(args.k))
-				except:
+				except Exception:
 					fd.close()
 					exit(-1)
 			break
+	if metrics:
+		samples.inc(samples_count - empty_reads - samples.value)
+		sequences.set(analysis.sequences_count)
+		if gate:
+			gate_samples.inc(gate.samples_in - gate_samples.value)
+		metrics.write_textfile(args.m)
+	if gate and verbose_fd:
+		print(f'Noise gate: {gate.get_metrics()}', file=verbose_fd)
 
 # process command-line
 
@@ -236,6 +379,27 @@ def parse_args():
 	parser.add_argument('-s', metavar='START_TIME', type=int, help=f'Filter by time: start time, µs; example: "-s 2_220_000"')
 	parser.add_argument('-e', metavar='END_TIME', type=int, help=f'Filter by time: end time, µs; example: "-e 2_270_000"')
 	parser.add_argument('-k', metavar='DESCRIPTION', help='Print detected sequene to stdout as key file with description')
+	parser.add_argument(
+		'--live', action='store_true',
+		help='Live analysis of device or stream: key of each burst (repeated frames of key press) is printed at burst end; '
+		'memory is bounded, so learning session can run for hours; example: "rfanalysis.py /dev/rfctl --live -k Remote"')
+	parser.add_argument(
+		'-g', metavar='BURST_GAP', default=DEFAULT_BURST_GAP, type=int,
+		help=f'Live mode: time without new sequences of burst end, µs; default: {DEFAULT_BURST_GAP:_}')
+	parser.add_argument(
+		'-n', metavar='GLITCH', type=int,
+		help='Noise gate: pulses & spaces shorter than GLITCH, µs, are merged into adjacent levels '
+		f'& idle noise between bursts is suppressed; example: "-n {NoiseGate.DEFAULT_MIN_GLITCH}"')
+	parser.add_argument(
+		'-m', metavar='METRICS_FILE',
+		help='Metrics text file (Prometheus text format, samples are labeled by input), '
+		f'updated every {MetricsRegistry.TEXTFILE_PERIOD:.0f} seconds; '
+		f'example: "{MetricsRegistry.get_default_textfile_path("rfanalysis")}"')
+	parser.add_argument(
+		'--profile', metavar='MODES', nargs='?', const=Profiler.DEFAULT_MODES, type=Profiler.parse_modes,
+		help=f'Profile modes: comma separated {", ".join(Profiler.MODES)}; default: {Profiler.DEFAULT_MODES}; '
+		f'writes "{Profiler.get_default_path("rfanalysis")}.pstats" '
+		f'& summary report "{Profiler.get_default_path("rfanalysis")}.txt"')
 	parser.add_argument('-v', action='store_true', help='verbose')
 	args = parser.parse_args()
 	return args
@@ -247,14 +411,23 @@ if args.D:
 if args.v:
 	verbose_fd = stderr
 
-if args.k:
+if args.k or args.live:
 	dump_fd = None
 
+if args.profile:
+	profiler = Profiler('rfanalysis', args.profile)
+
 # analysis of dump from device
 
 try:
-	main()
+	if profiler:
+		profiler.call(main)
+	else:
+		main()
 except FileNotFoundError as e:
 	print(str(e), file=stderr)
 except KeyboardInterrupt:
 	pass
+finally:
+	if profiler:
+		print(profiler.stop(), file=stderr)
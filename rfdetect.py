@@ -3,7 +3,22 @@
 from sys import argv, byteorder, stdin, stdout, exit, stderr
 from getopt import getopt, GetoptError
 from glob import glob
-from os.path import join as path_join, abspath, basename
+from functools import partial
+from os import write as os_write
+from os.path import join as path_join, abspath, basename, splitext
+from array import array
+from csv import writer as csv_writer
+from json import dumps as json_dumps
+from itertools import count
+from time import perf_counter
+from typing import Dict, Iterable, Optional
+from detection import KeyTemplates, KeyScorer, KeyBatchDetector, KeyCoalescer
+from event_log import EventLog
+from actions import ActionDispatcher
+from settings import RfctlSettings
+from metrics import MetricsRegistry
+from noise_gate import NoiseGate
+from profiling import Profiler
 
 
 # LIRC (Linux Infrared Remote Control) constants
@@ -13,10 +28,22 @@ LIRC_MODE2_SPACE = 0x00000000
 LIRC_MODE2_PULSE = 0x01000000
 LIRC_MODE2_TIMEOUT = 0x03000000
 
+METRICS_SAMPLES_MASK = 0xFFF  # metrics are updated & reload stamp is checked every 4096 samples
+
 device_path = '/dev/rfctl'  # for <device> command-line option
 keys_path = './keys'  # for <device> command-line option
 key_path = None  # key file
 key_time_tolerance = .15  # koefficient
+best_match = False  # for -b command-line option
+timeline_path = None  # for -t command-line option
+dump_paths = ['-']  # for <dump> command-line option of timeline mode
+event_log_path = None  # for -l command-line option
+receiver_id = 0  # for -r command-line option
+settings_path = None  # for -a command-line option
+coalesce_holdoff = None  # for -c command-line option, µs
+min_glitch = None  # for -n command-line option, µs
+metrics_path = None  # for -m command-line option
+profiler: Optional[Profiler] = None  # for --profile command-line option
 verbose = 0  # verbose level for -v & -V command-line options
 dump_file, verbose_file = stdin, None  # file descriptors for input dump binary file & verbose messages
 
@@ -24,52 +51,97 @@ usage = f'''
 Detect from device or binary dump file. Detection patterns read from .key files.
 Key file is space separated values text table; row is level & time (according LIRC dumps).
 
-Usage: python3 {argv[0]} -v -k <path to .key files> -f <.key file>
+Usage: python3 {argv[0]} -v -b -k <path to .key files> -f <.key file> -l <events log> -r <receiver> -a <settings>
+                  -c <hold-off> -n <glitch> -m <metrics> --profile <modes> <device>
+       python3 {argv[0]} -k <path to .key files> -t <timeline file> -n <glitch> --profile <modes> <dump> ...
 	-v                     verbose
-	<path to .key files>   default: "{keys_path}"
+	-b                     best match of all keys with score (requires numpy); prints key & score
+	<events log>           detection events log path; log segment files are "<events log>.<number>"
+	<receiver>             receiver number for detection events log; default: {receiver_id}
+	<settings>             keys settings file path to run actions (event field) of enabled keys;
+	                       example: -a {RfctlSettings.get_default_file_path()}
+	<hold-off>             coalesce repeated frames of key within hold-off window, ms, to one press;
+	                       prints key & repeats count at release; example: -c 200
+	<glitch>               noise gate before detection: pulses & spaces shorter than glitch, µs, are merged into
+	                       adjacent levels & idle noise between bursts is suppressed;
+	                       example: -n {NoiseGate.DEFAULT_MIN_GLITCH}
+	                       keys should be learned with same noise gate (rfanalysis.py -n)
+	<metrics>              metrics text file path (Prometheus text format, samples are labeled by device & receiver),
+	                       updated every {MetricsRegistry.TEXTFILE_PERIOD:.0f} seconds;
+	                       example: -m {MetricsRegistry.get_default_textfile_path('rfdetect')}
+	<modes>                profile modes: comma separated {", ".join(Profiler.MODES)};
+	                       example: --profile {Profiler.DEFAULT_MODES}
+	                       writes "{Profiler.get_default_path('rfdetect')}.pstats"
+	                       & summary report "{Profiler.get_default_path('rfdetect')}.txt"
+	<path to .key files>   default: "{keys_path}"; keys & settings are reloaded on change of reload stamp
+	                       "{RfctlSettings.RELOAD_STAMP_FILE_NAME}" of path (web server keys operations)
 	<.key file>            key file path; used to check .key file
 	<device>               path to device; default: {device_path}
+	<timeline file>        offline detection over dump files (requires numpy) to timeline file:
+	                       .jsonl - JSON lines, else CSV; "-" - CSV to stdout;
+	                       ~15 MB/s of dump for few keys, ~9 MB/s for 200 keys (grows with keys count)
+	<dump>                 binary dump file path or stdin "-"; default: -
 
 Examples:
 	python3 {argv[0]}
 	cat rfdump.bin | python3 {argv[0]} -v -
+	python3 {argv[0]} -t timeline.csv rfdump1.bin rfdump2.bin
 '''
 
 
-def main():
+class DetectMetrics(MetricsRegistry):
+	'detector metrics; hot loop counts locally & calls update() every 4096 samples'
+
+	def __init__(self, path: str, labels: Dict[str, str], gate: Optional[NoiseGate]):
+		super().__init__(labels)
+		self.path = path
+		self.samples = self.counter('rfctl_detect_samples_total', 'Samples read')
+		# samples before noise gate are counted if there is noise gate (-n)
+		self.gate_samples = \
+			self.counter('rfctl_detect_gate_samples_total', 'Samples read before noise gate') if gate else None
+		self.timeouts = self.counter('rfctl_detect_timeouts_total', 'LIRC timeout samples')
+		self.keys_detected = self.counter('rfctl_detect_keys_total', 'Detected keys (frames)')
+		self.match_time = self.histogram(
+			'rfctl_detect_match_seconds', 'Keys matching time per sample (sampled every 4096 samples)',
+			(.00001, .000025, .00005, .0001, .00025, .0005, .001, .0025, .005, .01))
+		self.press_time = self.histogram(
+			'rfctl_detect_press_seconds', 'Detected key processing time: output, events log & actions submit')
+		self.keys = self.gauge('rfctl_detect_key_templates', 'Loaded keys')
+		self.actions_queue_depth = self.gauge('rfctl_actions_queue_depth', 'Actions queue depth')
+		self.actions_dropped = self.counter('rfctl_actions_dropped_total', 'Actions dropped due to full queue')
+		self.actions_failed = self.counter('rfctl_actions_failed_total', 'Failed & timed out actions')
+
+	def update(
+			self, samples_count: int, timeouts_count: int, detect, bits_levels: int, bits_times: array,
+			dispatcher: Optional[ActionDispatcher], gate: Optional[NoiseGate]):
+		# add local counts; time matching of current receive window
+		self.samples.inc(samples_count - self.samples.value)
+		if self.gate_samples:
+			self.gate_samples.inc(gate.samples_in - self.gate_samples.value)
+		self.timeouts.inc(timeouts_count - self.timeouts.value)
+		match_start = perf_counter()
+		detect(bits_levels, bits_times)
+		self.match_time.observe(perf_counter() - match_start)
+		if dispatcher:
+			x = dispatcher.get_metrics()
+			self.actions_queue_depth.set(x['queue_depth'])
+			self.actions_dropped.inc(x['dropped'] - self.actions_dropped.value)
+			self.actions_failed.inc(x['failed'] + x['timed_out'] - self.actions_failed.value)
+		self.update_textfile(self.path)
 
-	def load_keys() -> dict:
 
-		def get_level_index(line: list) -> int:
-			for i, field in enumerate(line):
-				if field in ('0', '1'):
-					if len(line) > i + 1:
-						return i
-			raise Exception('Key file line parse error: ' + ' '.join(line))
+def main():
+
+	def load_keys() -> KeyTemplates:
 
 		def process_key_file(file_path: str):
 			try:
-				fd = open(file_path, 'r')
-				bits = []
-				level_field_index = None
-				while (line := fd.readline(100)):
-					# process .key file line
-					line = line.strip()
-					if line.startswith('#'):
-						# it comment line # skip
-						continue
-					line = line.split(' ')
-					if level_field_index is None:
-						level_field_index = get_level_index(line)
-					if line[level_field_index] not in ('0', '1'):
-						raise Exception(f'Expected 0 or 1 but given "{line[level_field_index]}" in line: ' + ' '.join(line))
-					bits.append((0 if line[level_field_index] == '0' else 1, int(line[level_field_index + 1])))
-				ret[basename(file_path)] = tuple(bits)
+				ret.add(basename(file_path), KeyTemplates.load_key_file(file_path))
 			except Exception as e:
 				print(f'Skip key file "{abspath(file_path)}" due to parsing error: ' + str(e), file=stderr)
 
 		# process .key files at keys path
-		ret = {}
+		ret = KeyTemplates(key_time_tolerance)
 		if verbose_file:
 			print(f'Open key files from path "{abspath(keys_path)}":', file=verbose_file)
 		key_files = glob(path_join(keys_path, '*.key'))
@@ -87,81 +159,288 @@ def main():
 
 		return ret
 
-	def detect_key(input_bits: list, key_bits: tuple) -> bool:
-		if len(input_bits) >= len(key_bits):
-			for input_bit, key_bit in zip(input_bits, key_bits):
-				if input_bit[0] != key_bit[0] or not key_bit[1] * bit_time_k_low <= input_bit[1] <= key_bit[1] * bit_time_k_high:
-					return False
-			return True
-		return False
-
-	# list of keys, key is tuple of bits, bit is tuple of level (low/high) & time length (us)
-	detection_keys: dict[str, tuple[tuple[int, int]]] = load_keys()
-	if not detection_keys or not any(detection_keys):
+	def reload_keys(detection_keys: KeyTemplates):
+		# returns reloaded keys & settings (web server keys changes), match & score functions
+		new_keys = load_keys()
+		if not len(new_keys):
+			print('No any keys after reload; keys are not changed', file=stderr)
+			new_keys = detection_keys
+		if settings_path:
+			RfctlSettings.load(settings_path)
+		if verbose_file:
+			print(f'Reloaded keys: {len(new_keys)}', file=verbose_file)
+		match, score = new_keys.match, KeyScorer(new_keys).score if best_match else None
+		if profiler:
+			match, score = profiler.wrap('match', match), score and profiler.wrap('match', score)
+		return new_keys, match, score
+
+	def on_press(key_name: str, key_score: Optional[float]):
+		# consumers of key press: events log & actions
+		key_uuid = splitext(key_name)[0]
+		if event_log:
+			event_log.append(key_uuid, key_score or 1., receiver_id)
+		if dispatcher and (ks := RfctlSettings.key_settings.get(key_uuid)) and ks.enabled and ks.event:
+			dispatcher.submit(key_uuid, ks.event)
+
+	def on_coalesced(events: Iterable[KeyCoalescer.Event]):
+		for event in events:
+			if event.kind == KeyCoalescer.PRESS:
+				on_press(event.key, event.score if best_match else None)
+			elif event.kind == KeyCoalescer.RELEASE:
+				if best_match:
+					print(f'{event.key} {event.score:.3f} {event.repeats}')
+				else:
+					print(f'{event.key} {event.repeats}')
+			if verbose_file:
+				print(f'\t{event.kind} {event.key} time={event.time} repeats={event.repeats}', file=verbose_file)
+
+	def detect_dumps(detection_keys: KeyTemplates):
+		# offline detection over dump files; timeline row is dump, time offset (us), key & score
+		detector = KeyBatchDetector(detection_keys)
+		if profiler:
+			detector._match_key = profiler.wrap('match', detector._match_key)
+		timeline_file = stdout if timeline_path == '-' else open(timeline_path, 'w', newline='')
+		if timeline_path.endswith('.jsonl'):
+			def write_row(row: tuple):
+				timeline_file.write(json_dumps(dict(zip(('dump', 'time', 'key', 'score'), row))) + '\n')
+		else:
+			write_row = csv_writer(timeline_file).writerow
+			write_row(('dump', 'time', 'key', 'score'))
+		if profiler:
+			write_row = profiler.wrap('output', write_row)
+		for dump_path in dump_paths:
+			if verbose_file and timeline_file != stdout:
+				print(f'Detect from dump "{dump_path}"', file=verbose_file)
+			fd = dump_file.buffer if dump_path == '-' else open(dump_path, 'rb')
+			if min_glitch:
+				gate = NoiseGate(fd.read, min_glitch)
+				fd_read = gate.read
+			else:
+				gate, fd_read = None, fd.read
+			for time_offset, key_index, key_score in detector.detect(profiler.wrap('read', fd_read) if profiler else fd_read):
+				write_row((dump_path, time_offset, detection_keys.names[key_index], round(key_score, 3)))
+			if fd != dump_file.buffer:
+				fd.close()
+			if gate and verbose_file and timeline_file != stdout:
+				print(f'Noise gate: {gate.get_metrics()}', file=verbose_file)
+		if timeline_file != stdout:
+			timeline_file.close()
+
+	# keys packed to integer time bounds & levels bitmasks
+	reload_stamp = RfctlSettings.get_reload_stamp(keys_path)
+	detection_keys = profiler.wrap('load', load_keys)() if profiler else load_keys()
+	if not len(detection_keys):
 		print('No any keys to detection. Exit', file=stderr)
 		exit(-1)
 
+	if timeline_path:
+		detect_dumps(detection_keys)
+		return
+
 	# process LIRC 4-bytes sequence from device file or stdin
-	sample_len_max = max(len(v) for v in detection_keys.values())
+	sample_len_max = detection_keys.max_len
 	if verbose_file:
 		print(f'Max of sample len={sample_len_max}', file=verbose_file)
 	if device_path != '-':
-		fd = open(device_path, 'rb')
+		# device is opened once (exclusive driver): "tx:" actions write to device file of detection
+		fd = open(device_path, 'r+b' if settings_path else 'rb')
+	else:
+		fd = dump_file.buffer
+	if min_glitch:
+		# glitches & idle noise are filtered before detection; read1 does not wait for full chunk of gate
+		gate = NoiseGate(fd.read1, min_glitch)
+		fd_read = gate.read
+	else:
+		gate = None
 		fd_read = fd.read
+	# recieved bits: levels bitmask (bit i is level of bit i) & time lengths (us)
+	bits_levels, bits_times = 0, array('I')
+	time_line = 0  # us
+	coalescer = KeyCoalescer(coalesce_holdoff) if coalesce_holdoff else None
+	match = detection_keys.match
+	event_log = EventLog(event_log_path) if event_log_path else None
+	if settings_path:
+		RfctlSettings.load(settings_path)
+		# unbuffered write to device: detection read buffer is not changed
+		dispatcher = ActionDispatcher(
+			device_write=partial(os_write, fd.fileno()) if device_path != '-' else None, verbose_file=verbose_file)
 	else:
-		fd_read = dump_file.buffer.read
-	bits = []  # recieved bits
-	bit_time_k_low, bit_time_k_high = 1 - key_time_tolerance, 1 + key_time_tolerance
+		dispatcher = None
+	if best_match:
+		score = KeyScorer(detection_keys).score
+	if profiler:
+		# stage timers; decoding is loop code, so it is "other" time of report
+		fd_read, match = profiler.wrap('read', fd_read), profiler.wrap('match', match)
+		on_press = profiler.wrap('output', on_press)
+		if best_match:
+			score = profiler.wrap('match', score)
+	if metrics_path:
+		metrics = DetectMetrics(metrics_path, {'device': device_path, 'receiver': str(receiver_id)}, gate)
+		metrics.keys.set(len(detection_keys))
+	else:
+		metrics = None
+	empty_reads, timeouts_count = 0, 0
+	idle_start = None  # wall-clock time of first idle device read, seconds
 	if verbose_file:
 		print('READY', file=verbose_file)
-	while(True):
+	for samples_count in count(1):
 		buff = fd_read(4)
 		if len(buff) == 4:
 			if verbose > 1 and verbose_file:
 				print(buff.hex(), file=verbose_file)
+			if not samples_count & METRICS_SAMPLES_MASK:
+				if metrics:
+					metrics.update(
+						samples_count - empty_reads, timeouts_count, score if best_match else match, bits_levels, bits_times,
+						dispatcher, gate)
+				if (stamp := RfctlSettings.get_reload_stamp(keys_path)) != reload_stamp:
+					# keys or settings are changed (web server bulk operation)
+					reload_stamp = stamp
+					detection_keys, match, new_score = reload_keys(detection_keys)
+					if best_match:
+						score = new_score
+					sample_len_max = detection_keys.max_len
+					bits_levels = 0
+					del bits_times[:]
+					if metrics:
+						metrics.keys.set(len(detection_keys))
 			buff = int.from_bytes(buff, byteorder)
 			mode, value = buff & LIRC_MODE2_MASK, buff & LIRC_VALUE_MASK
 			if mode == LIRC_MODE2_TIMEOUT:
-				pass
+				timeouts_count += 1
+				key_index = None
+				if bits_times:
+					# receiver is idle: timeout is trailing space (sync) of last frame of burst
+					bits_times.append(value)
+					if best_match:
+						key_index, key_score = score(bits_levels, bits_times, timeout=True) or (None, None)
+					else:
+						key_index, key_score = match(bits_levels, bits_times, timeout=True), None
 			else:
-				bits.append((1 if mode == LIRC_MODE2_PULSE else 0, value))
-				if len(bits) > sample_len_max:
-					del bits[0]
+				if mode == LIRC_MODE2_PULSE:
+					bits_levels |= 1 << len(bits_times)
+				bits_times.append(value)
+				time_line += value
+				if coalescer and coalescer.pressed:
+					on_coalesced(coalescer.flush(time_line))
+				if len(bits_times) > sample_len_max:
+					del bits_times[0]
+					bits_levels >>= 1
 				# compare recieved bits with keys
-				for k, v in detection_keys.items():
-					if detect_key(bits, v):
-						print(k)
-						if verbose_file:
-							print('\tbits: ', end='', file=verbose_file)
-							print(bits, file=verbose_file)
-							print('\tkey:  ', end='', file=verbose_file)
-							print(v, file=verbose_file)
-						bits.clear()
+				if best_match:
+					key_index, key_score = score(bits_levels, bits_times) or (None, None)
+				else:
+					key_index, key_score = match(bits_levels, bits_times), None
+			if key_index is not None:
+				press_start = perf_counter()
+				if coalescer:
+					on_coalesced(coalescer.add(detection_keys.names[key_index], time_line, key_score or 1.))
+				else:
+					if key_score is None:
+						print(detection_keys.names[key_index])
+					else:
+						print(f'{detection_keys.names[key_index]} {key_score:.3f}')
+					on_press(detection_keys.names[key_index], key_score)
+				if verbose_file:
+					print('\tbits: ', end='', file=verbose_file)
+					print([((bits_levels >> i) & 1, x) for i, x in enumerate(bits_times)], file=verbose_file)
+					print('\tkey:  ', end='', file=verbose_file)
+					print(detection_keys.get_bits(key_index), file=verbose_file)
+				bits_levels = 0
+				del bits_times[:]
+				if metrics:
+					metrics.keys_detected.inc()
+					metrics.press_time.observe(perf_counter() - press_start)
+			if mode == LIRC_MODE2_TIMEOUT:
+				# window is not continued by next burst
+				bits_levels = 0
+				del bits_times[:]
+				if coalescer and coalescer.pressed:
+					# receiver is idle for timeout (value, µs): release is not held until next edge
+					on_coalesced(coalescer.flush(time_line + value))
 		elif device_path == '-':
 			break
+		else:
+			empty_reads += 1
+			if coalescer and coalescer.pressed:
+				# idle device: time line is extended by wall-clock time of idle reads
+				if idle_start is None:
+					idle_start = perf_counter()
+				on_coalesced(coalescer.flush(time_line + int((perf_counter() - idle_start) * 1_000_000)))
+			continue
+		idle_start = None
+	if coalescer:
+		on_coalesced(coalescer.flush())
+	if dispatcher:
+		dispatcher.stop()
+		if verbose_file:
+			print(f'Actions: {dispatcher.get_metrics()}', file=verbose_file)
+	if metrics:
+		metrics.update(
+			samples_count - empty_reads - 1, timeouts_count, score if best_match else match, bits_levels, bits_times,
+			dispatcher, gate)
+		metrics.write_textfile(metrics_path)
+	if gate and verbose_file:
+		print(f'Noise gate: {gate.get_metrics()}', file=verbose_file)
 
 
 # process command-line
 
 try:
-	optlist, args = getopt(argv[1:], 'hHvk:f:')
+	optlist, args = getopt(argv[1:], 'hHvbk:f:t:l:r:a:c:n:m:', ['profile='])
 except GetoptError as e:
 	print('Command line error:', file=stderr)
 	print('\t' + e.msg, file=stderr)
 	print(usage, file=stderr)
 	exit(-1)
 
-if len(args) == 1:
-	device_path = args[0]
-elif len(args) > 1:
-	print(usage, file=stderr)
-	exit(0)
-
 for opt, val in optlist:
 	if opt == '-k':
 		keys_path = val
 	elif opt == '-f':
 		key_path = val
+	elif opt == '-b':
+		best_match = True
+	elif opt == '-t':
+		timeline_path = val
+	elif opt == '-l':
+		event_log_path = val
+	elif opt == '-a':
+		settings_path = val
+	elif opt == '-m':
+		metrics_path = val
+	elif opt == '--profile':
+		try:
+			profiler = Profiler('rfdetect', Profiler.parse_modes(val))
+		except ValueError as e:
+			print('Command line error:', file=stderr)
+			print(str(e), file=stderr)
+			print(usage, file=stderr)
+			exit(-1)
+	elif opt == '-c':
+		try:
+			coalesce_holdoff = int(float(val) * 1000)
+		except ValueError as e:
+			print('Command line error:', file=stderr)
+			print(str(e), file=stderr)
+			print(usage, file=stderr)
+			exit(-1)
+	elif opt == '-n':
+		try:
+			min_glitch = int(val)
+		except ValueError as e:
+			print('Command line error:', file=stderr)
+			print(str(e), file=stderr)
+			print(usage, file=stderr)
+			exit(-1)
+	elif opt == '-r':
+		try:
+			receiver_id = int(val)
+		except ValueError as e:
+			print('Command line error:', file=stderr)
+			print(str(e), file=stderr)
+			print(usage, file=stderr)
+			exit(-1)
 	elif opt == '-v':
 		verbose += 1
 		verbose_file = stdout
@@ -169,11 +448,28 @@ for opt, val in optlist:
 		print(usage, file=stderr)
 		exit(0)
 
+if timeline_path and args:
+	dump_paths = args
+elif len(args) == 1:
+	device_path = args[0]
+elif len(args) > 1:
+	print(usage, file=stderr)
+	exit(0)
+
 # dump from device
 
 try:
-	main()
+	if profiler:
+		profiler.call(main)
+	else:
+		main()
 except FileNotFoundError as e:
 	print('Open device file error: ' + str(e), file=stderr)
+except ImportError as e:
+	print(str(e), file=stderr)
+	exit(-1)
 except KeyboardInterrupt:
 	pass
+finally:
+	if profiler:
+		print(profiler.stop(), file=stderr)
@@ -3,20 +3,32 @@
 from sys import argv, stdout, exit, stderr
 from getopt import getopt, GetoptError
 from time import time
+from itertools import count
+from typing import Optional
+from metrics import MetricsRegistry
+from profiling import Profiler
 
 
 device_path = '/dev/rfctl'  # for <device> command-line option
 dump_time = -1  # for -t command-line option
+metrics_path = None  # for -m command-line option
+profiler: Optional[Profiler] = None  # for --profile command-line option
 verbose = 0  # verbose level for -v & -V command-line options
 verbose_file, bin_file = None, stdout  # file descriptors for verbose messages & out binary file
 
 usage = f'''
 Dumps from device file by 4 bytes LIRC sequence.
 
-Usage: python3 {argv[0]} -v -t <seconds> <device>
+Usage: python3 {argv[0]} -v -t <seconds> -m <metrics> --profile <modes> <device>
 	-v          verbose, dump hex values by 4 bytes
 	-V          as -v but dump to both: stdout (binary) & stderr (hex)
 	<seconds>   dump time; default: forever; example: -t 0.5
+	<metrics>   metrics text file path (Prometheus text format, samples are labeled by device),
+	            updated every {MetricsRegistry.TEXTFILE_PERIOD:.0f} seconds;
+	            example: -m {MetricsRegistry.get_default_textfile_path('rfdump')}
+	<modes>     profile modes: comma separated {", ".join(Profiler.MODES)}; example: --profile {Profiler.DEFAULT_MODES}
+	            writes "{Profiler.get_default_path('rfdump')}.pstats"
+	            & summary report "{Profiler.get_default_path('rfdump')}.txt"
 	<device>    path to device; default: {device_path}
 
 Examples:
@@ -31,28 +43,47 @@ def main():
 		print(f'Open device file {device_path}', file=verbose_file)
 	fd = open(device_path, 'rb')
 	fd_read = fd.read
+	out_write = bin_file.buffer.raw.write if bin_file else None
+	if profiler:
+		fd_read, out_write = profiler.wrap('read', fd_read), out_write and profiler.wrap('output', out_write)
 	if verbose_file:
 		print(f'Read from device {"for "+str(dump_time)+" seconds" if dump_time > 0 else "forever"}', file=verbose_file)
+	if metrics_path:
+		metrics = MetricsRegistry({'device': device_path})
+		samples = metrics.counter('rfctl_dump_samples_total', 'Samples read')
+	else:
+		metrics = None
+	samples_count, empty_reads = 0, 0
 	try:
-		while(True):
+		for samples_count in count(1):
 			data = fd_read(4)
 			if len(data) == 4:
 				if verbose_file:
 					print(data.hex(), file=verbose_file)
-				if bin_file:
-					bin_file.buffer.raw.write(data)
+				if out_write:
+					out_write(data)
+				if not samples_count & 0xFFF and metrics:
+					# hot loop counts locally; counts are added every 4096 samples
+					samples.inc(samples_count - empty_reads - samples.value)
+					metrics.update_textfile(metrics_path)
+			else:
+				empty_reads += 1
 			if dump_time > 0 and time() - start_time >= dump_time:
 				# dump time is over # stop dump
 				fd.close()
 				return
 	except BrokenPipeError:
 		exit(-1)
+	finally:
+		if metrics:
+			samples.inc(samples_count - empty_reads - samples.value)
+			metrics.write_textfile(metrics_path)
 
 
 # process command-line
 
 try:
-	optlist, args = getopt(argv[1:], 'hHvVt:')
+	optlist, args = getopt(argv[1:], 'hHvVt:m:', ['profile='])
 except GetoptError as e:
 	print('Command line error:', file=stderr)
 	print('\t' + e.msg, file=stderr)
@@ -74,6 +105,16 @@ for opt, val in optlist:
 			print(str(e), file=stderr)
 			print(usage, file=stderr)
 			exit(-1)
+	elif opt == '-m':
+		metrics_path = val
+	elif opt == '--profile':
+		try:
+			profiler = Profiler('rfdump', Profiler.parse_modes(val))
+		except ValueError as e:
+			print('Command line error:', file=stderr)
+			print(str(e), file=stderr)
+			print(usage, file=stderr)
+			exit(-1)
 	elif opt == '-v':
 		verbose = 1
 		verbose_file, bin_file = stdout, None
@@ -87,8 +128,14 @@ for opt, val in optlist:
 # dump from device
 
 try:
-	main()
+	if profiler:
+		profiler.call(main)
+	else:
+		main()
 except FileNotFoundError as e:
 	print('Open device file error: ' + str(e), file=stderr)
 except KeyboardInterrupt:
 	pass
+finally:
+	if profiler:
+		print(profiler.stop(), file=stderr)
@@ -3,11 +3,12 @@
 
 from sys import byteorder, stderr
 import argparse
-from typing import Iterable, Tuple
+from typing import Iterable, Tuple, Optional
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from plotly.io import to_html
 from os import path
+from profiling import Profiler
 
 
 # LIRC (Linux Infrared Remote Control) constants
@@ -17,14 +18,17 @@ LIRC_MODE2_SPACE = 0x00000000
 LIRC_MODE2_PULSE = 0x01000000
 LIRC_MODE2_TIMEOUT = 0x03000000
 
+profiler: Optional[Profiler] = None
+
 
 def main():
 	data: Iterable[Tuple[int, int]] = []
 	start_time, end_time = args.s, args.e
 	time_line, time_line_diff = 0, 0 if start_time is None else start_time
 	with open(args.f, 'rb') as fd:
+		fd_read = profiler.wrap('read', fd.read) if profiler else fd.read
 		while(True):
-			buff = fd.read(4)
+			buff = fd_read(4)
 			if len(buff) == 4:
 				buff = int.from_bytes(buff, byteorder)
 				mode, value = buff & LIRC_MODE2_MASK, buff & LIRC_VALUE_MASK
@@ -58,7 +62,7 @@ def main():
 	if start_time is not None:
 		# set time line range
 		fig.update_layout(xaxis_range=[0, time_line - start_time if end_time is None else end_time - start_time])
-	print(to_html(fig, include_plotlyjs='cdn', full_html=False))
+	print((profiler.wrap('output', to_html) if profiler else to_html)(fig, include_plotlyjs='cdn', full_html=False))
 
 
 # process command-line
@@ -73,17 +77,31 @@ def parse_args():
 	parser.add_argument('-t', metavar='GRAPH_TITLE', help='By default is file name')
 	parser.add_argument('-s', metavar='START_TIME', type=int, help='Filter by time: start time, µs; example: "-s 220_000"')
 	parser.add_argument('-e', metavar='END_TIME', type=int, help='Filter by time: end time, µs; example: "-e 2_270_000"')
+	parser.add_argument(
+		'--profile', metavar='MODES', nargs='?', const=Profiler.DEFAULT_MODES, type=Profiler.parse_modes,
+		help=f'Profile modes: comma separated {", ".join(Profiler.MODES)}; default: {Profiler.DEFAULT_MODES}; '
+		f'writes "{Profiler.get_default_path("rfgraph")}.pstats" '
+		f'& summary report "{Profiler.get_default_path("rfgraph")}.txt"')
 	args = parser.parse_args()
 	return args
 
 
 args = parse_args()
 
+if args.profile:
+	profiler = Profiler('rfgraph', args.profile)
+
 # convert to graph
 
 try:
-	main()
+	if profiler:
+		profiler.call(main)
+	else:
+		main()
 except FileNotFoundError as e:
 	print(str(e), file=stderr)
 except KeyboardInterrupt:
 	pass
+finally:
+	if profiler:
+		print(profiler.stop(), file=stderr)
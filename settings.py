@@ -1,21 +1,31 @@
-
-from os.path import join as path_join
-from typing import Dict, Optional, NamedTuple
+from os import fsync, replace as os_replace, remove as os_remove, stat as os_stat
+from os.path import join as path_join, exists
+from threading import Lock, Thread, Timer
+from time import time
+from typing import Dict, Iterable, Optional, NamedTuple
 
 
 class RfctlSettings:
 	'''Settings module.
 	Used to load/save tab separated values file.
+	Changes by set/delete are appended to journal file "<tsv file>.journal" instead of
+	full file rewrite; journal is fsync'ed by batches & compacted to tsv file in background
+	(atomic rename). Load replays tsv file & journal. Bulk changes (set_many(), delete_many()) are
+	one journal write; detectors reload keys & settings by reload stamp (see notify_reload()).
 
 	Example:
 	import RfctlSettings
 	RfctlSettings.load() # or .load('path of tsv file')
 	if RfctlSettings.key_settings[key_uuid].enabled:
-		RfctlSettings.key_settings[key_uuid].enabled = False
+		RfctlSettings.set(key_uuid, enabled=False)
 	RfctlSettings.save() # or .save('path of tsv file')
 	'''
 
 	KEYS_SETTINGS_PATH, KEYS_SETTINGS_FILE_NAME = '.', 'rfctl_keys.tsv'
+	JOURNAL_SUFFIX = '.journal'
+	JOURNAL_FSYNC_DELAY = 1.  # seconds; journal changes are fsync'ed by batches
+	JOURNAL_COMPACT_RECORDS = 200  # journal records count to compact journal to tsv file
+	RELOAD_STAMP_FILE_NAME = '.rfctl_reload'  # keys & settings changes stamp of keys path; see notify_reload()
 
 	class KeyRow(NamedTuple):
 		event: str
@@ -23,6 +33,13 @@ class RfctlSettings:
 
 	key_settings: Dict[str, KeyRow] = {}
 
+	_settings_file_path: Optional[str] = None
+	_journal = None  # journal file
+	_journal_records = 0
+	_fsync_timer: Optional[Timer] = None
+	_compaction: Optional[Thread] = None
+	_lock = Lock()
+
 	@classmethod
 	def get_default_file_path(cls) -> str:
 		return path_join(cls.KEYS_SETTINGS_PATH, cls.KEYS_SETTINGS_FILE_NAME)
@@ -31,27 +48,182 @@ class RfctlSettings:
 	def load(cls, settings_file_path: Optional[str] = None):
 		if not settings_file_path:
 			settings_file_path = cls.get_default_file_path()
+		journal_path = settings_file_path + cls.JOURNAL_SUFFIX
 
-		cls.key_settings.clear()
-		with open(settings_file_path, 'r') as f:
-			while (line := f.readline()):
-				line = line.strip()
-				if line and not line.startswith('#'):
-					line = line.split('\t', maxsplit=3)
-					if len(line) > 1:
-						cls.key_settings[line[0]] = cls.KeyRow(
-							line[1],
-							bool(line[2] if len(line) > 2 else False)
-						)
+		with cls._lock:
+			# compaction is started with lock held, so it is not started again before snapshot write
+			cls._wait_compaction()
+			cls._close_journal()
+			cls._settings_file_path = settings_file_path
+			cls.key_settings.clear()
+			if exists(settings_file_path) or not exists(journal_path):
+				with open(settings_file_path, 'r') as f:
+					while (line := f.readline()):
+						line = line.strip()
+						if line and not line.startswith('#'):
+							line = line.split('\t', maxsplit=3)
+							if len(line) > 1:
+								cls.key_settings[line[0]] = cls.KeyRow(
+									line[1],
+									len(line) > 2 and line[2] == '1'
+								)
+			# replay journal of interrupted compaction & current journal
+			cls._journal_records = 0
+			for path in (journal_path + '.1', journal_path):
+				if exists(path):
+					with open(path, 'r') as f:
+						while (line := f.readline()):
+							if line.endswith('\n'):  # skip torn record
+								cls._replay(line[:-1].split('\t'))
+								cls._journal_records += 1
+			if exists(journal_path + '.1'):
+				# finish interrupted compaction
+				cls._write_snapshot(settings_file_path, dict(cls.key_settings))
+				os_remove(journal_path + '.1')
 
 	@classmethod
 	def save(cls, settings_file_path: Optional[str] = None):
+		'writes full tsv file & clears journal'
 		if not settings_file_path:
-			settings_file_path = cls.get_default_file_path()
-		with open(settings_file_path, 'w') as f:
+			settings_file_path = cls._settings_file_path or cls.get_default_file_path()
+		with cls._lock:
+			cls._wait_compaction()
+			cls._write_snapshot(settings_file_path, dict(cls.key_settings))
+			if settings_file_path == cls._settings_file_path:
+				cls._close_journal()
+				for path in (settings_file_path + cls.JOURNAL_SUFFIX + '.1', settings_file_path + cls.JOURNAL_SUFFIX):
+					if exists(path):
+						os_remove(path)
+				cls._journal_records = 0
+
+	@classmethod
+	def set(cls, key_uuid: str, event: Optional[str] = None, enabled: Optional[bool] = None):
+		'sets key settings; settings for a new key are created'
+		cls.set_many((key_uuid,), event, enabled)
+
+	@classmethod
+	def set_many(cls, key_uuids: Iterable[str], event: Optional[str] = None, enabled: Optional[bool] = None):
+		'sets settings of keys by one journal write'
+		if event is not None:
+			event = ' '.join(event.split('\t')).replace('\n', ' ')
+		with cls._lock:
+			records = []
+			for key_uuid in key_uuids:
+				ks = cls.key_settings.get(key_uuid, cls.KeyRow('', False))
+				if event is not None:
+					ks = ks._replace(event=event)
+				if enabled is not None:
+					ks = ks._replace(enabled=bool(enabled))
+				cls.key_settings[key_uuid] = ks
+				records.append(('set', key_uuid, ks.event, '1' if ks.enabled else '0'))
+			cls._append(*records)
+
+	@classmethod
+	def delete(cls, key_uuid: str) -> bool:
+		'deletes key settings; returns False if there are no key settings'
+		return bool(cls.delete_many((key_uuid,)))
+
+	@classmethod
+	def delete_many(cls, key_uuids: Iterable[str]) -> int:
+		'deletes settings of keys by one journal write; returns deleted settings count'
+		with cls._lock:
+			records = [('del', x) for x in key_uuids if cls.key_settings.pop(x, None) is not None]
+			cls._append(*records)
+		return len(records)
+
+	@classmethod
+	def notify_reload(cls, keys_path: str):
+		'notifies detectors (rfdetect.py) to reload keys & settings: reload stamp file of keys path is updated'
+		with open(path_join(keys_path, cls.RELOAD_STAMP_FILE_NAME), 'w') as f:
+			f.write(f'{time()}\n')
+
+	@classmethod
+	def get_reload_stamp(cls, keys_path: str) -> float:
+		'returns modification time of reload stamp file of keys path; 0 if there is no stamp file'
+		try:
+			return os_stat(path_join(keys_path, cls.RELOAD_STAMP_FILE_NAME)).st_mtime
+		except OSError:
+			return 0.
+
+	@classmethod
+	def sync(cls):
+		'fsync journal now'
+		with cls._lock:
+			if cls._fsync_timer:
+				cls._fsync_timer.cancel()
+				cls._fsync_timer = None
+			if cls._journal:
+				fsync(cls._journal.fileno())
+
+	@classmethod
+	def _replay(cls, record: list):
+		if record[0] == 'set' and len(record) > 3:
+			cls.key_settings[record[1]] = cls.KeyRow(record[2], record[3] == '1')
+		elif record[0] == 'del' and len(record) > 1:
+			cls.key_settings.pop(record[1], None)
+
+	@classmethod
+	def _append(cls, *records: tuple):
+		# should be called with lock
+		if not records:
+			return
+		if not cls._journal:
+			if not cls._settings_file_path:
+				cls._settings_file_path = cls.get_default_file_path()
+			cls._journal = open(cls._settings_file_path + cls.JOURNAL_SUFFIX, 'a')
+		cls._journal.write(''.join('\t'.join(x) + '\n' for x in records))
+		cls._journal.flush()
+		cls._journal_records += len(records)
+		if not cls._fsync_timer:
+			cls._fsync_timer = Timer(cls.JOURNAL_FSYNC_DELAY, cls.sync)
+			cls._fsync_timer.daemon = True
+			cls._fsync_timer.start()
+		if cls._journal_records >= cls.JOURNAL_COMPACT_RECORDS and not (cls._compaction and cls._compaction.is_alive()):
+			cls._start_compaction()
+
+	@classmethod
+	def _start_compaction(cls):
+		# current journal is moved aside; snapshot of settings includes all its records
+		journal_path = cls._settings_file_path + cls.JOURNAL_SUFFIX
+		cls._close_journal()
+		os_replace(journal_path, journal_path + '.1')
+		cls._journal_records = 0
+		cls._compaction = Thread(
+			target=cls._compact, args=(cls._settings_file_path, dict(cls.key_settings)), name='settings_compaction', daemon=True)
+		cls._compaction.start()
+
+	@classmethod
+	def _wait_compaction(cls):
+		if cls._compaction:
+			cls._compaction.join()
+			cls._compaction = None
+
+	@classmethod
+	def _compact(cls, settings_file_path: str, key_settings: Dict[str, KeyRow]):
+		cls._write_snapshot(settings_file_path, key_settings)
+		os_remove(settings_file_path + cls.JOURNAL_SUFFIX + '.1')
+
+	@classmethod
+	def _write_snapshot(cls, settings_file_path: str, key_settings: Dict[str, KeyRow]):
+		# write to temporary file & atomic rename
+		with open(settings_file_path + '.tmp', 'w') as f:
 			f.write('# KEY_UUID\tEVENT\tENABLED\n')
-			for k, v in cls.key_settings.items():
+			for k, v in key_settings.items():
 				f.write('{}\t{}\t{}\n'.format(k, v.event, '1' if v.enabled else '0'))
+			f.flush()
+			fsync(f.fileno())
+		os_replace(settings_file_path + '.tmp', settings_file_path)
+
+	@classmethod
+	def _close_journal(cls):
+		if cls._fsync_timer:
+			cls._fsync_timer.cancel()
+			cls._fsync_timer = None
+		if cls._journal:
+			cls._journal.flush()
+			fsync(cls._journal.fileno())
+			cls._journal.close()
+			cls._journal = None
 
 
 # RfctlSettings.load()
@@ -0,0 +1,150 @@
+import re
+from math import log
+from typing import Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+CODING_PWM = 'pwm'  # pulse width: two pulse levels (space level is single or complementary)
+CODING_PULSE_DISTANCE = 'pulse-distance'  # single pulse level, two space levels
+CODING_MANCHESTER = 'manchester'  # bit times are T & 2T of pulses & spaces
+
+
+class TimingHistogram:
+	'''Log-scale histogram of bit times (µs) with incremental add & remove.
+	Bin width is BIN_RATIO of bit time, so timing clusters (levels) are runs of adjacent occupied bins
+	and they are found in O(bins) for any count of bit times: sliding window of bit times is classified
+	without sorting. Clusters are sorted by bit time.
+
+	Example:
+	histogram = TimingHistogram()
+	for x in bit_times:
+		histogram.add(x)
+	clusters = histogram.get_clusters(4)  # e.g. 2 clusters: ~340 & ~1020 µs
+	print(histogram.get_coding(bit_times, clusters))
+	'''
+
+	class Cluster(NamedTuple):
+		count: int  # bit times count
+		mean: float  # µs
+		low: int  # first bin
+		high: int  # last bin
+
+	BIN_RATIO = 1.07  # bit times ratio of adjacent bins
+	MAX_GAP_BINS = 1  # empty bins inside of cluster
+	MAX_VALUE = 0xFFFFFF  # LIRC value mask
+	BINS = int(log(MAX_VALUE) / log(BIN_RATIO)) + 1
+
+	_k = 1 / log(BIN_RATIO)
+	_cluster_re = re.compile(b'\\x01(?:\\x00{0,%d}\\x01)*' % MAX_GAP_BINS)  # run of occupied bins
+
+	def __init__(self):
+		self.counts = [0] * self.BINS
+		self.sums = [0] * self.BINS
+		self.occupied = bytearray(self.BINS)  # 1 if bin is occupied: clusters are found by regular expression
+		self.version = 0  # changed if bins are occupied or freed: clusters bins are not changed while version is same
+		self.count = 0
+		self.low, self.high = self.BINS, -1  # occupied bins range
+
+	@classmethod
+	def get_bin(cls, value: int) -> int:
+		return int(log(value) * cls._k) if value > 1 else 0
+
+	def add(self, value: int):
+		i = int(log(value) * self._k) if value > 1 else 0
+		self.counts[i] += 1
+		self.sums[i] += value
+		if not self.occupied[i]:
+			self.occupied[i] = 1
+			self.version += 1
+		self.count += 1
+		if i < self.low:
+			self.low = i
+		if i > self.high:
+			self.high = i
+
+	def remove(self, value: int):
+		'removes bit time added before'
+		counts = self.counts
+		i = int(log(value) * self._k) if value > 1 else 0
+		counts[i] -= 1
+		self.sums[i] -= value
+		self.count -= 1
+		if not counts[i]:
+			self.occupied[i] = 0
+			self.version += 1
+		if not self.count:
+			self.low, self.high = self.BINS, -1
+		elif not counts[i]:
+			# occupied bins range is shrunk
+			while not counts[self.low]:
+				self.low += 1
+			while not counts[self.high]:
+				self.high -= 1
+
+	def clear(self):
+		if self.count:
+			self.counts[self.low:self.high + 1] = [0] * (self.high + 1 - self.low)
+			self.sums[self.low:self.high + 1] = [0] * (self.high + 1 - self.low)
+			self.occupied[self.low:self.high + 1] = bytes(self.high + 1 - self.low)
+		self.version += 1
+		self.count = 0
+		self.low, self.high = self.BINS, -1
+
+	def get_spans(self, max_clusters: Optional[int] = None) -> Optional[List[Tuple[int, int]]]:
+		'''returns bins ranges (first bin, last bin + 1) of timing clusters or None if there are more than max_clusters
+		clusters; cluster of some bins has some bit times, cluster of single bin has counts[bin] bit times'''
+		ret = [x.span() for x in self._cluster_re.finditer(self.occupied, self.low, self.high + 1)]
+		if max_clusters and len(ret) > max_clusters:
+			return None
+		return ret
+
+	def get_clusters(self, max_clusters: Optional[int] = None) -> Optional[List[Cluster]]:
+		'returns timing clusters or None if there are more than max_clusters clusters'
+		if (spans := self.get_spans(max_clusters)) is None:
+			return None
+		ret = []
+		counts, sums = self.counts, self.sums
+		for low, end in spans:
+			count = sum(counts[low:end])
+			ret.append(self.Cluster(count, sum(sums[low:end]) / count, low, end - 1))
+		return ret
+
+	@classmethod
+	def get_bins(cls, ratio: float) -> float:
+		'returns bins count of bit times ratio'
+		return log(ratio) * cls._k
+
+	@classmethod
+	def get_bin_value(cls, i: int) -> float:
+		'returns minimum bit time of bin'
+		return cls.BIN_RATIO ** i
+
+	@classmethod
+	def get_levels(cls, values: Iterable[int], clusters: Sequence[Cluster]) -> List[Optional[int]]:
+		'returns cluster indexes of values (None if value is out of clusters)'
+		bins = {i: j for j, x in enumerate(clusters) for i in range(x.low, x.high + 1)}
+		k = cls._k
+		return [bins.get(int(log(x) * k) if x > 1 else 0) for x in values]
+
+	@classmethod
+	def get_coding(cls, bit_times: Sequence[int], clusters: Sequence[Cluster], k: float = .15) -> Optional[str]:
+		'''returns coding of bit times (pulse is first) by data clusters (not single bit times as sync or header):
+		PWM, pulse-distance, Manchester or None if coding is unknown; k is bits period tolerance'''
+		data = {i for i, x in enumerate(clusters) if x.count > 1}
+		indexes = cls.get_levels(bit_times, clusters)
+		pulses = {x for x in indexes[::2] if x in data}
+		spaces = {x for x in indexes[1::2] if x in data}
+		if len(pulses) == 1 and len(spaces) > 1:
+			return CODING_PULSE_DISTANCE
+		if len(pulses) > 1 and len(spaces) == 1:
+			return CODING_PWM
+		if len(pulses) == 2 and len(spaces) == 2:
+			periods = [
+				x + y for x, y, i, j in zip(bit_times[::2], bit_times[1::2], indexes[::2], indexes[1::2])
+				if i in data and j in data
+			]
+			if periods and max(periods) <= min(periods) * (1 + 2 * k):
+				# complementary pulse & space
+				return CODING_PWM
+			low, high = (clusters[x].mean for x in sorted(pulses))
+			if 2 * (1 - k) <= high / low <= 2 * (1 + k):
+				return CODING_MANCHESTER
+		return None
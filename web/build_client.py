@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+from sys import stderr, exit
+import argparse
+import ast
+import json
+from hashlib import sha256
+from os import replace as os_replace
+from os.path import join as path_join, dirname, abspath, exists
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+web_path = dirname(abspath(__file__))
+client_module = 'rfctl_web_client'
+bundle_file_name = 'rfctl_web_bundle.js'
+STDLIB_URL = 'https://github.com/brython-dev/brython/releases/tag/3.10.3'
+
+
+def read_vfs(stdlib_path: str) -> Dict[str, list]:
+	'returns modules of brython_stdlib.js virtual file system: module name: [ext, source, imports, (is package)]'
+	with open(stdlib_path, 'r', encoding='utf-8') as f:
+		buff = f.read()
+	start, end = buff.index('{', buff.index('var scripts')), buff.rindex('}') + 1
+	ret = json.loads(buff[start:end])
+	ret.pop('$timestamp', None)
+	return ret
+
+
+class ClientMinifier(ast.NodeTransformer):
+	'''Removes docstrings, comments & annotations of client module.
+	Annotations are evaluated by Brython at definition time, so "typing" module (with its imports)
+	would be loaded only for annotations; import of names not used after annotations removal is removed.'''
+
+	def visit_FunctionDef(self, node):
+		self.generic_visit(node)
+		node.returns = None
+		for x in node.args.args + node.args.kwonlyargs + node.args.posonlyargs:
+			x.annotation = None
+		if node.args.vararg:
+			node.args.vararg.annotation = None
+		if node.args.kwarg:
+			node.args.kwarg.annotation = None
+		return self._remove_docstring(node)
+
+	visit_AsyncFunctionDef = visit_FunctionDef
+
+	def visit_ClassDef(self, node):
+		self.generic_visit(node)
+		return self._remove_docstring(node)
+
+	def visit_AnnAssign(self, node):
+		if node.value is None or not node.simple:
+			return ast.Pass() if node.value is None else ast.Assign([node.target], node.value, lineno=node.lineno)
+		return ast.Assign([node.target], node.value, lineno=node.lineno)
+
+	@classmethod
+	def _remove_docstring(cls, node):
+		body = node.body
+		docstring = body[0].value if body and isinstance(body[0], ast.Expr) else None
+		if isinstance(docstring, ast.Constant) and isinstance(docstring.value, str):
+			node.body = body[1:] or [ast.Pass()]
+		return node
+
+	@classmethod
+	def remove_unused_imports(cls, tree: ast.Module, modules: Iterable[str]):
+		'removes unused names of "from <module> import" statements of modules'
+		used = {x.id for x in ast.walk(tree) if isinstance(x, ast.Name)}
+		for node in ast.walk(tree):
+			if isinstance(node, ast.ImportFrom) and node.module in modules:
+				node.names = [x for x in node.names if (x.asname or x.name) in used]
+		tree.body = [x for x in tree.body if not (isinstance(x, ast.ImportFrom) and not x.names)]
+
+
+def get_imports(tree: ast.Module) -> List[str]:
+	'returns imported modules'
+	ret = []
+	for node in ast.walk(tree):
+		if isinstance(node, ast.Import):
+			ret.extend(x.name for x in node.names)
+		elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+			ret.append(node.module)
+			ret.extend(f'{node.module}.{x.name}' for x in node.names)  # imported name can be module
+	return list(dict.fromkeys(ret))
+
+
+def minify_client(source: str) -> Tuple[str, List[str]]:
+	'returns minified client source & imported modules'
+	tree = ClientMinifier().visit(ast.parse(source))
+	ClientMinifier.remove_unused_imports(tree, ('typing',))
+	ast.fix_missing_locations(tree)
+	return ast.unparse(tree), get_imports(tree)
+
+
+def get_modules_closure(vfs: Dict[str, list], imports: Iterable[str]) -> Set[str]:
+	'returns modules of virtual file system required by imports: modules, their parent packages & imports'
+	ret, stack = set(), list(imports)
+	while stack:
+		name = stack.pop()
+		parts = name.split('.')
+		for i in range(1, len(parts) + 1):
+			x = '.'.join(parts[:i])
+			if x in vfs and x not in ret:
+				ret.add(x)
+				if vfs[x][0] == '.py':
+					stack.extend(vfs[x][2])
+	return ret
+
+
+def main():
+	with open(path_join(web_path, client_module + '.py'), 'r', encoding='utf-8') as f:
+		client_source = f.read()
+	client_hash = sha256(client_source.encode()).hexdigest()[:16]
+	source, imports = minify_client(client_source)
+	if not exists(args.stdlib):
+		print(
+			f'Brython standard library "{args.stdlib}" is not found; download brython_stdlib.js of Brython version '
+			f'of brython.js from {STDLIB_URL}', file=stderr)
+		exit(-1)
+	vfs = read_vfs(args.stdlib)
+	modules = sorted(get_modules_closure(vfs, imports))
+	scripts = {x: vfs[x] for x in modules}
+	# Brython preloads imports of module: only modules of virtual file system
+	scripts[client_module] = ['.py', source, [x for x in imports if x in scripts]]
+	scripts_json = json.dumps(scripts, separators=(',', ':'), ensure_ascii=False)
+	# VFS timestamp is version of modules precompiled by Brython to browser indexedDB cache
+	timestamp = int(sha256(scripts_json.encode()).hexdigest()[:12], 16)
+	with open(path_join(web_path, 'brython.js'), 'r', encoding='utf-8') as f:
+		brython_source = f.read()
+	bundle_path = path_join(web_path, bundle_file_name)
+	with open(bundle_path + '.tmp', 'w', encoding='utf-8') as f:
+		f.write(f'// {client_module}.py sha256: {client_hash}\n')
+		f.write(brython_source)
+		f.write('\n;__BRYTHON__.use_VFS = true;\n')
+		f.write(f'__BRYTHON__.update_VFS(Object.assign({scripts_json}, {{"$timestamp":{timestamp}}}))\n')
+	os_replace(bundle_path + '.tmp', bundle_path)
+	if args.v:
+		print(f'Client: {len(client_source)} bytes, minified: {len(source)} bytes; imports: {", ".join(imports)}')
+		print(f'Standard library modules: {len(modules)} of {len(vfs)}: {", ".join(modules)}')
+	print(f'Bundle "{bundle_path}": {len(brython_source) + len(scripts_json)} bytes')
+
+
+# process command-line
+
+def parse_args():
+	parser = argparse.ArgumentParser(
+		description='Rfctl web client bundle: brython.js, standard library modules used by client & minified client module '
+		'in one script. Client module is compiled once per bundle version (Brython indexedDB cache of browser).',
+		epilog='Example:\npython3 build_client.py -v')
+	parser.add_argument(
+		'--stdlib', metavar='BRYTHON_STDLIB_JS', default=path_join(web_path, 'brython_stdlib.js'),
+		help='Brython standard library; default: %(default)s')
+	parser.add_argument('-v', action='store_true', help='verbose')
+	return parser.parse_args()
+
+
+args = parse_args()
+
+try:
+	main()
+except KeyboardInterrupt:
+	pass
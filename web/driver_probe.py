@@ -0,0 +1,114 @@
+from threading import Timer, Lock
+from time import monotonic, time
+from typing import NamedTuple, Optional
+
+
+class DriverProbe:
+	'''rfctl kernel driver status without processes forks.
+	Module is loaded if it is listed in /proc/modules; device open count is module references
+	count (/sys/module/rfctl/refcnt). Driver requests GPIO interrupt while device is open, one
+	interrupt per sample, so /proc/interrupts counter gives read throughput & last sample time.
+	Status is refreshed by single background timer; readers get cached status. Status version is
+	changed on status change (except growing last sample age), so clients can wait for change (long-poll).
+
+	Example:
+	probe = DriverProbe()
+	probe.start()
+	if probe.status.loaded:
+		print(probe.status.samples_per_second)
+	'''
+
+	class Status(NamedTuple):
+		loaded: bool
+		opened: int  # device open count
+		samples_per_second: float
+		last_sample_age: Optional[float]  # seconds since last sample; None if there were no samples
+		interrupts: Optional[int]  # driver interrupts (samples) count; None if interrupt is not requested
+
+	PROC_MODULES, PROC_INTERRUPTS, SYS_MODULE = '/proc/modules', '/proc/interrupts', '/sys/module'
+
+	def __init__(self, module_name: str = 'rfctl', period: float = 2.):
+		self.module_name = module_name
+		self.period = period  # status refresh period, seconds
+		self.status = self.Status(False, 0, 0., None, None)
+		self.version = int(time())  # status version; incremented on status change, differs after restart
+		self._lock = Lock()
+		self._timer: Optional[Timer] = None
+		self._interrupts: Optional[int] = None
+		self._interrupts_time = monotonic()
+		self._last_sample_time: Optional[float] = None
+
+	def start(self):
+		self.refresh()
+		self._schedule()
+
+	def stop(self):
+		with self._lock:
+			if self._timer:
+				self._timer.cancel()
+				self._timer = None
+
+	def _schedule(self):
+		with self._lock:
+			self._timer = Timer(self.period, self._on_timer)
+			self._timer.daemon = True
+			self._timer.start()
+
+	def _on_timer(self):
+		try:
+			self.refresh()
+		finally:
+			if self._timer:
+				self._schedule()
+
+	def _is_loaded(self) -> bool:
+		prefix = self.module_name + ' '
+		with open(self.PROC_MODULES, 'r') as f:
+			return any(line.startswith(prefix) for line in f)
+
+	def _get_refcnt(self) -> int:
+		try:
+			with open(f'{self.SYS_MODULE}/{self.module_name}/refcnt', 'r') as f:
+				return int(f.read().strip() or 0)
+		except (OSError, ValueError):
+			return 0
+
+	def _get_interrupts(self) -> Optional[int]:
+		'returns interrupts count of driver (sum of CPUs counters) or None if interrupt is not requested'
+		with open(self.PROC_INTERRUPTS, 'r') as f:
+			cpus = len(f.readline().split())
+			for line in f:
+				fields = line.split()
+				if fields and fields[-1] == self.module_name:
+					return sum(int(x) for x in fields[1:cpus + 1] if x.isdigit())
+		return None
+
+	@classmethod
+	def _get_state(cls, status: Status) -> tuple:
+		'returns status fields of status version'
+		return status.loaded, status.opened, round(status.samples_per_second), status.interrupts
+
+	def refresh(self) -> Status:
+		now = monotonic()
+		try:
+			loaded = self._is_loaded()
+			interrupts = self._get_interrupts() if loaded else None
+		except OSError:
+			loaded, interrupts = False, None
+		samples_per_second = 0.
+		if interrupts is not None and self._interrupts is not None and interrupts >= self._interrupts:
+			if interrupts > self._interrupts:
+				samples_per_second = (interrupts - self._interrupts) / (now - self._interrupts_time)
+				self._last_sample_time = now
+		self._interrupts, self._interrupts_time = interrupts, now
+		status = self.Status(
+			loaded,
+			self._get_refcnt() if loaded else 0,
+			samples_per_second,
+			None if self._last_sample_time is None else now - self._last_sample_time,
+			interrupts
+		)
+		if self._get_state(status) != self._get_state(self.status):
+			self.version += 1
+		self.status = status
+		return self.status
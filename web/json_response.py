@@ -0,0 +1,46 @@
+import json
+from typing import Iterable, Iterator
+try:
+	import orjson
+except ImportError:
+	orjson = None  # json module is used
+
+
+class JsonResponse:
+	'''JSON of API responses: strings are escaped by encoder (quotes, backslashes, control characters),
+	so response is valid JSON for any key description or command output.
+	Lists are streamed by chunks (see iter_list()): large response is started at once & memory is bounded by chunk.
+	orjson is used if it is installed, otherwise json module.
+
+	Example:
+	@route('/api/keys')
+	def api_keys():
+		response.content_type = 'application/json'
+		return JsonResponse.iter_list({'key': x.name, 'desc': x.desc} for x in keys_catalogue.iter_query())
+	'''
+
+	CHUNK_SIZE = 16384  # bytes; streamed chunk size
+
+	_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+	@classmethod
+	def dumps(cls, obj) -> bytes:
+		'returns JSON of object: dicts, lists, strings, numbers, booleans & None'
+		if orjson:
+			return orjson.dumps(obj)
+		return cls._encoder.encode(obj).encode()
+
+	@classmethod
+	def iter_list(cls, items: Iterable) -> Iterator[bytes]:
+		'returns JSON list of items by chunks; items are encoded when chunk is read (route handler returns generator)'
+		buff, size, separator = [b'['], 1, b''
+		for x in items:
+			buff.append(separator)
+			buff.append(item := cls.dumps(x))
+			size += len(item) + 1
+			separator = b','
+			if size >= cls.CHUNK_SIZE:
+				yield b''.join(buff)
+				buff, size = [], 0
+		buff.append(b']')
+		yield b''.join(buff)
@@ -0,0 +1,153 @@
+import sqlite3
+from glob import glob
+from os import stat as os_stat
+from os.path import join as path_join, basename, splitext
+from threading import local, Lock
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+
+class KeysCatalogue:
+	'''Keys catalogue: .key files metadata & keys settings in SQLite database (WAL mode).
+	Catalogue imports .key files (re-imported when keys path is changed) & keys settings,
+	so keys filtering, sorting & pagination are indexed queries. Name filter & date time filter are
+	prefixes (name filter is glob "<prefix>*" of .key files), matched as index ranges.
+
+	Example:
+	catalogue = KeysCatalogue('rfctl_keys.db', './keys')
+	catalogue.sync_settings(RfctlSettings.key_settings)
+	for key in catalogue.query(filter_name='0cc1', sort_dt='up', start=0, count=50):
+		print(key.name, key.dt, key.desc)
+	'''
+
+	class Key(NamedTuple):
+		name: str
+		dt: str
+		desc: str
+		event: str
+		enabled: bool
+
+	SCHEMA = (
+		'CREATE TABLE IF NOT EXISTS keys '
+		'(name TEXT PRIMARY KEY, dt TEXT, desc TEXT, event TEXT, enabled INTEGER, mtime REAL)',
+		'CREATE INDEX IF NOT EXISTS keys_dt ON keys (dt)',
+		'CREATE INDEX IF NOT EXISTS keys_desc ON keys (desc)',
+		'CREATE INDEX IF NOT EXISTS keys_event ON keys (event)',
+		'CREATE INDEX IF NOT EXISTS keys_enabled ON keys (enabled)',
+	)
+
+	def __init__(self, db_path: str, keys_path: str):
+		self.db_path, self.keys_path = db_path, keys_path
+		self._local = local()  # connection per thread
+		self._sync_lock = Lock()
+		self._keys_path_mtime = None
+		with self.connection as db:
+			db.execute('PRAGMA journal_mode=WAL')
+			for x in self.SCHEMA:
+				db.execute(x)
+		self.sync_files()
+
+	@property
+	def connection(self) -> sqlite3.Connection:
+		if (ret := getattr(self._local, 'connection', None)) is None:
+			ret = self._local.connection = sqlite3.connect(self.db_path, timeout=10)
+			ret.execute('PRAGMA synchronous=NORMAL')
+		return ret
+
+	@classmethod
+	def read_key_file_header(cls, file_path: str) -> tuple:
+		'returns key date time & description of .key file'
+		key_dt, key_desc = '', ''
+		with open(file_path, 'r') as f:
+			for line in f:
+				if line.startswith('#@'):
+					key_dt = line[2:30].strip()
+				elif line.startswith('#!desc='):
+					key_desc = line[7:].strip()
+				elif not line.startswith('#'):
+					break
+		return key_dt, key_desc
+
+	def sync_files(self, force: bool = False):
+		'imports new & changed .key files, removes keys of deleted files; skipped if keys path is not changed'
+		with self._sync_lock:
+			try:
+				keys_path_mtime = os_stat(self.keys_path).st_mtime
+			except FileNotFoundError:
+				keys_path_mtime = None
+			if not force and keys_path_mtime == self._keys_path_mtime:
+				return
+			self._keys_path_mtime = keys_path_mtime
+			with self.connection as db:
+				known = dict(db.execute('SELECT name, mtime FROM keys'))
+				for fpath in glob(path_join(self.keys_path, '*.key')):
+					name, mtime = splitext(basename(fpath))[0], os_stat(fpath).st_mtime
+					if known.pop(name, None) != mtime:
+						self._import_file(db, name, fpath, mtime)
+				db.executemany('DELETE FROM keys WHERE name=?', ((x,) for x in known))
+
+	def _import_file(self, db: sqlite3.Connection, name: str, fpath: str, mtime: float):
+		key_dt, key_desc = self.read_key_file_header(fpath)
+		db.execute(
+			'INSERT INTO keys (name, dt, desc, event, enabled, mtime) VALUES (?, ?, ?, \'\', 0, ?) '
+			'ON CONFLICT(name) DO UPDATE SET dt=excluded.dt, desc=excluded.desc, mtime=excluded.mtime',
+			(name, key_dt, key_desc, mtime))
+
+	def add_file(self, fpath: str):
+		with self.connection as db:
+			self._import_file(db, splitext(basename(fpath))[0], fpath, os_stat(fpath).st_mtime)
+
+	def delete(self, names: Iterable[str]):
+		with self.connection as db:
+			db.executemany('DELETE FROM keys WHERE name=?', ((x,) for x in names))
+
+	def sync_settings(self, key_settings: Dict[str, object]):
+		'imports keys settings (see RfctlSettings.key_settings)'
+		with self.connection as db:
+			db.execute('UPDATE keys SET event=\'\', enabled=0')
+			db.executemany(
+				'UPDATE keys SET event=?, enabled=? WHERE name=?',
+				((v.event, int(v.enabled), k) for k, v in key_settings.items()))
+
+	def set_settings(self, names: Iterable[str], event: Optional[str] = None, enabled: Optional[bool] = None):
+		with self.connection as db:
+			if event is not None:
+				db.executemany('UPDATE keys SET event=? WHERE name=?', ((event, x) for x in names))
+			if enabled is not None:
+				db.executemany('UPDATE keys SET enabled=? WHERE name=?', ((int(enabled), x) for x in names))
+
+	@staticmethod
+	def _get_prefix_range(column: str, prefix: str) -> tuple:
+		# prefix match as range of column index (text is compared by UTF-8 bytes, so order is order of code points)
+		return f'{column} >= ? AND {column} < ?', (prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1))
+
+	def _get_where(self, filter_name: Optional[str], filter_dt: Optional[str]) -> tuple:
+		conditions, params = [], ()
+		for column, prefix in (('name', filter_name), ('dt', filter_dt)):
+			if prefix:
+				condition, range_params = self._get_prefix_range(column, prefix)
+				conditions.append(condition)
+				params += range_params
+		return (' WHERE ' + ' AND '.join(conditions) if conditions else ''), params
+
+	def count(self, filter_name: Optional[str] = None, filter_dt: Optional[str] = None) -> int:
+		self.sync_files()
+		where, params = self._get_where(filter_name, filter_dt)
+		return self.connection.execute('SELECT count(*) FROM keys' + where, params).fetchone()[0]
+
+	def iter_query(
+			self, filter_name: Optional[str] = None, sort_name: Optional[str] = 'down', sort_dt: Optional[str] = None,
+			start: int = 0, count: int = 50, filter_dt: Optional[str] = None) -> Iterator[Key]:
+		'returns iterator of keys filtered by name & date time prefixes, sorted by name or date time ("up": descending)'
+		self.sync_files()
+		where, params = self._get_where(filter_name, filter_dt)
+		order = 'dt {0}, name {0}'.format('DESC' if sort_dt == 'up' else 'ASC') if sort_dt else \
+			'name {}'.format('DESC' if sort_name == 'up' else 'ASC')
+		query = f'SELECT name, dt, desc, event, enabled FROM keys{where} ORDER BY {order} LIMIT ? OFFSET ?'
+		for name, dt, desc, event, enabled in self.connection.execute(query, params + (count, start)):
+			yield self.Key(name, dt, desc, event, bool(enabled))
+
+	def query(
+			self, filter_name: Optional[str] = None, sort_name: Optional[str] = 'down', sort_dt: Optional[str] = None,
+			start: int = 0, count: int = 50, filter_dt: Optional[str] = None) -> List[Key]:
+		'returns keys filtered by name & date time prefixes, sorted by name or date time ("up" is descending order)'
+		return list(self.iter_query(filter_name, sort_name, sort_dt, start, count, filter_dt))
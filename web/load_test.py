@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+from sys import stderr
+import argparse
+from threading import Thread
+from time import monotonic, sleep
+from http.client import HTTPConnection
+from urllib.parse import urlsplit
+from statistics import quantiles
+from typing import List, Tuple
+
+
+# request mixes of clients: browser loads page (with client bundle) & polls status; M2M client calls API only
+BROWSER_PATHS = (
+	'/', '/static/rfctl_web_client.css', '/static/rfctl_web_bundle.js', '/api/status', '/api/keys_history?l=5')
+M2M_PATHS = ('/api/keys?l=50', '/api/status', '/api/keys_history?l=50', '/api/uname')
+
+
+def client(url: str, paths: Tuple[str, ...], end_time: float, results: List[Tuple[float, int]], period: float):
+	# sends requests one by one till end time; result is tuple of latency (s) & status (0 if connection error)
+	address = urlsplit(url)
+	i = 0
+	while (start_time := monotonic()) < end_time:
+		try:
+			conn = HTTPConnection(address.hostname, address.port or 80, timeout=30)
+			conn.request('GET', paths[i % len(paths)])
+			resp = conn.getresponse()
+			resp.read()
+			conn.close()
+			results.append((monotonic() - start_time, resp.status))
+		except OSError:
+			results.append((monotonic() - start_time, 0))
+		i += 1
+		if period:
+			sleep(period)
+
+
+def main():
+	results: List[Tuple[float, int]] = []
+	end_time = monotonic() + args.t
+	clients = [
+		Thread(target=client, args=(args.url, BROWSER_PATHS, end_time, results, args.p), daemon=True)
+		for _ in range(args.b)
+	] + [
+		Thread(target=client, args=(args.url, M2M_PATHS, end_time, results, 0), daemon=True)
+		for _ in range(args.m)
+	]
+	start_time = monotonic()
+	for x in clients:
+		x.start()
+	for x in clients:
+		x.join()
+	duration = monotonic() - start_time
+	if len(results) < 2:
+		print('Not enough requests', file=stderr)
+		return
+	latencies = [x[0] * 1000 for x in results]
+	q = quantiles(latencies, n=100)
+	print(f'clients: {args.b} browsers, {args.m} M2M; duration: {duration:.1f} s')
+	print(f'requests: {len(results)}; errors: {sum(1 for x in results if not 200 <= x[1] < 400)}')
+	print(f'requests/s: {len(results) / duration:.1f}')
+	print(f'latency, ms: p50={q[49]:.1f} p90={q[89]:.1f} p99={q[98]:.1f} max={max(latencies):.1f}')
+
+
+# process command-line
+
+def parse_args():
+	parser = argparse.ArgumentParser(
+		description='Rfctl web server load test: concurrent browsers & M2M clients. Prints requests/s & latency quantiles.',
+		epilog='Example:\npython3 load_test.py -b 10 -m 4 -t 30 http://orangepi:8080')
+	parser.add_argument(
+		'url', metavar='URL', nargs='?', default='http://127.0.0.1:8080', help='Web server URL; default: %(default)s')
+	parser.add_argument('-b', metavar='BROWSERS', default=8, type=int, help='Browser clients count; default: %(default)s')
+	parser.add_argument('-m', metavar='M2M', default=2, type=int, help='M2M clients count; default: %(default)s')
+	parser.add_argument('-t', metavar='SECONDS', default=10., type=float, help='Test duration; default: %(default)s')
+	parser.add_argument(
+		'-p', metavar='SECONDS', default=.1, type=float, help='Browser client pause between requests; default: %(default)s')
+	return parser.parse_args()
+
+
+args = parse_args()
+
+try:
+	main()
+except KeyboardInterrupt:
+	pass
@@ -0,0 +1,52 @@
+from threading import Lock
+from time import monotonic, sleep
+from typing import Callable, Optional
+
+
+class LongPoll:
+	'''Long-poll of API resource: request with "since" (resource version of client) & "wait" (seconds)
+	is answered when resource version differs from client version or wait time is over.
+	Version is polled by waiting request thread, so version function must be cheap (counter, last record
+	of file...). Waiting request holds server thread: waiting requests count is limited, over limit
+	(or with max_waiters = 0: single thread server) long-poll is not available & client refreshes periodically.
+
+	Example:
+	status_poll = LongPoll(lambda: driver_probe.version, max_waiters=2)
+
+	@route('/api/status')
+	def api_status():
+		version = status_poll.wait(request.params.get('since', type=int), request.params.get('wait', type=float))
+		if version is not None:
+			response.set_header('X-Version', str(version))
+		...
+	'''
+
+	MAX_WAIT = 30.  # seconds; server stop waits for waiting requests
+
+	def __init__(self, get_version: Callable[[], object], period: float = .5, max_waiters: int = 0):
+		self.get_version = get_version
+		self.period = period  # version poll period, seconds
+		self.max_waiters = max_waiters
+		self.waiters = 0
+		self._lock = Lock()
+
+	def wait(self, since: Optional[object], wait: Optional[float]):
+		'waits for version other than since at most wait seconds; returns version or None if long-poll is not available'
+		if not self.max_waiters:
+			return None
+		version = self.get_version()
+		if since is None or not wait or version != since:
+			return version
+		with self._lock:
+			if self.waiters >= self.max_waiters:
+				return None
+			self.waiters += 1
+		try:
+			end_time = monotonic() + min(wait, self.MAX_WAIT)
+			while version == since and monotonic() < end_time:
+				sleep(self.period)
+				version = self.get_version()
+		finally:
+			with self._lock:
+				self.waiters -= 1
+		return version
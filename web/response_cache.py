@@ -0,0 +1,100 @@
+from collections import OrderedDict
+from functools import wraps
+from hashlib import sha1
+from time import monotonic
+from threading import Lock
+from typing import NamedTuple, Optional, Union
+from bottle import request, response
+
+
+class ResponseCache:
+	'''Route handlers responses cache with time to live & ETag.
+	Response is cached per URL (path & query) for TTL seconds; cached responses have
+	ETag header, so client revalidation (If-None-Match) is answered by 304 Not Modified.
+	Cache is LRU of at most MAX_ENTRIES responses & expired entries are pruned, so requests
+	with random query strings do not grow server memory.
+
+	Example:
+	response_cache = ResponseCache()
+
+	@route('/api/uname')
+	@response_cache(ttl=3600)
+	def api_uname():
+		...
+	'''
+
+	class Entry(NamedTuple):
+		expire_time: float
+		body: bytes
+		etag: str
+		content_type: str
+
+	MAX_ENTRIES = 256
+
+	def __init__(self):
+		self.entries: 'OrderedDict[str, ResponseCache.Entry]' = OrderedDict()
+		self._lock = Lock()
+
+	def _get(self, key: str) -> Optional[Entry]:
+		with self._lock:
+			if (entry := self.entries.get(key)) is not None:
+				if entry.expire_time < monotonic():
+					del self.entries[key]
+					return None
+				self.entries.move_to_end(key)
+			return entry
+
+	def _put(self, key: str, entry: Entry):
+		with self._lock:
+			self.entries[key] = entry
+			self.entries.move_to_end(key)
+			now = monotonic()
+			for x in [k for k, v in self.entries.items() if v.expire_time < now]:
+				del self.entries[x]
+			while len(self.entries) > self.MAX_ENTRIES:
+				self.entries.popitem(last=False)
+
+	def __call__(self, ttl: float):
+		'route handler decorator; ttl is time to live, seconds'
+
+		def cache_decorator(fun):
+
+			@wraps(fun)
+			def cache_wrapper(*args, **kwargs):
+				key = request.fullpath + '?' + request.query_string
+				if (entry := self._get(key)) is None:
+					body = fun(*args, **kwargs)
+					if response.status_code != 200 or not isinstance(body, (str, bytes)):
+						# errors & streams are not cached
+						return body
+					body = body.encode() if isinstance(body, str) else body
+					entry = self.Entry(monotonic() + ttl, body, self.get_etag(body), response.content_type)
+					self._put(key, entry)
+				if entry.content_type:
+					response.content_type = entry.content_type
+				return self.check_etag(entry.body, entry.etag)
+
+			return cache_wrapper
+
+		return cache_decorator
+
+	@classmethod
+	def get_etag(cls, body: bytes) -> str:
+		return '"{}"'.format(sha1(body).hexdigest())
+
+	@classmethod
+	def check_etag(cls, body: Union[str, bytes], etag: Optional[str] = None) -> bytes:
+		'''sets ETag header of response; returns body or empty body of 304 Not Modified if client has the same
+		body (If-None-Match). Used also by not cached route handlers: client revalidation costs no body transfer.'''
+		body = body.encode() if isinstance(body, str) else body
+		etag = etag or cls.get_etag(body)
+		response.set_header('ETag', etag)
+		response.set_header('Cache-Control', 'no-cache')  # client revalidates by ETag
+		if (check := request.get_header('If-None-Match')) and (check == '*' or etag in check):
+			response.status = 304
+			return b''
+		return body
+
+	def clear(self):
+		with self._lock:
+			self.entries.clear()
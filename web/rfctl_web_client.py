@@ -2,6 +2,7 @@ from typing import List, Optional, Dict, Iterable
 from browser import document as doc, window, ajax, timer, bind, html
 from browser.widgets.dialog import Dialog, InfoDialog
 import urllib.parse
+import json
 
 
 class Rfctl:
@@ -20,16 +21,69 @@ class Rfctl:
 			'&'.join(('{}={}'.format(k, urllib.parse.quote(str(v))) for k, v in {**args, **args2}.items()))
 		)
 
+	class BatchAnswer:
+		'sub-request answer of batch request (/api/batch) with ajax answer attributes: status, headers, text & json'
+
+		def __init__(self, answer: dict):
+			self.status = answer.get('status', 0)
+			self.headers = {k.lower(): v for k, v in (answer.get('headers') or {}).items()}
+			self.body = answer.get('body')
+			self.text = self.body if isinstance(self.body, str) or self.body is None else json.dumps(self.body)
+
+		@property
+		def json(self):
+			if self.body is None or not self.headers.get('content-type', '').startswith('application/json'):
+				raise ValueError('Answer is not JSON')
+			return self.body
+
+	api_calls_batch: List[tuple] = []  # API calls of current tick: url, callback & headers
+
+	def send_api_call(url: str, callback, headers: Dict[str, str] = {}):
+		'sends API GET request; requests of the same tick are sent by one batch request'
+		if not Rfctl.api_calls_batch:
+			timer.set_timeout(Rfctl.send_api_calls_batch, 0)
+		Rfctl.api_calls_batch.append((url, callback, headers))
+
+	def send_api_calls_batch():
+		calls, Rfctl.api_calls_batch = Rfctl.api_calls_batch, []
+
+		def send(url: str, callback, headers: Dict[str, str]):
+			req = ajax.ajax()
+			req.bind('complete', callback)
+			req.open('GET', url, True)
+			for k, v in headers.items():
+				req.set_header(k, v)
+			req.send()
+
+		def batch_ready(req):
+			try:
+				answers = req.json if req.status == 200 else None
+			except Exception:
+				answers = None
+			if answers is None or len(answers) != len(calls):
+				# server without batch API or error: separate requests
+				for x in calls:
+					send(*x)
+				return
+			for (url, callback, headers), answer in zip(calls, answers):
+				callback(Rfctl.BatchAnswer(answer))
+
+		if len(calls) == 1:
+			send(*calls[0])
+			return
+		req = ajax.ajax()
+		req.bind('complete', batch_ready)
+		req.open('POST', '/api/batch', True)
+		req.set_header('Content-Type', 'application/json')
+		req.send(json.dumps([{'url': url, 'headers': headers} for url, callback, headers in calls]))
+
 	def api_call(url: str, args: Dict[str, str] = {}):
-		'API call decorator'
+		'API call decorator; calls of the same tick are coalesced to batch request'
 
 		def api_call_decorator(fun):
 
 			def api_call_wrapper(args2: Dict[str, str] = {}):
-				req = ajax.ajax()
-				req.bind('complete', fun)
-				req.open('GET', Rfctl.build_url(url, args, args2), True)
-				req.send()
+				Rfctl.send_api_call(Rfctl.build_url(url, args, args2), fun)
 			
 			return api_call_wrapper
 
@@ -49,6 +103,14 @@ class Rfctl:
 		if 'about' not in exclude_menu:
 			header_menu <= html.SPAN('&nbsp;&nbsp;') + html.A('About', href='/about')
 
+	def page_loaded():
+		'reports page load time: navigation start till page is built'
+		ms = window.performance.now()
+		window.console.log(f'Page load: {ms:.0f} ms')
+		req = ajax.ajax()
+		req.open('GET', Rfctl.build_url('/api/page_load', {'ms': f'{ms:.0f}'}, {}), True)
+		req.send()
+
 	api_calls: List['ApiCallTimeRefresh'] = []
 
 	@classmethod
@@ -58,6 +120,12 @@ class Rfctl:
 				return x
 
 	class ApiCallTimeRefresh:
+		'''API call refreshed every period seconds.
+		Request has If-None-Match (ETag of last response), so not changed response is 304 Not Modified without body.
+		If API answers with resource version (X-Version header), next request is long-poll: "since=<version>&wait=30"
+		is answered by server on change, so updates are shown at once & idle page makes request per wait time.'''
+
+		LONG_POLL_WAIT = 30  # seconds
 
 		def __init__(self, api_address: str, name: Optional[str] = None, ui_element_id: Optional[str] = None,
 				args: Optional[Dict[str, str]] = None, period=5, autostart=True):
@@ -68,27 +136,58 @@ class Rfctl:
 			self.args = args
 			self.args2: Optional[Dict[str, str]] = None
 			self.rest_timer = None
+			self.etag: Optional[str] = None
+			self.version: Optional[str] = None  # resource version of long-poll
+			self.since: Optional[str] = None  # resource version of current request
 			Rfctl.api_calls.append(self)
 			if autostart:
 				self.start()
 
+		def get_header(self, req, name: str) -> Optional[str]:
+			try:
+				return req.headers.get(name.lower()) or req.headers.get(name)
+			except Exception:
+				return None
+
 		def read(self, req):
-			self.ready(req)
+			if req.status == 304:
+				# not modified: long-poll wait time is over or period refresh without changes;
+				# without X-Version long-poll is refused (server waiters limit): period refresh
+				self.version = self.get_header(req, 'X-Version')
+			elif req.status == 200:
+				self.etag = self.get_header(req, 'ETag')
+				self.version = self.get_header(req, 'X-Version')
+				self.ready(req)
+			else:
+				self.etag, self.version = None, None
+				self.ready(req)
 			if self.rest_timer:
 				timer.clear_timeout(self.rest_timer)
-			if self.period:
+			if self.version is not None and req.status in (200, 304):
+				self.rest_timer = timer.set_timeout(self.rest_refresh, 0)
+			elif self.period:
 				self.rest_timer = timer.set_timeout(self.rest_refresh, self.period * 1000)
 
 		def rest_refresh(self):
 			if self.rest_timer:
 				timer.clear_timeout(self.rest_timer)
+			self.since = self.version
+			headers = {'If-None-Match': self.etag} if self.etag else {}
+			if self.version is None:
+				Rfctl.send_api_call(Rfctl.build_url(self.api_address, self.args, self.args2 or {}), self.read, headers)
+				return
+			# long-poll request is not batched: batch is answered after all sub-requests
 			req = ajax.ajax()
 			req.bind('complete', self.read)
-			req.open('GET', Rfctl.build_url(self.api_address, self.args, self.args2), True)
+			req.open('GET', Rfctl.build_url(
+				self.api_address, self.args, {**(self.args2 or {}), 'since': self.version, 'wait': self.LONG_POLL_WAIT}), True)
+			for k, v in headers.items():
+				req.set_header(k, v)
 			req.send()
 
 		def start(self, args: Optional[Dict[str, str]] = {}):
 			self.args2 = args
+			self.etag, self.version = None, None
 			self.rest_refresh()
 
 		def stop(self):
@@ -117,14 +216,19 @@ def build_page_main():
 				)
 
 	class KeysHistory(Rfctl.ApiCallTimeRefresh):
+		keys: List[dict] = []  # shown keys
+
 		def ready(self, api_answer):
 			try:
 				data = api_answer.json
 			except Exception:
 				return
+			# long-poll answer has keys detected after version
+			self.keys = (self.keys + data if self.since is not None else data)[-int(self.args['l']):]
 			doc[self.ui_element_id].innerHTML = ''
-			for k in data:
-				doc[self.ui_element_id] <= html.P(k['key'])
+			for k in reversed(self.keys):
+				doc[self.ui_element_id] <= html.P('{} {}'.format(
+					window.Date.new(k['time'] * 1000).toLocaleString(), k['key']))
 
 	# page content
 
@@ -132,12 +236,12 @@ def build_page_main():
 
 	main = html.MAIN(role='main')
 	main <= html.H4(id='status')
-	# main <= html.H4('Keys history:')
-	# main <= html.P(id='keys_history')
+	main <= html.H4('Keys history:')
+	main <= html.P(id='keys_history')
 	doc <= main
 
 	Status('/api/status', 'Status', 'status')
-	# KeysHistory('/api/keys_history', 'Keys history', 'keys_history', {'l': 5})
+	KeysHistory('/api/keys_history', 'Keys history', 'keys_history', {'l': 5})
 
 
 Rfctl.build_page_main = build_page_main
@@ -156,12 +260,9 @@ def build_page_keys():
 			return
 		if data['code'] == 0:
 			# key deleted # remove key from keys table
-			if (key_name := getattr(Rfctl, 'del_key_name', None)):
-				keys_table = doc['keys_table_body']
-				for i, r in enumerate(keys_table.rows):
-					if r.cells[0].textContent == key_name:
-						keys_table.deleteRow(i)
-						break
+			if getattr(Rfctl, 'del_key_name', None):
+				# cached keys pages are outdated
+				Rfctl.keys_view.clear()
 				Rfctl.del_key_name = None
 		else:
 			d = Dialog(' Key delete error ')
@@ -175,57 +276,209 @@ def build_page_keys():
 
 	window.key_del = key_del
 
-	# keys sorting functions
-
-	@Rfctl.api_call('/api/keys')
-	def get_keys(api_answer: ajax):
-		try:
-			data = api_answer.json
-		except Exception:
-			Rfctl.show_error('Can\'t get keys')
-			return
-		keys_table = doc['keys_table_body']
-		# clear keys table
-		while any(keys_table.rows):
-			keys_table.deleteRow(0)
-		# fill keys table from answer
-		for k in data:
-			keys_table <= html.TR(
-				html.TD(k['key'], Class='keys_table_name')
-				+ html.TD(k['dt'], Class='keys_table_dt')
-				+ html.TD(k['desc'], Class='keys_table_name')
-				+ html.TD(k.get('event'))
-				+ html.TD(html.INPUT(type='checkbox', checked=bool(k.get('enabled'))))
-				# + html.TD(
-				# 	html.BUTTON('🗑', style={'background-color': 'salmon'}, onclick='window.key_del("{}")'.format(k['key'])) +
-				# 	html.BUTTON('Disable'), Class='keys_table_control'
-				, Class='keys_table_row')
-
-	def keys_list(args):
-		if (f := doc['keys_name_filter'].value):
-			args['filter_name'] = f
-		get_keys(args)  # send Ajax request
+	# keys table functions
+
+	class KeysView:
+		'''Virtualized keys table: only rows of visible range are rendered.
+		Keys pages are fetched on scroll & cached per query (filter & sort); if all keys of filter are
+		cached, other sort is made by client without requests.'''
+
+		PAGE_SIZE = 100  # keys count of API call
+		ROW_HEIGHT = 24  # px; see .keys_table_row style
+		OVERSCAN = 10  # rows rendered above & below visible range
+
+		def __init__(self):
+			self.filter_name, self.sort_name, self.sort_dt = '', 'down', None
+			self.queries: Dict[tuple, dict] = {}  # query key: total count, pages (page index: keys), loading pages
+			self.selected = set()  # selected keys names of bulk operation
+			self.render_requested = False
+
+		def get_query(self, filter_name: str, sort_name: Optional[str], sort_dt: Optional[str]) -> dict:
+			key = (filter_name, sort_name, sort_dt)
+			if (ret := self.queries.get(key)) is None:
+				args = {'sort_dt': sort_dt} if sort_dt else {'sort_name': sort_name}
+				if filter_name:
+					args['filter_name'] = filter_name
+				ret = self.queries[key] = {'args': args, 'total': None, 'pages': {}, 'loading': set()}
+				self.sort_cached(filter_name, sort_name, sort_dt, ret)
+			return ret
+
+		def sort_cached(self, filter_name: str, sort_name: Optional[str], sort_dt: Optional[str], query: dict):
+			# fills query pages by sorting of all keys of filter cached by other query
+			for (f, _, _), x in self.queries.items():
+				if x is query or f != filter_name or x['total'] is None:
+					continue
+				if sum(len(p) for p in x['pages'].values()) == x['total']:
+					keys = [k for i in sorted(x['pages']) for k in x['pages'][i]]
+					if sort_dt:
+						keys.sort(key=lambda k: (k['dt'], k['key']), reverse=sort_dt == 'up')
+					else:
+						keys.sort(key=lambda k: k['key'], reverse=sort_name == 'up')
+					query['total'] = x['total']
+					query['pages'] = {
+						i // self.PAGE_SIZE: keys[i:i + self.PAGE_SIZE] for i in range(0, len(keys), self.PAGE_SIZE)
+					}
+					return
+
+		@property
+		def query(self) -> dict:
+			return self.get_query(self.filter_name, self.sort_name, self.sort_dt)
+
+		def set_query(self, filter_name: str, sort_name: Optional[str], sort_dt: Optional[str]):
+			self.filter_name, self.sort_name, self.sort_dt = filter_name, sort_name, sort_dt
+			doc['keys_table_view'].scrollTop = 0
+			self.request_render()
+
+		def clear(self):
+			self.queries.clear()
+			self.request_render()
+
+		def fetch_page(self, query: dict, page: int):
+			query['loading'].add(page)
+
+			def page_ready(req):
+				query['loading'].discard(page)
+				try:
+					data = req.json
+				except Exception:
+					Rfctl.show_error('Can\'t get keys')
+					return
+				try:
+					total = req.headers.get('x-total-count') or req.headers.get('X-Total-Count')
+				except Exception:
+					total = None
+				if total:
+					query['total'] = int(total)
+				else:
+					# next page is expected after full page
+					query['total'] = max(
+						query['total'] or 0,
+						page * self.PAGE_SIZE + len(data) + (self.PAGE_SIZE if len(data) == self.PAGE_SIZE else 0))
+				query['pages'][page] = data
+				self.request_render()
+
+			# visible pages are fetched by one batch request
+			Rfctl.send_api_call(
+				Rfctl.build_url('/api/keys', query['args'], {'s': page * self.PAGE_SIZE, 'l': self.PAGE_SIZE}), page_ready)
+
+		def request_render(self, *args):
+			# rendering once per animation frame
+			if not self.render_requested:
+				self.render_requested = True
+				window.requestAnimationFrame(self.render)
+
+		@classmethod
+		def escape(cls, buff) -> str:
+			return str(buff or '').replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
+
+		def get_row(self, i: int, k: Optional[dict]) -> str:
+			row_class = 'keys_table_row keys_table_row_even' if i % 2 else 'keys_table_row'
+			if k is None:
+				return f'<tr class="{row_class}"><td colspan="6">⚙</td></tr>'
+			name = self.escape(k['key'])
+			return (
+				f'<tr class="{row_class}"><td class="keys_table_control"><input type="checkbox"'
+				f'{" checked" if k["key"] in self.selected else ""} onclick="window.key_select(\'{name}\', this.checked)"></td>'
+				f'<td class="keys_table_name">{name}</td>'
+				f'<td class="keys_table_dt">{self.escape(k["dt"])}</td><td class="keys_table_name">{self.escape(k["desc"])}</td>'
+				f'<td>{self.escape(k.get("event"))}</td>'
+				f'<td><input type="checkbox"{" checked" if k.get("enabled") else ""}></td></tr>'
+			)
+
+		def render(self, *args):
+			self.render_requested = False
+			query, view = self.query, doc['keys_table_view']
+			if query['total'] is None:
+				if 0 not in query['loading']:
+					self.fetch_page(query, 0)
+				return
+			total, row_height = query['total'], self.ROW_HEIGHT
+			first = max(0, int(view.scrollTop // row_height) - self.OVERSCAN)
+			last = min(total, int((view.scrollTop + view.clientHeight) // row_height) + 1 + self.OVERSCAN)
+			# fetch pages of visible range
+			pages = query['pages']
+			for page in range(first // self.PAGE_SIZE, (last - 1) // self.PAGE_SIZE + 1):
+				if page not in pages and page not in query['loading']:
+					self.fetch_page(query, page)
+			rows = []
+			if first:
+				rows.append(f'<tr style="height:{first * row_height}px"></tr>')
+			for i in range(first, last):
+				page_keys, j = pages.get(i // self.PAGE_SIZE), i % self.PAGE_SIZE
+				rows.append(self.get_row(i, page_keys[j] if page_keys and j < len(page_keys) else None))
+			if last < total:
+				rows.append(f'<tr style="height:{(total - last) * row_height}px"></tr>')
+			doc['keys_table_body'].innerHTML = ''.join(rows)
+			doc['keys_table_caption'].text = f'Keys list: {total}'
+
+	keys_view = KeysView()
+	Rfctl.keys_view = keys_view
 
 	def keys_sort_name(sort_dir: str):
-		keys_list({'sort_name': sort_dir})
+		keys_view.set_query(doc['keys_name_filter'].value, sort_dir, None)
 
 	window.keys_sort_name = keys_sort_name
 
 	def keys_sort_dt(sort_dir: str):
-		keys_list({'sort_dt': sort_dir})
+		keys_view.set_query(doc['keys_name_filter'].value, None, sort_dir)
 
 	window.keys_sort_dt = keys_sort_dt
 
+	# keys bulk operation functions
+
+	def key_select(key_name: str, checked: bool):
+		if checked:
+			keys_view.selected.add(key_name)
+		else:
+			keys_view.selected.discard(key_name)
+		doc['keys_bulk_count'].text = f'Selected: {len(keys_view.selected)}'
+
+	window.key_select = key_select
+
+	def keys_bulk(op: str):
+		'''sends operation of selected keys by one request: delete, enable, disable or event (sets event)'''
+		if not keys_view.selected or op == 'delete' and not window.confirm(f'Delete {len(keys_view.selected)} keys?'):
+			return
+		args = {'op': 'delete' if op == 'delete' else 'set', 'keys': sorted(keys_view.selected)}
+		if op in ('enable', 'disable'):
+			args['enabled'] = op == 'enable'
+		elif op == 'event':
+			args['event'] = doc['keys_bulk_event'].value
+
+		def bulk_ready(req):
+			try:
+				data = req.json
+			except Exception:
+				Rfctl.show_error('Can\'t change keys')
+				return
+			if data['code']:
+				d = Dialog(' Keys operation error ')
+				d.panel <= html.P(f'Code = {data["code"]}')
+				d.panel <= html.P(f'{data["output"]}')
+			keys_view.selected.clear()
+			doc['keys_bulk_count'].text = 'Selected: 0'
+			# cached keys pages are outdated
+			keys_view.clear()
+
+		req = ajax.ajax()
+		req.bind('complete', bulk_ready)
+		req.open('POST', '/api/keys', True)
+		req.set_header('Content-Type', 'application/json')
+		req.send(json.dumps(args))
+
+	window.keys_bulk = keys_bulk
+
 	# page content
 
 	Rfctl.add_page_header(exclude_menu=('keys',))
 
 	main = html.MAIN(role='main')
 	keys_table = html.TABLE(id='keys_table')
-	keys_table <= html.CAPTION('Keys list', Class='keys_table')
+	keys_table <= html.CAPTION('Keys list', id='keys_table_caption', Class='keys_table')
 	keys_table <= html.THEAD(
 		html.TR(
-			html.TD(
+			html.TD(Class='keys_table_head keys_table_control')
+			+ html.TD(
 				html.INPUT(type='button', Class='keys_table_sort', value='◣', onclick="window.keys_sort_name(\'down\')")
 				+ html.INPUT(type='button', Class='keys_table_sort', value='◥', onclick="window.keys_sort_name(\'up\')")
 				+ html.SPAN('&nbsp;')
@@ -242,8 +495,19 @@ def build_page_keys():
 			, Class='keys_table_head')
 		, Class='keys_table')
 	keys_table <= html.TBODY(id='keys_table_body')
-	main <= keys_table
+	keys_table_view = html.DIV(keys_table, id='keys_table_view')
+	keys_table_view.bind('scroll', keys_view.request_render)
+	main <= keys_table_view
+	main <= html.DIV(
+		html.SPAN('Selected: 0', id='keys_bulk_count')
+		+ html.INPUT(type='button', value='Enable', onclick="window.keys_bulk(\'enable\')")
+		+ html.INPUT(type='button', value='Disable', onclick="window.keys_bulk(\'disable\')")
+		+ html.INPUT(type='text', id='keys_bulk_event', maxlength='100', placeholder='event')
+		+ html.INPUT(type='button', value='Set event', onclick="window.keys_bulk(\'event\')")
+		+ html.INPUT(type='button', value='🗑 Delete', onclick="window.keys_bulk(\'delete\')"),
+		id='keys_bulk')
 	doc <= main
+	window.bind('resize', keys_view.request_render)
 	keys_sort_name('down')  # populate keys table # send Ajax request for list keys
 
 
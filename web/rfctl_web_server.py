@@ -1,16 +1,33 @@
-from bottle import route, run, static_file as bottle_static_file, request, response
+from bottle import route, hook, install, run, static_file as bottle_static_file, request, response
 from bottle import __version__ as bottle_version
 from datetime import datetime
-from os.path import join as path_join, abspath, dirname, basename, splitext
+from functools import wraps
+from io import BytesIO
+from sys import stderr
+from time import perf_counter
+from os.path import join as path_join, abspath, dirname, basename, splitext, isfile
 from os import remove as os_remove
 import psutil
 import platform
 from subprocess import getstatusoutput
 from glob import glob
-from typing import Tuple, Optional, Iterable
+from typing import Dict, Tuple, Optional, Iterable
 from re import compile as re_compile
+from urllib.parse import parse_qsl, unquote, urlencode
 from uuid import uuid4
+from wsgiref.simple_server import WSGIServer
+from concurrent.futures import ThreadPoolExecutor
+import argparse
 from settings import RfctlSettings
+from event_log import EventLog
+from keys_catalogue import KeysCatalogue
+from static_assets import StaticAssets
+from response_cache import ResponseCache
+from driver_probe import DriverProbe
+from metrics import MetricsRegistry
+from profiling import Profiler
+from long_poll import LongPoll
+from json_response import JsonResponse
 
 
 page_title = 'Rfctl web server'
@@ -18,6 +35,9 @@ page_title = 'Rfctl web server'
 python_files_path = abspath(path_join(dirname(abspath(__file__)), '..'))
 bash_files_path = abspath(path_join(dirname(abspath(__file__)), '..'))
 keys_files_path = abspath(path_join(dirname(abspath(__file__)), '../keys'))
+events_log_path = abspath(path_join(dirname(abspath(__file__)), '../rfctl_events'))  # detection events log
+keys_catalogue_path = abspath(path_join(dirname(abspath(__file__)), '../rfctl_keys.db'))
+keys_catalogue: Optional[KeysCatalogue] = None  # optional keys catalogue; .key files are scanned if None
 static_files_path = dirname(abspath(__file__))
 static_files = (
 	'favicon.ico',
@@ -26,18 +46,90 @@ static_files = (
 	'plotly.min.js',
 	'rfctl_web_client.py',
 	'rfctl_web_client.css',
+	'rfctl_web_bundle.js',
 )
+client_bundle = False  # page loads one script: brython.js, standard library modules & client (see build_client.py)
+static_cache_path = path_join(static_files_path, 'static_cache')  # precompressed static files
+static_assets: Optional[StaticAssets] = None  # prepared at server start
 favicon_path = ''
-
-
-def escape_json(buff: str) -> str:
-	return buff.replace('\n', '\\n').replace('"', '\\"')
+response_cache = ResponseCache()  # responses cache of host info API & pages
+PAGE_TTL, HOST_INFO_TTL = 3600, 600  # responses cache time to live, seconds
+KEYS_LIST_MAX_LEN = 1000  # maximum keys count of keys list page
+KEYS_HISTORY_MAX_LEN = 1000  # maximum detected keys count of keys history
+BATCH_MAX_LEN = 20  # maximum sub-requests count of batch API request
+KEYS_BULK_MAX_LEN = 10000  # maximum keys count of bulk keys operation
+driver_probe = DriverProbe()  # rfctl driver status; refreshed by background timer
+LONG_POLL_WAIT = 30  # seconds; maximum wait of long-poll API requests ("?since=<version>&wait=30")
+status_poll = LongPoll(lambda: driver_probe.version)  # waiting requests are enabled by production mode
+keys_history_poll = LongPoll(lambda: get_keys_history_version())
+metrics = MetricsRegistry()  # web server metrics; /metrics merges also metrics text files of processes
+metrics_textfiles_path = MetricsRegistry.TEXTFILES_PATH
+request_time = metrics.histogram('rfctl_web_request_seconds', 'Web requests processing time')
+page_load_time = metrics.histogram(
+	'rfctl_web_page_load_seconds', 'Page load time measured by browser: navigation start till page is built',
+	(.1, .25, .5, 1., 2., 3., 5., 10., 20.))
+keys_count = metrics.gauge('rfctl_keys', 'Keys (.key files)')
+driver_loaded = metrics.gauge('rfctl_driver_loaded', 'Kernel module is loaded')
+driver_opened = metrics.gauge('rfctl_driver_opened', 'Device open count')
+driver_samples_rate = metrics.gauge('rfctl_driver_samples_per_second', 'Samples per second received by driver')
+driver_interrupts = metrics.gauge('rfctl_driver_interrupts', 'Driver interrupts (samples) count')
+profiler: Optional[Profiler] = None  # for --profile command-line option
+
+
+def profiler_plugin(callback):
+	'bottle plugin: route handlers are profiled by cProfile (stats of threads are merged) & stage timer of handler'
+	stage_callback = profiler.wrap(callback.__name__, callback)
+
+	@wraps(callback)
+	def profiler_wrapper(*args, **kwargs):
+		return profiler.call(stage_callback, *args, **kwargs)
+
+	return profiler_wrapper
+
+
+class ThreadPoolWSGIServer(WSGIServer):
+	'''wsgiref server with requests processed by bounded threads pool.
+	Used by production mode: slow request does not block other clients.'''
+
+	workers = 8  # threads pool size
+
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		self.pool = ThreadPoolExecutor(self.workers, thread_name_prefix='http')
+
+	def process_request(self, request, client_address):
+		self.pool.submit(self.process_request_thread, request, client_address)
+
+	def process_request_thread(self, request, client_address):
+		try:
+			self.finish_request(request, client_address)
+		except Exception:
+			self.handle_error(request, client_address)
+		finally:
+			self.shutdown_request(request)
+
+	def server_close(self):
+		super().server_close()
+		self.pool.shutdown(wait=False)
+
+
+@hook('before_request')
+def start_request_timer():
+	# batch sub-requests are timed as part of batch request (one sample per HTTP request)
+	if not request.environ.get('rfctl.sub_request'):
+		request.environ['rfctl.start_time'] = perf_counter()
+
+
+@hook('after_request')
+def stop_request_timer():
+	if (start_time := request.environ.get('rfctl.start_time')) is not None:
+		request_time.observe(perf_counter() - start_time)
 
 
 def get_keys(filter_name: Optional[str]=None, filter_dt: Optional[str]=None) -> Iterable[Tuple[str, str, str]]:
 	# process .key files at keys path. Returns tuple: key name, key date time, key description
 	ret = []
-	fpath = path_join(keys_files_path, ('*' + filter_name + '*' if filter_name else '*') + '.key')
+	fpath = path_join(keys_files_path, (filter_name + '*' if filter_name else '*') + '.key')
 	for fpath in sorted(glob(fpath)):
 		key_dt, key_desc = '', ''
 		with open(fpath, 'r') as f:
@@ -47,11 +139,33 @@ def get_keys(filter_name: Optional[str]=None, filter_dt: Optional[str]=None) ->
 				elif line.startswith('#!desc='):
 					key_desc = line[7:].strip()
 				elif not line.startswith('#'):
-					ret.append(tuple((splitext(basename(fpath))[0], key_dt, key_desc)))
+					if not filter_dt or key_dt.startswith(filter_dt):
+						ret.append(tuple((splitext(basename(fpath))[0], key_dt, key_desc)))
 					break
 	return ret
 
 
+def get_keys_list(
+		filter_name: Optional[str], filter_dt: Optional[str], sort_name: Optional[str], sort_dt: Optional[str],
+		list_start: int, list_len: int) -> Tuple[Iterable[KeysCatalogue.Key], int]:
+	# gets sorted keys page with settings & total count of filtered keys; catalogue keys are read by iteration
+	if keys_catalogue:
+		return (
+			keys_catalogue.iter_query(filter_name, sort_name, sort_dt, list_start, list_len, filter_dt),
+			keys_catalogue.count(filter_name, filter_dt))
+	keys = get_keys(filter_name, filter_dt)
+	total = len(keys)
+	keys = sorted(
+		keys,
+		reverse=sort_dt == 'up' if sort_dt else sort_name == 'up',
+		key=lambda x: x[1] if sort_dt else x[0])[list_start:list_start + list_len]
+	return [
+		KeysCatalogue.Key(*x, ks.event, ks.enabled) if (ks := RfctlSettings.key_settings.get(x[0]))
+		else KeysCatalogue.Key(*x, '', False)
+		for x in keys
+	], total
+
+
 key_file_re = re_compile('^[0-9a-f]{32}$')  # filter for .key file name validation
 
 
@@ -70,7 +184,20 @@ def is_key_description_correct(desc: str) -> bool:
 @route('/static/<filename>')
 def static_file(filename: str) -> Optional[str]:
 	if filename in static_files:
-		return bottle_static_file(filename, root=static_files_path)
+		if not static_assets or not (asset := static_assets.get_file(filename, request.get_header('Accept-Encoding', ''))):
+			return bottle_static_file(filename, root=static_files_path)
+		file_name, root, encoding = asset
+		file_hash = static_assets.get_hash(filename)
+		headers = {
+			'Vary': 'Accept-Encoding',
+			# hashed URL content is never changed
+			'Cache-Control': 'public, max-age=31536000, immutable' if request.query.get('v') == file_hash else 'no-cache',
+		}
+		if encoding:
+			headers['Content-Encoding'] = encoding
+		return bottle_static_file(
+			file_name, root=root, mimetype=static_assets.assets[filename].mimetype or True,
+			etag=f'{file_hash}-{encoding or "identity"}', headers=headers)
 
 
 @route('/favicon.ico')
@@ -78,47 +205,54 @@ def favicon():
     return ("/static/favicon.ico")
 
 
-def set_keys_settings(key_uuid: str, event: Optional[str] = None, enabled: Optional[bool] = None):
-
-	def set_settings(ks: RfctlSettings.KeyRow):
-		if event is not None:
-			ks.event = event
-		if enabled is not None:
-			ks.enabled = enabled
-
-	if (ks := RfctlSettings.key_settings.get(key_uuid)):
-		set_settings(ks)
-	else:
-		# create settings for a new key
-		ks = RfctlSettings.KeyRow
-		set_settings(ks)
-		RfctlSettings.key_settings[key_uuid] = ks
-	RfctlSettings.save()
+def set_keys_settings(key_uuid: str, event: Optional[str] = None, enabled: Optional[str] = None):
+	enabled = None if enabled is None else enabled.lower() in ('1', 'true', 'on')
+	RfctlSettings.set(key_uuid, event, enabled)
+	if keys_catalogue:
+		keys_catalogue.set_settings((key_uuid,), event, enabled)
 
 
 def del_keys_settings(key_uuid: str):
-	try:
-		del RfctlSettings.key_settings[key_uuid]
-	except KeyError:
-		return
-	RfctlSettings.save()
+	RfctlSettings.delete(key_uuid)
 
 
 # pages handlers
 
 
+def get_static_url(filename: str) -> str:
+	return static_assets.get_url(filename) if static_assets else '/static/' + filename
+
+
+def is_client_bundle_valid() -> bool:
+	# client bundle is built from current client module
+	if not static_assets or not static_assets.get_hash('rfctl_web_bundle.js'):
+		return False
+	with open(path_join(static_files_path, 'rfctl_web_bundle.js'), 'r') as f:
+		return f.readline().split()[-1] == static_assets.get_hash('rfctl_web_client.py')
+
+
 def get_regular_page(title_suffix='', page_build_fun='', load_plotly=False, body: Optional[str] = None):
 	# Gets regular page with ARIA roles: header, main e.t.c.
+	if client_bundle:
+		scripts = '<script src="{}"></script>'.format(get_static_url('rfctl_web_bundle.js'))
+	else:
+		scripts = '''<script src="{}"></script>
+		<script src="{}"></script>
+		<script src="{}" type="text/python"></script>'''.format(
+			get_static_url('brython.js'),
+			get_static_url('brython_stdlib.js'),
+			get_static_url('rfctl_web_client.py'),
+		)
 	buff = '''<html><head>
 		<title>{}</title>
-		<link rel="stylesheet" href="/static/rfctl_web_client.css">
-		<script src="/static/brython.js"></script>
-		<script src="/static/brython_stdlib.js"></script>
-		<script src="/static/rfctl_web_client.py" type="text/python"></script>
+		<link rel="stylesheet" href="{}">
+		{}
 		{}
 		</head><body onload="brython()">'''.format(
 		' - '.join((page_title, title_suffix)),
-		'<script src="/static/plotly.min.js"></script>' if load_plotly else ''
+		get_static_url('rfctl_web_client.css'),
+		scripts,
+		'<script src="{}"></script>'.format(get_static_url('plotly.min.js')) if load_plotly else ''
 	)
 	buff += '<body>'
 	buff += '<header role="banner">Rfctl<span id="header_menu" class="header-menu"/></header>'
@@ -126,29 +260,34 @@ def get_regular_page(title_suffix='', page_build_fun='', load_plotly=False, body
 	if body:
 		buff += body
 	buff += '''<script type="text/python">
-	from browser import window
+	{}from browser import window
 	window.Rfctl.{}()
-	</script>'''.format(page_build_fun)
+	window.Rfctl.page_loaded()
+	</script>'''.format('import rfctl_web_client\n\t' if client_bundle else '', page_build_fun)
 	buff += '</main></body></html>'
 	return buff
 
 
 @route('/')
+@response_cache(ttl=PAGE_TTL)
 def page_main():
 	return get_regular_page('', 'build_page_main')
 
 
 @route('/keys')
+@response_cache(ttl=PAGE_TTL)
 def page_keys():
 	return get_regular_page('Keys', 'build_page_keys')
 
 
 @route('/add_key')
+@response_cache(ttl=PAGE_TTL)
 def page_add_key():
 	return get_regular_page('Add key', 'build_page_add_key')
 
 
 @route('/about')
+@response_cache(ttl=PAGE_TTL)
 def page_about():
 	buff = ''
 	buff += '<table id="page_about"><tr><td class="about-section" colspan="2">Host</td></tr>'
@@ -173,35 +312,105 @@ def page_about():
 
 
 @route('/api/uname')
-def api_uname() -> str:
-	buff = platform.uname()
-	return '{{"system":"{},"node":"{}","release":"{}","version":"{}","machine":"{}","processor":"{}"}}'.format(
-		buff.system, buff.node, buff.release, buff.version, buff.machine, buff.processor
-	)
+@response_cache(ttl=HOST_INFO_TTL)
+def api_uname() -> bytes:
+	response.content_type = 'application/json'
+	return JsonResponse.dumps(platform.uname()._asdict())
 
 
 @route('/api/start_time')
+@response_cache(ttl=HOST_INFO_TTL)
 def api_start_time():
 	response.content_type = 'application/json'
-	return '{{"start_time":{}}}'.format(datetime.fromtimestamp(psutil.boot_time()))
+	return JsonResponse.dumps({'start_time': str(datetime.fromtimestamp(psutil.boot_time()))})
 
 
 @route('/api/status')
 def api_status():
+	'''Driver status; with "since" (status version, X-Version header) & "wait" (seconds) it is answered
+	when status is changed or wait time is over (long-poll)'''
+	since = request.params.get('since', type=int)
+	wait = min(request.params.get('wait', default=0, type=float), LONG_POLL_WAIT)
+	version = status_poll.wait(since, wait)
+	if version is not None:
+		response.set_header('X-Version', str(version))
 	response.content_type = 'application/json'
-	exitcode, output = getstatusoutput(path_join(bash_files_path, 'status.sh'))
-	return '{{"code":{},"output":"{}"}}'.format(str(exitcode), str(output))
+	status = driver_probe.status
+	if status.loaded:
+		output = 'device {}, {:.0f} samples/s{}'.format(
+			'open' if status.opened else 'closed',
+			status.samples_per_second,
+			', last sample {:.0f} s ago'.format(status.last_sample_age) if status.last_sample_age is not None else ''
+		)
+	else:
+		output = 'kernel module is not loaded'
+	body = JsonResponse.dumps({
+		'code': 0 if status.loaded else 1,
+		'output': output,
+		'loaded': status.loaded,
+		'opened': status.opened,
+		'samples_per_second': round(status.samples_per_second, 1),
+		'last_sample_age': None if status.last_sample_age is None else round(status.last_sample_age, 1),
+	})
+	if version is None and since is not None and wait:
+		# long-poll is refused (waiters limit): answer is not 304, so client falls back to period refresh
+		return body
+	return ResponseCache.check_etag(body)
+
+
+@route('/metrics')
+def metrics_page():
+	'Metrics of web server & processes (text files) in Prometheus text format'
+	status = driver_probe.status
+	driver_loaded.set(int(status.loaded))
+	driver_opened.set(status.opened)
+	driver_samples_rate.set(status.samples_per_second)
+	driver_interrupts.set(status.interrupts or 0)
+	keys_count.set(keys_catalogue.count() if keys_catalogue else len(glob(path_join(keys_files_path, '*.key'))))
+	response.content_type = 'text/plain; version=0.0.4'
+	return metrics.render() + MetricsRegistry.read_textfiles(metrics_textfiles_path)
+
+
+@route('/api/page_load')
+def api_page_load():
+	'Page load time (ms) measured by browser'
+	if (ms := request.params.get('ms', type=float)) is not None and 0 <= ms < 600_000:
+		page_load_time.observe(ms / 1000)
+	response.status = 204
+	return ''
+
+
+def get_keys_history_version() -> float:
+	'returns time of last detected key: keys history version'
+	events = EventLog(events_log_path).read_last(1)
+	return events[0].timestamp if events else 0.
 
 
 @route('/api/keys_history')
 def api_keys_history():
-	'List keys'
-	list_start, list_len = request.params.get('s', default=0, type=int), request.params.get('l', default=200, type=int)
+	'''List detected keys since time (seconds since the epoch) or last detected keys.
+	With "wait" (seconds) "since" is keys history version (X-Version header: time of last detected key): request is
+	answered when keys are detected after version or wait time is over (long-poll); list has last keys after version.'''
+	since, list_len = request.params.get('since', type=float), request.params.get('l', default=200, type=int)
+	list_len = min(max(list_len, 0), KEYS_HISTORY_MAX_LEN)
+	wait = min(request.params.get('wait', default=0, type=float), LONG_POLL_WAIT)
 	response.content_type = 'application/json'
-	buff = '[{}]'.format(
-		','.join('{{"key":"{}"}}'.format(x) for x in get_keys()[list_start:list_start + list_len])
-	)
-	return buff
+	event_log = EventLog(events_log_path)
+	if wait and since is not None:
+		version = keys_history_poll.wait(since, wait)
+		events = [x for x in event_log.read_last(list_len) if x.timestamp > since]
+	else:
+		version = keys_history_poll.wait(None, None)
+		events = event_log.read_last(list_len) if since is None else event_log.read(since, list_len)
+	if version is not None:
+		# keys detected after version check are listed
+		response.set_header('X-Version', repr(max(version, events[-1].timestamp) if events else version))
+	body = JsonResponse.dumps(
+		[{'key': x.key, 'time': x.timestamp, 'score': round(x.score, 3), 'receiver': x.receiver} for x in events])
+	if version is None and wait and since is not None:
+		# long-poll is refused (waiters limit): answer is not 304, so client falls back to period refresh
+		return body
+	return ResponseCache.check_etag(body)
 
 
 @route('/api/keys')
@@ -223,11 +432,14 @@ def api_keys():
 			print(cmd)
 			exitcode, output = getstatusoutput(cmd)
 			if exitcode == 0:
+				if keys_catalogue:
+					keys_catalogue.add_file(path_join(keys_files_path, add_key_name))
 				add_key_event, add_key_enabled = request.params.get('event'), request.params.get('enabled')
 				set_keys_settings(add_key_name[:-4], add_key_event, add_key_enabled)
+				RfctlSettings.notify_reload(keys_files_path)
 		else:
 			exitcode, output = '1', 'Key description is incorrect'
-		buff = '{{"code":{},"output":"{}"}}'.format(str(exitcode), escape_json(str(output)))
+		buff = JsonResponse.dumps({'code': int(exitcode), 'output': str(output)})
 	elif delete_key_name:
 		# delete key
 		if is_key_file_name_correct(delete_key_name):
@@ -236,50 +448,225 @@ def api_keys():
 				print('rm "{}"'.format(fpath))
 				os_remove(fpath)
 				exitcode, output = 0, ''
+				if keys_catalogue:
+					keys_catalogue.delete((delete_key_name,))
 				del_keys_settings(delete_key_name)
+				RfctlSettings.notify_reload(keys_files_path)
 			except Exception as e:
 				exitcode, output = 2, str(e)
 		else:
 			exitcode, output = 1, 'Incorrect key name: ' + delete_key_name
-		buff = '{{"code":{},"output":"{}"}}'.format(str(exitcode), escape_json(str(output)))
+		buff = JsonResponse.dumps({'code': int(exitcode), 'output': str(output)})
 	else:
 		# get keys list
 		list_start, list_len = request.params.get('s', default=0, type=int), request.params.get('l', default=50, type=int)
 		sort_name, sort_dt = request.params.get('sort_name', default='down'), request.params.get('sort_dt')
 		filter_name, filter_dt = request.params.get('filter_name'), request.params.get('filter_dt')
-		keys = sorted(
-			get_keys(filter_name, filter_dt)[list_start:list_start + list_len],
-			reverse=sort_dt == 'up' if sort_dt else sort_name == 'up',
-			key=lambda x: x[1] if sort_dt else x[0])
-		buff = '[{}]'.format(
-			','.join('{{"key":"{}","dt":"{}","desc":"{}","event":"{}","enabled":"{}"}}'.format(
-				x[0], x[1], x[2],
-				RfctlSettings.key_settings[x[0]].event if x[0] in RfctlSettings.key_settings else '',
-				RfctlSettings.key_settings[x[0]].enabled if x[0] in RfctlSettings.key_settings else ''
-				) for x in keys)
-		)
+		keys, total = get_keys_list(
+			filter_name, filter_dt, sort_name, sort_dt, max(list_start, 0), min(max(list_len, 0), KEYS_LIST_MAX_LEN))
+		# keys list is page of keys: client gets all keys page by page
+		response.set_header('X-Total-Count', str(total))
+		# keys are encoded while response is sent
+		buff = JsonResponse.iter_list(
+			{'key': x.name, 'dt': x.dt, 'desc': x.desc, 'event': x.event, 'enabled': '1' if x.enabled else ''} for x in keys)
 	return buff
 
 
+@route('/api/keys', method='POST')
+def api_keys_bulk():
+	'''Keys bulk operation: delete or set settings (event, enabled) of keys list.
+	Request is JSON: {"op": "delete", "keys": [...]} or {"op": "set", "keys": [...], "event": "...", "enabled": true};
+	settings are changed by one journal write, keys catalogue by one transaction & detectors are notified once.'''
+	data = request.json  # invalid JSON is 400 Bad Request
+	response.content_type = 'application/json'
+	keys = data.get('keys') if isinstance(data, dict) else None
+	is_valid = isinstance(keys, list) and data.get('op') in ('delete', 'set') and len(keys) <= KEYS_BULK_MAX_LEN
+	if not is_valid or not all(isinstance(x, str) for x in keys):
+		response.status = 400
+		return JsonResponse.dumps(
+			{'code': 1, 'output': f'Bulk operation is "delete" or "set" of at most {KEYS_BULK_MAX_LEN} keys'})
+	if (incorrect := [x for x in keys if not is_key_file_name_correct(x)]):
+		return JsonResponse.dumps({'code': 1, 'output': 'Incorrect key names: ' + ', '.join(incorrect[:10]), 'count': 0})
+	errors = []
+	if data['op'] == 'delete':
+		deleted = []
+		for x in keys:
+			try:
+				os_remove(path_join(keys_files_path, x + '.key'))
+				deleted.append(x)
+			except OSError as e:
+				errors.append(str(e))
+		print(f'rm {len(deleted)} keys of "{keys_files_path}"')
+		if keys_catalogue:
+			keys_catalogue.delete(deleted)
+		RfctlSettings.delete_many(deleted)
+		count = len(deleted)
+	else:
+		event = data.get('event')
+		enabled = data.get('enabled')
+		if not (event is None or isinstance(event, str)) or not (enabled is None or isinstance(enabled, bool)):
+			response.status = 400
+			return JsonResponse.dumps({'code': 1, 'output': 'Event is string, enabled is boolean'})
+		# settings of existing keys only: no orphan settings of missing key files
+		existing = {x for x in keys if isfile(path_join(keys_files_path, x + '.key'))}
+		if len(existing) < len(set(keys)):
+			errors.append('Missing keys: ' + ', '.join([x for x in keys if x not in existing][:10]))
+			keys = [x for x in keys if x in existing]
+		if keys:
+			RfctlSettings.set_many(keys, event, enabled)
+			if keys_catalogue:
+				keys_catalogue.set_settings(keys, event, enabled)
+		count = len(keys)
+	if count:
+		RfctlSettings.notify_reload(keys_files_path)
+	return JsonResponse.dumps({'code': 2 if errors else 0, 'output': '\n'.join(errors[:10]), 'count': count})
+
+
+def call_sub_request(environ: dict, url: str, headers: Dict[str, str]) -> Tuple[int, Dict[str, str], bytes]:
+	'''returns status, headers & body of GET sub-request of request (environ) dispatched by application:
+	routes, hooks & plugins are the same as of separate request'''
+	path, _, query = url.partition('?')
+	sub_environ = {
+		k: v for k, v in environ.items()
+		if not k.startswith(('HTTP_IF_', 'CONTENT_', 'bottle.', 'route.', 'rfctl.'))  # request headers, body & cache
+	}
+	sub_environ.update({
+		'REQUEST_METHOD': 'GET',
+		'PATH_INFO': unquote(path).encode().decode('latin1'),  # WSGI path is latin1 string
+		# long-poll wait holds batch: sub-requests are answered at once
+		'QUERY_STRING': urlencode([(k, v) for k, v in parse_qsl(query, keep_blank_values=True) if k != 'wait']),
+		'wsgi.input': BytesIO(),
+		'rfctl.sub_request': True,
+	})
+	if (etag := headers.get('If-None-Match')):
+		sub_environ['HTTP_IF_NONE_MATCH'] = str(etag)
+	ret = []
+
+	def start_response(status: str, headers: list, exc_info=None):
+		ret.extend((int(status.split()[0]), {k: v for k, v in headers if k != 'Content-Length'}))
+
+	body = environ['bottle.app'](sub_environ, start_response)
+	try:
+		ret.append(b''.join(body))
+	finally:
+		if hasattr(body, 'close'):
+			body.close()
+	return tuple(ret)
+
+
+@route('/api/batch', method='POST')
+def api_batch():
+	'''Batch of API GET requests in one HTTP round trip (page bootstrap, coalesced client calls).
+	Request is JSON list of sub-requests: {"url": "/api/status", "headers": {"If-None-Match": "<ETag>"}};
+	answer is JSON list of sub-responses: {"status": 200, "headers": {...}, "body": <JSON or text, null if empty>}.'''
+	calls = request.json  # invalid JSON is 400 Bad Request
+	response.content_type = 'application/json'
+	is_valid = isinstance(calls, list) and len(calls) <= BATCH_MAX_LEN and all(
+		isinstance(x, dict) and isinstance(x.get('url'), str) and x['url'].startswith('/api/')
+		and not x['url'].startswith('/api/batch') and isinstance(x.get('headers', {}), dict) for x in calls)
+	if not is_valid:
+		response.status = 400
+		return JsonResponse.dumps({'code': 1, 'output': f'Batch is list of at most {BATCH_MAX_LEN} API sub-requests'})
+	environ = request.environ
+	answers = []
+	try:
+		for x in calls:
+			status, headers, body = call_sub_request(environ, x['url'], x.get('headers', {}))
+			if not body:
+				body = b'null'
+			elif not headers.get('Content-Type', '').startswith('application/json'):
+				body = JsonResponse.dumps(body.decode(errors='replace'))
+			# JSON body is embedded as is
+			answers.append(b'{"status":%d,"headers":%s,"body":%s}' % (status, JsonResponse.dumps(headers), body))
+	finally:
+		# sub-requests are bound to thread local request & response
+		request.bind(environ)
+		response.bind()
+	response.content_type = 'application/json'
+	return b'[' + b','.join(answers) + b']'
+
+
+def parse_args():
+	parser = argparse.ArgumentParser(
+		description='Rfctl web server.',
+		epilog='Example:\npython3 rfctl_web_server.py --production --workers 8')
+	parser.add_argument('--host', default='0.0.0.0', help='Host address; default: %(default)s')
+	parser.add_argument('--port', default=8080, type=int, help='Port; default: %(default)s')
+	parser.add_argument(
+		'--production', action='store_true', help='Production mode: threads pool server, no debug & reloader')
+	parser.add_argument(
+		'--workers', default=ThreadPoolWSGIServer.workers, type=int,
+		help='Production mode server workers count; default: %(default)s')
+	parser.add_argument(
+		'--server', default='threaded',
+		help='Production mode server: threaded (build-in threads pool) or bottle server adapter name, '
+		'for example waitress or cheroot; default: %(default)s')
+	parser.add_argument(
+		'--https', action='store_true', help='Use HTTPS (cheroot server); certificates path: ../sertificates')
+	parser.add_argument('--no-catalogue', action='store_true', help='Scan .key files instead of keys catalogue')
+	parser.add_argument(
+		'--profile', metavar='MODES', nargs='?', const=Profiler.DEFAULT_MODES, type=Profiler.parse_modes,
+		help=f'Profile route handlers, modes: comma separated {", ".join(Profiler.MODES)}; '
+		f'default: {Profiler.DEFAULT_MODES}; stages are route handlers; '
+		f'reports are written at server stop to "{Profiler.get_default_path("rfctl_web_server")}.*"; '
+		'debug mode runs without reloader')
+	return parser.parse_args()
+
+
 if __name__ == "__main__":
+	args = parse_args()
 	# load settings
 	RfctlSettings.load()
+	static_assets = StaticAssets(static_files_path, static_cache_path, static_files)
+	if (client_bundle := is_client_bundle_valid()):
+		print('Client bundle is used', file=stderr)
+	elif static_assets.get_hash('rfctl_web_bundle.js'):
+		print('Client bundle is outdated (rebuild by build_client.py); client is compiled by browser', file=stderr)
+	driver_probe.start()
+	if not args.no_catalogue:
+		keys_catalogue = KeysCatalogue(keys_catalogue_path, keys_files_path)
+		keys_catalogue.sync_settings(RfctlSettings.key_settings)
 	# start server
-	use_https, debug_server = False, True
 	run_args = {
-		'host': '0.0.0.0',
-		'port': 8080,
+		'host': args.host,
+		'port': args.port,
 	}
-	if debug_server:
+	if args.production:
+		if args.server == 'threaded':
+			ThreadPoolWSGIServer.workers = args.workers
+			run_args.update({
+				'server': 'wsgiref',
+				'server_class': ThreadPoolWSGIServer,
+				'quiet': True,
+			})
+		else:
+			run_args['server'] = args.server
+			if args.server == 'waitress':
+				run_args['threads'] = args.workers
+			elif args.server == 'cheroot':
+				run_args['numthreads'] = args.workers
+	else:
 		run_args.update({
 			'debug': True,
-			'reloader': True,
+			'reloader': not args.profile,  # reloader runs server in child process
 		})
-	if use_https:
+	if args.https:
 		from bottle import CherootServer
-		run_args = {
+		run_args.update({
 			'keyfile': '../sertificates/key.pem',
 			'certfile': '../sertificates/cert.pem',
 			'server': CherootServer,
-		}
+		})
+		for x in ('server_class', 'threads'):
+			run_args.pop(x, None)
+		if args.production:
+			run_args['numthreads'] = args.workers
+	if args.production and (args.server in ('threaded', 'waitress', 'cheroot') or args.https):
+		# waiting long-poll requests of API hold at most quarter of server threads
+		status_poll.max_waiters = keys_history_poll.max_waiters = max(args.workers // 4, 1)
+	if args.profile:
+		profiler = Profiler('rfctl_web_server', args.profile)
+		install(profiler_plugin)
 	run(**run_args)
+	if profiler:
+		print(profiler.stop(), file=stderr)
@@ -0,0 +1,93 @@
+import gzip
+from hashlib import sha256
+from mimetypes import guess_type
+from os import listdir, makedirs, remove as os_remove, replace as os_replace, stat as os_stat
+from os.path import join as path_join, exists
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+try:
+	import brotli
+except ImportError:
+	brotli = None  # brotli variants are not available
+
+
+class StaticAssets:
+	'''Static files with content hash & precompressed variants.
+	At startup content hashes are calculated & compressed variants (gzip; brotli if brotli
+	module is installed) are written to cache path once per file change. Page refers static
+	file by hashed URL, so file is cached by browser forever ("immutable").
+
+	Example:
+	assets = StaticAssets('.', 'static_cache', ('brython.js', 'rfctl_web_client.css'))
+	assets.get_url('brython.js')  # '/static/brython.js?v=4f5c...'
+	path, root, encoding = assets.get_file('brython.js', 'gzip, deflate, br')
+	'''
+
+	COMPRESSED_TYPES = ('.js', '.css', '.py', '.html', '.svg')
+	ENCODING_SUFFIXES = {'br': 'br', 'gzip': 'gz'}
+	URL_PREFIX = '/static/'
+
+	class Asset(NamedTuple):
+		hash: str
+		mimetype: Optional[str]
+		encodings: Tuple[str, ...]  # precompressed variants; file name is "<hash>.<file name>.<encoding suffix>"
+
+	def __init__(self, root: str, cache_path: str, file_names: Iterable[str]):
+		self.root, self.cache_path = root, cache_path
+		self.assets: Dict[str, StaticAssets.Asset] = {}
+		makedirs(cache_path, exist_ok=True)
+		for file_name in file_names:
+			if exists(fpath := path_join(root, file_name)):
+				self.assets[file_name] = self._prepare(file_name, fpath)
+		# remove variants of changed files
+		variants = {
+			self._get_variant_name(x.hash, k, e) for k, x in self.assets.items() for e in self.ENCODING_SUFFIXES
+		}
+		for x in listdir(cache_path):
+			if x not in variants:
+				os_remove(path_join(cache_path, x))
+
+	def _prepare(self, file_name: str, fpath: str) -> Asset:
+		with open(fpath, 'rb') as f:
+			data = f.read()
+		file_hash = sha256(data).hexdigest()[:16]
+		mimetype = 'text/python' if file_name.endswith('.py') else guess_type(file_name)[0]
+		encodings = []
+		if file_name.endswith(self.COMPRESSED_TYPES):
+			compressors = (('br', lambda x: brotli.compress(x, quality=11)),) if brotli else ()
+			compressors += (('gzip', lambda x: gzip.compress(x, compresslevel=9, mtime=0)),)
+			for encoding, compress in compressors:
+				variant_path = path_join(self.cache_path, self._get_variant_name(file_hash, file_name, encoding))
+				if not exists(variant_path):
+					with open(variant_path + '.tmp', 'wb') as f:
+						f.write(compress(data))
+					# rename after write, so partial variant never served
+					os_replace(variant_path + '.tmp', variant_path)
+				if os_stat(variant_path).st_size < len(data):
+					encodings.append(encoding)
+		return self.Asset(file_hash, mimetype, tuple(encodings))
+
+	def _get_variant_name(self, file_hash: str, file_name: str, encoding: str) -> str:
+		return f'{file_hash}.{file_name}.{self.ENCODING_SUFFIXES[encoding]}'
+
+	def get_url(self, file_name: str) -> str:
+		'returns hashed URL of static file'
+		if (asset := self.assets.get(file_name)):
+			return f'{self.URL_PREFIX}{file_name}?v={asset.hash}'
+		return self.URL_PREFIX + file_name
+
+	def get_hash(self, file_name: str) -> Optional[str]:
+		asset = self.assets.get(file_name)
+		return asset.hash if asset else None
+
+	def get_file(self, file_name: str, accept_encoding: str = '') -> Optional[Tuple[str, str, Optional[str]]]:
+		'returns file name & root path of best variant for Accept-Encoding & content encoding; None if no file'
+		if (asset := self.assets.get(file_name)) is None:
+			return None
+		accepted = {
+			x.split(';', 1)[0].strip() for x in accept_encoding.split(',')
+			if not x.replace(' ', '').endswith(';q=0')
+		}
+		for encoding in asset.encodings:
+			if encoding in accepted:
+				return self._get_variant_name(asset.hash, file_name, encoding), self.cache_path, encoding
+		return file_name, self.root, None